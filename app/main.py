@@ -1,4 +1,5 @@
-import json
+import asyncio
+import hashlib
 import logging
 import os
 import time
@@ -28,6 +29,7 @@ limiter = Limiter(key_func=get_remote_address, default_limits=["200/minute"])
 
 
 from graph.router import REG, build_compiled_router, debug_router_decision
+from services.serialization import JSONBytesResponse, dumps, dumps_str, ndjson_line, preencoded, sse_event
 
 # ---------- Startup Validation (Fail Fast) ----------
 REQUIRED_MODELS = ["local-chat", "local-code", "gpt-4.1-nano", "gpt-4o-mini", "gpt-4.1", "o3", "gpt-5.2-high", "gpt-5.2-codex-mini", "gpt-5.2-codex-high"]
@@ -74,11 +76,53 @@ async def lifespan(app: FastAPI):
                      pass
 
     logger.info(f"Config validated. {len(REG)} models registered.")
+
+    # Restore rolling metrics from the tail of the metrics log
+    from services.metrics import get_aggregator
+    get_aggregator()
+
+    # Tokenizers for the registry's models, loaded off the event loop
+    from services.token_counter import get_counter as get_token_counter
+    loaded = await asyncio.to_thread(get_token_counter().preload, [m["name"] for m in REG.values()])
+    logger.info(f"Tokenizers: {loaded}")
+
+    # Active health checks when local models are spread over several Ollama hosts
+    from services.ollama_pool import get_pool as get_ollama_pool
+    get_ollama_pool().start()
+
+    # Preload local models and keep the ones in demand resident
+    from services.model_warmup import get_manager as get_warmup_manager
+    if not is_test:
+        get_warmup_manager().start()
+
+    # Semantic classifier index (embeds the example set in the background)
+    from graph.router import get_semantic_index
+    if not is_test and get_semantic_index() is not None:
+        get_semantic_index().start()
+
+    # Deferred jobs run while the interactive GPU queue is idle
+    from services.job_queue import get_runner
+    if not is_test:
+        get_runner(_run_job).start()
+
     yield
+    if get_runner() is not None:
+        await get_runner().stop()
+    await get_warmup_manager().stop()
+    await get_ollama_pool().stop()
     # Shutdown (cleanup if needed)
+    from services.latency_sketch import get_sketches
+    from services.metrics import get_aggregator
+    from services.metrics_store import get_writer
+    get_sketches().flush()
+    get_aggregator().flush()
+    writer = get_writer()
+    if writer is not None:
+        writer.flush()
     logger.info("Shutting down AI Router.")
 
-app = FastAPI(title="AI Router (LangGraph/LangChain 1.0)", version="1.0.0", lifespan=lifespan)
+app = FastAPI(title="AI Router (LangGraph/LangChain 1.0)", version="1.0.0", lifespan=lifespan,
+              default_response_class=JSONBytesResponse)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -89,7 +133,7 @@ Instrumentator().instrument(app).expose(app)
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     return Response(
-        content=json.dumps({
+        content=dumps({
             "error": "Internal Server Error",
             "detail": str(exc),
             "type": type(exc).__name__
@@ -134,9 +178,28 @@ async def api_key_middleware(request: Request, call_next):
 
         if not client_key or client_key != expected_key:
             return Response(content="Unauthorized: Invalid or missing API Key", status_code=401)
+        
+        # Stable, non-reversible key id for per-key metrics / budgets
+        request.state.api_key_id = hashlib.sha256(client_key.encode()).hexdigest()[:12]
             
     return await call_next(request)
 
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    # Per-request trace: spans from graph nodes, judge, GPU queue and providers
+    from services import tracing
+    trace = tracing.start_trace(f"{request.method} {request.url.path}", request.headers.get("traceparent"))
+    if trace is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+        trace.attributes["http.status_code"] = response.status_code
+        if tracing.SERVER_TIMING:
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
+    finally:
+        tracing.finish_trace(trace)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=os.getenv("CORS_ALLOW_ORIGINS", "*").split(","),
@@ -156,7 +219,6 @@ class RouteRequest(BaseModel):
 
 router_app = build_compiled_router()
 
-import hashlib
 import pathlib
 
 import yaml
@@ -241,60 +303,62 @@ def debug_route_decision(req: DebugRouteRequest):
     messages = [{"role": "user", "content": req.prompt}]
     return debug_router_decision(messages)
 
+# --- /debug/semantic: semantic classifier index ---
+@app.get("/debug/semantic")
+def semantic_status():
+    from graph.router import get_semantic_index
+    index = get_semantic_index()
+    return index.status() if index else {"enabled": False}
+
+@app.post("/debug/semantic/reload")
+async def semantic_reload():
+    """Re-read config/semantic_examples.yaml and rebuild the centroid index."""
+    from graph.router import get_semantic_index
+    index = get_semantic_index()
+    if index is None:
+        raise HTTPException(status_code=404, detail="Semantic router disabled")
+    try:
+        return await asyncio.to_thread(index.reload)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Semantic index rebuild failed: {e}")
+
 # --- /debug/metrics: Cost & Usage Stats ---
 @app.get("/debug/metrics")
 def get_metrics():
     """
-    Returns aggregated metrics from the current session (or persisted logs).
+    Returns aggregated metrics kept in memory by services.metrics
+    (restored from the tail of logs/metrics.jsonl at startup).
     - Total Requests
     - Total Cost (Est)
     - Average Latency
-    - Model Distribution
+    - Model / Tier Distribution
+    - Rolling windows (5m / 1h / 24h)
+    - Global spend vs. Cost Guard window limits
     """
-    log_file = "logs/metrics.jsonl"
-    if not os.path.exists(log_file):
-        return {"error": "No metrics logs found yet."}
-    
-    stats = {
-        "total_requests": 0,
-        "total_cost_usd": 0.0,
-        "total_tokens": 0,
-        "latencies": [],
-        "models": {},
-        "tiers": {}
-    }
-    
+    from graph.cost_guard import get_spend_tracker
+    from services.latency_sketch import get_sketches
+    from services.metrics import get_aggregator
     try:
-        # Read last 1000 lines efficiently (or just all for now, assuming rotation)
-        with open(log_file, "r") as f:
-            for line in f:
-                if not line.strip(): continue
-                try:
-                    data = json.loads(line)
-                    stats["total_requests"] += 1
-                    stats["total_cost_usd"] += data.get("cost_est_usd", 0)
-                    stats["total_tokens"] += data.get("tokens_total", 0)
-                    stats["latencies"].append(data.get("latency_ms", 0))
-                    
-                    mid = data.get("model_id", "unknown")
-                    stats["models"][mid] = stats["models"].get(mid, 0) + 1
-                    
-                    tier = data.get("tier", "unknown")
-                    stats["tiers"][tier] = stats["tiers"].get(tier, 0) + 1
-                except:
-                    continue
-                    
-        # Averages
-        avg_lat = sum(stats["latencies"]) / len(stats["latencies"]) if stats["latencies"] else 0
-        stats["avg_latency_ms"] = int(avg_lat)
-        del stats["latencies"] # Keep payload clean
-        
-        stats["total_cost_usd"] = round(stats["total_cost_usd"], 6)
-        
+        stats = get_aggregator().snapshot()
+        latency = get_sketches().summary()
+        stats["latency_ms"] = {stage: dims["all"].get("all", {"count": 0}) for stage, dims in latency.items()}
+        stats["spend"] = get_spend_tracker().status()["global"]
         return stats
     except Exception as e:
         return {"error": str(e)}
 
+# --- /debug/latency: p50/p90/p99 per model/task/complexity/tier ---
+@app.get("/debug/latency")
+def get_latency(raw: bool = False):
+    """
+    Latency percentiles for routing overhead, GPU queue wait and provider time.
+    Merges sketches published by other workers (LATENCY_SKETCH_DIR) when configured.
+    With ?raw=true returns the serialized sketches so they can be merged elsewhere.
+    """
+    from services.latency_sketch import get_sketches
+    sketches = get_sketches().merged_with_peers()
+    return sketches.to_dict() if raw else sketches.summary()
+
 # --- /v1/models (compat OpenAI) ---
 @app.get("/v1/models")
 def list_models_openai():
@@ -389,14 +453,33 @@ async def health_check():
     q = await get_queue()
     metrics = await q.get_metrics()
     
+    from services.job_queue import get_runner as get_job_runner
+    from services.model_warmup import get_manager as get_warmup_manager
+    from services.ollama_pool import get_pool as get_ollama_pool
+    from services.session_store import get_store as get_session_store
+    
     return {
         "status": "ok",
         "service": "ai-router",
-        "gpu_queue": metrics
+        "gpu_queue": metrics,
+        "ollama": get_ollama_pool().status(),
+        "models": get_warmup_manager().stats(),
+        "jobs": get_job_runner(_run_job).status(),
+        "sessions": get_session_store().stats(),
     }
 
 
-async def _run_router_completion(messages: List[Dict], prefer_code: bool = False, **kwargs) -> Dict:
+def _api_key_id(request: Request) -> str:
+    """Key id set by api_key_middleware ("anonymous" when auth is disabled)."""
+    return getattr(request.state, "api_key_id", None) or "anonymous"
+
+def _conversation_id(request: Request) -> Optional[str]:
+    """Explicit conversation id for sticky routing (otherwise the router hashes the message prefix)."""
+    value = (request.headers.get("X-Conversation-Id") or "").strip()
+    return value[:128] or None
+
+async def _run_router_completion(messages: List[Dict], prefer_code: bool = False, api_key_id: str = "anonymous",
+                                 conversation_id: Optional[str] = None, **kwargs) -> Dict:
     """
     Shared utility to invoke the router graph.
     Returns the raw output dictionary from router_app.ainvoke().
@@ -406,6 +489,8 @@ async def _run_router_completion(messages: List[Dict], prefer_code: bool = False
             "messages": messages,
             "budget": "balanced",
             "prefer_code": prefer_code,
+            "api_key_id": api_key_id,
+            **({"conversation_id": conversation_id} if conversation_id else {}),
         })
         
         # Check for explicitly returned error objects (e.g. from upstream)
@@ -449,7 +534,9 @@ async def _chat_completions(request: Request, body: _ChatReq):
     
     out = await _run_router_completion(
         messages=[m.model_dump() for m in body.messages],
-        prefer_code=bool(prefer_code)
+        prefer_code=bool(prefer_code),
+        api_key_id=_api_key_id(request),
+        conversation_id=_conversation_id(request),
     )
 
     content = (
@@ -484,7 +571,7 @@ async def _chat_completions(request: Request, body: _ChatReq):
     
     # Return with observability headers
     return Response(
-        content=json.dumps(response_body),
+        content=dumps(response_body),
         media_type="application/json",
         headers={
             "X-AI-Router-Initial-Model": initial_model,
@@ -559,9 +646,82 @@ def _normalize_input_to_messages(input_data: Any) -> List[Dict[str, str]]:
     
     raise HTTPException(status_code=400, detail="Invalid input format: expected string or array")
 
-def _sse_event(event: str, data: dict) -> str:
-    """Format an SSE event."""
-    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+def _response_sse_frames(response_obj: Dict[str, Any]):
+    """Responses API event stream for a completed response (pre-encoded SSE frames)."""
+    output_item = response_obj["output"][0]
+    # The completion text is encoded once and embedded in all four frames that carry it
+    text = preencoded(output_item["content"][0]["text"])
+    stream_item = {**output_item, "content": [{"type": "output_text", "text": text}]}
+    stream_response = {**response_obj, "output": [stream_item]}
+    seq = 0
+    try:
+        # Event 1: response.created
+        yield sse_event("response.created", {
+            "response": {
+                "id": response_obj["id"],
+                "object": "response",
+                "created": response_obj["created"],
+                "status": "in_progress",
+                "model": response_obj["model"],
+                "output": []
+            }
+        }, seq)
+        seq += 1
+        
+        # Event 2: response.output_item.added (REQUIRED before delta)
+        yield sse_event("response.output_item.added", {
+            "output_index": 0,
+            "item": {
+                "id": output_item["id"],
+                "type": "message",
+                "role": "assistant",
+                "status": "in_progress",
+                "content": []
+            }
+        }, seq)
+        seq += 1
+        
+        # Event 3: response.content_part.added
+        yield sse_event("response.content_part.added", {
+            "item_id": output_item["id"],
+            "output_index": 0,
+            "content_index": 0,
+            "part": {"type": "output_text", "text": ""}
+        }, seq)
+        seq += 1
+        
+        # Event 4: response.output_text.delta (full text as single delta)
+        yield sse_event("response.output_text.delta", {
+            "item_id": output_item["id"],
+            "output_index": 0,
+            "content_index": 0,
+            "delta": text
+        }, seq)
+        seq += 1
+        
+        # Event 5: response.output_text.done
+        yield sse_event("response.output_text.done", {
+            "item_id": output_item["id"],
+            "output_index": 0,
+            "content_index": 0,
+            "text": text
+        }, seq)
+        seq += 1
+        
+        # Event 6: response.output_item.done
+        yield sse_event("response.output_item.done", {
+            "output_index": 0,
+            "item": stream_item
+        }, seq)
+        seq += 1
+        
+        # Event 7: response.completed
+        yield sse_event("response.completed", {"response": stream_response}, seq)
+    except Exception as e:
+        # Event: error
+        yield sse_event("error", {
+            "error": {"message": str(e), "type": "internal_error"}
+        })
 
 @app.post("/v1/responses")
 async def _responses_api(body: _ResponseReq, request: Request):
@@ -579,7 +739,9 @@ async def _responses_api(body: _ResponseReq, request: Request):
     # 3. Invoke Router
     out = await _run_router_completion(
         messages=messages,
-        prefer_code=bool(prefer_code)
+        prefer_code=bool(prefer_code),
+        api_key_id=_api_key_id(request),
+        conversation_id=_conversation_id(request),
     )
 
     # 4. Extract content
@@ -626,96 +788,8 @@ async def _responses_api(body: _ResponseReq, request: Request):
 
     # 8. Handle streaming or non-streaming response
     if stream_requested:
-        def generate_sse():
-            seq = 0
-            try:
-                # Event 1: response.created
-                yield _sse_event("response.created", {
-                    "type": "response.created",
-                    "sequence_number": seq,
-                    "response": {
-                        "id": response_id,
-                        "object": "response",
-                        "created": created,
-                        "status": "in_progress",
-                        "model": model_used,
-                        "output": []
-                    }
-                })
-                seq += 1
-                
-                # Event 2: response.output_item.added (REQUIRED before delta)
-                yield _sse_event("response.output_item.added", {
-                    "type": "response.output_item.added",
-                    "sequence_number": seq,
-                    "output_index": 0,
-                    "item": {
-                        "id": "item_0",
-                        "type": "message",
-                        "role": "assistant",
-                        "status": "in_progress",
-                        "content": []
-                    }
-                })
-                seq += 1
-                
-                # Event 3: response.content_part.added
-                yield _sse_event("response.content_part.added", {
-                    "type": "response.content_part.added",
-                    "sequence_number": seq,
-                    "item_id": "item_0",
-                    "output_index": 0,
-                    "content_index": 0,
-                    "part": {"type": "output_text", "text": ""}
-                })
-                seq += 1
-                
-                # Event 4: response.output_text.delta (full text as single delta)
-                yield _sse_event("response.output_text.delta", {
-                    "type": "response.output_text.delta",
-                    "sequence_number": seq,
-                    "item_id": "item_0",
-                    "output_index": 0,
-                    "content_index": 0,
-                    "delta": content
-                })
-                seq += 1
-                
-                # Event 5: response.output_text.done
-                yield _sse_event("response.output_text.done", {
-                    "type": "response.output_text.done",
-                    "sequence_number": seq,
-                    "item_id": "item_0",
-                    "output_index": 0,
-                    "content_index": 0,
-                    "text": content
-                })
-                seq += 1
-                
-                # Event 6: response.output_item.done
-                yield _sse_event("response.output_item.done", {
-                    "type": "response.output_item.done",
-                    "sequence_number": seq,
-                    "output_index": 0,
-                    "item": output_item
-                })
-                seq += 1
-                
-                # Event 7: response.completed
-                yield _sse_event("response.completed", {
-                    "type": "response.completed",
-                    "sequence_number": seq,
-                    "response": response_obj
-                })
-            except Exception as e:
-                # Event: error
-                yield _sse_event("error", {
-                    "type": "error",
-                    "error": {"message": str(e), "type": "internal_error"}
-                })
-        
         return StreamingResponse(
-            generate_sse(),
+            _response_sse_frames(response_obj),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -728,27 +802,151 @@ async def _responses_api(body: _ResponseReq, request: Request):
             }
         )
     else:
-        return response_obj
+        return JSONBytesResponse(response_obj)
 
-@app.post("/route")
-@limiter.limit("100/minute")
-async def route(request: Request, req: RouteRequest) -> Dict[str, Any]:
-    t0 = time.perf_counter()
-    state = {
+def _route_state(req: RouteRequest, api_key_id: str, t0: float) -> Dict[str, Any]:
+    """Router state for one /route request (also each /v1/batch item)."""
+    return {
         "messages": [m.model_dump() for m in req.messages],
         "latency_ms_max": req.latency_ms_max or 0,
         "budget": req.budget or "balanced",
         "prefer_code": bool(req.prefer_code),
         "critical": bool(req.critical),
+        "api_key_id": api_key_id,
         "_latency_start": t0,
     }
+
+@app.post("/route")
+@limiter.limit("100/minute")
+async def route(request: Request, req: RouteRequest) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    state = _route_state(req, _api_key_id(request), t0)
+    if _conversation_id(request):
+        state["conversation_id"] = _conversation_id(request)
     try:
         out = await router_app.ainvoke(state)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     out["usage"]["latency_ms_router"] = int((time.perf_counter() - t0) * 1000)
-    logger.info(json.dumps({"evt":"route_done","model":out["usage"]["resolved_model_id"],"lat_ms":out["usage"]["latency_ms_router"],"critical":state["critical"]}))
-    return out
+    logger.info(dumps_str({"evt":"route_done","model":out["usage"]["resolved_model_id"],"lat_ms":out["usage"]["latency_ms_router"],"critical":state["critical"]}))
+    return JSONBytesResponse(out)
+
+# --- /v1/batch: many /route requests in one call ---
+# Config from Env
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))  # Items in flight per batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+
+class BatchItem(RouteRequest):
+    id: Optional[str] = None  # Echoed back so clients can match results
+
+def _parse_batch(body: bytes) -> List[tuple]:
+    """Parse a JSONL body into (index, id, BatchItem | error) tuples; blank lines are skipped."""
+    items = []
+    for line in body.decode("utf-8", errors="replace").splitlines():
+        if not line.strip():
+            continue
+        index = len(items)
+        try:
+            item = BatchItem.model_validate_json(line)
+            items.append((index, item.id or str(index), item))
+        except Exception as e:
+            items.append((index, str(index), f"Invalid item: {e}"))
+    return items
+
+async def _run_batch_item(index: int, item_id: str, item: BatchItem, api_key_id: str) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        out = await router_app.ainvoke(_route_state(item, api_key_id, t0))
+    except Exception as e:
+        return {"id": item_id, "index": index, "status": 500, "error": str(e)}
+    if out.get("type") == "upstream_error":
+        return {"id": item_id, "index": index, "status": 502, "error": out.get("error", "Unknown upstream error")}
+    usage = out.get("usage") or {}
+    usage["latency_ms_router"] = int((time.perf_counter() - t0) * 1000)
+    return {"id": item_id, "index": index, "status": 200, "output": out.get("output", ""), "usage": usage}
+
+@app.post("/v1/batch")
+@limiter.limit("10/minute")
+async def batch(request: Request, concurrency: Optional[int] = None):
+    """
+    Route a JSONL body of /route requests (one per line, optional "id") through the graph.
+    Results stream back as NDJSON in completion order, with per-item usage.
+    At most `concurrency` (<= BATCH_MAX_CONCURRENCY) items are in flight; local items
+    still wait for the GPU queue like any other request.
+    """
+    items = _parse_batch(await request.body())
+    if not items:
+        raise HTTPException(status_code=400, detail="Empty batch: expected one JSON request per line")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(items)} items (max {BATCH_MAX_ITEMS})")
+
+    workers = max(1, min(concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    api_key_id = _api_key_id(request)
+    pending = [i for i in items if isinstance(i[2], BatchItem)]
+    invalid = [{"id": item_id, "index": index, "status": 400, "error": err} for index, item_id, err in items if isinstance(err, str)]
+    logger.info(f"Batch of {len(items)} items ({len(invalid)} invalid), concurrency={workers}")
+
+    async def generate():
+        for result in invalid:
+            yield ndjson_line(result)
+        todo = iter(pending)
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            for index, item_id, item in todo:
+                await results.put(await _run_batch_item(index, item_id, item, api_key_id))
+
+        tasks = [asyncio.create_task(worker()) for _ in range(min(workers, len(pending)))]
+        try:
+            for _ in range(len(pending)):
+                yield ndjson_line(await results.get())
+        finally:
+            # Client went away: stop routing the rest of the batch
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+# --- /v1/jobs: deferred requests that run when the GPU is idle ---
+async def _run_job(request: Dict[str, Any], api_key_id: str) -> Dict:
+    return await router_app.ainvoke(_route_state(RouteRequest.model_validate(request), api_key_id, time.perf_counter()))
+
+def _own_job(request: Request, job_id: str) -> Dict[str, Any]:
+    from services.job_queue import get_store
+    job = get_store().get(job_id)
+    # Other keys' jobs are reported as missing, not forbidden
+    if job is None or job["api_key_id"] != _api_key_id(request):
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: job[k] for k in ("id", "status", "error", "created_at", "started_at", "finished_at")}
+
+@app.post("/v1/jobs", status_code=202)
+async def submit_job(request: Request, req: RouteRequest):
+    """Queue a /route request to run when the interactive GPU queue is idle (see services.job_queue)."""
+    from services.job_queue import get_store
+    job_id = get_store().submit(req.model_dump(), _api_key_id(request))
+    return {"id": job_id, "status": "queued"}
+
+@app.get("/v1/jobs/{job_id}")
+def get_job(request: Request, job_id: str):
+    return _job_view(_own_job(request, job_id))
+
+@app.get("/v1/jobs/{job_id}/result")
+def get_job_result(request: Request, job_id: str):
+    job = _own_job(request, job_id)
+    if job["status"] in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}")
+    return {**_job_view(job), **(job["result"] or {})}
+
+@app.delete("/v1/jobs/{job_id}")
+def cancel_job(request: Request, job_id: str):
+    from services.job_queue import get_store
+    job = _own_job(request, job_id)
+    if not get_store().cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}")
+    return {"id": job_id, "status": "cancelled"}
 
 
 # --- HEAD compat ---
@@ -769,3 +967,4 @@ def _root():
 @app.head("/")
 def _root_head():
     return Response(status_code=302, headers={"Location": "/guide"})
+
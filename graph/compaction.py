@@ -0,0 +1,202 @@
+"""
+History compaction for long multi-turn conversations.
+
+IDE clients (Continue, Codex) resend the whole conversation every turn, so the
+local model's prefill grows with the session. When a request's history is over
+the target for the selected model, this stage keeps leading system messages
+and the most recent turns verbatim and replaces the older turns with a single
+summary message.
+
+Summaries are cached per conversation prefix (a hash chain over messages), so
+on the next turn only the messages added since the last summary are folded in.
+Summaries are extractive by default (no model call); with HISTORY_SUMMARY_MODE=llm
+the router passes a summarizer backed by a local model.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.token_counter import TOKENS_PER_MESSAGE, TOKENS_PER_REPLY, count_messages, count_text, estimate_tokens
+
+logger = logging.getLogger("ai-router.compaction")
+
+# Config from Env
+ENABLED = str(os.getenv("HISTORY_COMPACTION_ENABLED", "0")) == "1"
+KEEP_MESSAGES = int(os.getenv("HISTORY_KEEP_MESSAGES", "6"))
+TARGET_TOKENS = int(os.getenv("HISTORY_TARGET_TOKENS", "0"))  # 0 = derive from context window
+TARGET_RATIO = float(os.getenv("HISTORY_TARGET_RATIO", "0.5"))
+SUMMARY_MODE = os.getenv("HISTORY_SUMMARY_MODE", "extractive").lower()  # extractive | llm
+SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "512"))
+PROVIDERS = {p.strip() for p in os.getenv("HISTORY_COMPACTION_PROVIDERS", "ollama").split(",") if p.strip()}
+CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "256"))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+MIN_KEEP_MESSAGES = 1  # The latest message is always sent verbatim
+
+Summarizer = Callable[[Optional[str], List[Dict[str, str]], int], Awaitable[str]]
+
+
+@dataclass
+class CompactionStats:
+    tokens_before: int
+    tokens_after: int
+    summarized_messages: int = 0
+    summary_cache: str = "none"  # hit | partial | miss | none
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_before - self.tokens_after)
+
+
+def target_tokens(meta: Dict, window: Optional[int]) -> Optional[int]:
+    """Prompt-token target for a registry model (None = never compact)."""
+    if meta.get("history_target_tokens"):
+        return int(meta["history_target_tokens"])
+    if TARGET_TOKENS > 0:
+        return TARGET_TOKENS
+    if window:
+        return int(window * TARGET_RATIO)
+    return None
+
+
+def applies_to(meta: Dict) -> bool:
+    return ENABLED and meta.get("provider", "ollama") in PROVIDERS
+
+
+def min_prompt_tokens(messages: List[Dict[str, str]], summary_max_tokens: int = SUMMARY_MAX_TOKENS) -> int:
+    """
+    Estimated prompt size compact() can reach: leading system messages, the latest
+    message and a summary (len/4, so routing can check it before compaction runs).
+    """
+    n_sys = 0
+    while n_sys < len(messages) and messages[n_sys].get("role") == "system":
+        n_sys += 1
+    kept = messages if len(messages) - n_sys <= MIN_KEEP_MESSAGES else messages[:n_sys] + messages[-1:]
+    tokens = TOKENS_PER_REPLY + sum(estimate_tokens(str(m.get("content", ""))) + TOKENS_PER_MESSAGE for m in kept)
+    return tokens if kept is messages else tokens + summary_max_tokens
+
+
+def effective_prompt_tokens(prompt_tokens: int, floor: int, target: Optional[int]) -> int:
+    """Prompt size after compaction to `target`: never below the floor, never above the original."""
+    if not target or not floor:
+        return prompt_tokens
+    return min(prompt_tokens, max(floor, target))
+
+
+async def extractive_summary(previous: Optional[str], messages: List[Dict[str, str]], max_tokens: int) -> str:
+    """Cheap summary: first line of each older turn, newest kept when over budget."""
+    lines = [previous] if previous else []
+    for m in messages:
+        content = str(m.get("content", "")).strip()
+        first = content.splitlines()[0] if content else ""
+        if len(first) > 200:
+            first = first[:200] + "..."
+        lines.append(f"- {m.get('role', 'user')}: {first}")
+    while len(lines) > 1 and count_text("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def _chain_hashes(messages: List[Dict[str, str]]) -> List[str]:
+    """h[i] identifies messages[:i+1] (hash chain, so prefixes share entries)."""
+    out, h = [], b""
+    for m in messages:
+        data = f"{m.get('role')}\x00{m.get('content')}".encode("utf-8", "surrogatepass")
+        h = hashlib.blake2b(h + data, digest_size=16).digest()
+        out.append(h.hex())
+    return out
+
+
+class HistoryCompactor:
+    def __init__(
+        self,
+        summarizer: Summarizer = extractive_summary,
+        keep_messages: int = KEEP_MESSAGES,
+        summary_max_tokens: int = SUMMARY_MAX_TOKENS,
+        cache_size: int = CACHE_SIZE,
+    ):
+        self.summarizer = summarizer
+        self.keep_messages = keep_messages
+        self.summary_max_tokens = summary_max_tokens
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._cache.get(key)
+            if summary is not None:
+                self._cache.move_to_end(key)
+            return summary
+
+    def _cache_put(self, key: str, summary: str):
+        with self._lock:
+            self._cache[key] = summary
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    async def compact(
+        self, messages: List[Dict[str, str]], target: int, model: Optional[str] = None
+    ) -> Tuple[List[Dict[str, str]], CompactionStats]:
+        """Return messages fitting `target` tokens where possible, plus stats."""
+        before = count_messages(messages, model)
+        if before <= target:
+            return messages, CompactionStats(before, before)
+
+        # Leading system prompt(s) are kept as-is
+        n_sys = 0
+        while n_sys < len(messages) and messages[n_sys].get("role") == "system":
+            n_sys += 1
+        system, body = messages[:n_sys], messages[n_sys:]
+
+        # Keep as many recent messages as fit next to the summary
+        budget = target - count_messages(system, model) - self.summary_max_tokens
+        keep = min(self.keep_messages, len(body))
+        while keep > MIN_KEEP_MESSAGES and count_messages(body[-keep:], model) > budget:
+            keep -= 1
+        older, recent = body[:-keep], body[-keep:]
+        if not older:
+            return messages, CompactionStats(before, before)
+
+        # Longest already-summarized prefix of the older turns
+        hashes = _chain_hashes(older)
+        previous, start, cache = None, 0, "miss"
+        for i in range(len(older) - 1, -1, -1):
+            cached = self._cache_get(hashes[i])
+            if cached is not None:
+                previous, start = cached, i + 1
+                cache = "hit" if start == len(older) else "partial"
+                break
+
+        if start == len(older):
+            summary = previous
+        else:
+            summary = await self.summarizer(previous, older[start:], self.summary_max_tokens)
+            self._cache_put(hashes[-1], summary)
+
+        compacted = system + [{"role": "system", "content": SUMMARY_PREFIX + summary}] + recent
+        after = count_messages(compacted, model)
+        if after >= before:
+            return messages, CompactionStats(before, before)
+        return compacted, CompactionStats(before, after, len(older), cache)
+
+
+# Singleton (the router swaps in an LLM summarizer when HISTORY_SUMMARY_MODE=llm)
+_compactor = HistoryCompactor()
+
+
+def get_compactor() -> HistoryCompactor:
+    return _compactor
+
+
+def set_summarizer(summarizer: Summarizer):
+    _compactor.summarizer = summarizer
+
+
+def stats_dict(stats: CompactionStats) -> Dict:
+    return {**asdict(stats), "tokens_saved": stats.tokens_saved}
@@ -1,6 +1,11 @@
+import asyncio
 import logging
 import math
 import os
+import threading
+import time
+
+from services.token_counter import count_messages
 
 logger = logging.getLogger("ai-router.cost")
 
@@ -30,13 +35,32 @@ def _get_tier_from_model(model_name: str) -> str:
     if model_name == os.getenv("OPENAI_TEXT_NANO"):
         return "mini"
     
-    if "llama" in model_name.lower():
-        return "local"
-    if "deepseek" in model_name.lower():
+    name = model_name.lower()
+    if "llama" in name or "deepseek" in name or "hermes" in name:
         return "local"
     
+    # Name-based fallback when the env mapping does not cover the model
+    if name.startswith(("o1", "o3", "o4")):
+        return "reasoning" if "mini" in name else "elite"
+    if "mini" in name or "nano" in name:
+        return "mini"
+    
     return "standard" # Default fallback
 
+def pricing_tier(model_name: str, provider: str = None) -> str:
+    """Pricing tier for a provider model name; local (Ollama) models are free."""
+    if provider == "ollama":
+        return "local"
+    return _get_tier_from_model(model_name)
+
+def estimate_cost(model_name: str, prompt_tokens: int, completion_tokens: int, provider: str = None) -> float:
+    """Estimated USD cost of one call (blended PRICING_PER_1M rate)."""
+    tier = pricing_tier(model_name, provider)
+    if tier in ["reasoning", "elite"]:
+        # Hidden reasoning tokens are billed as output
+        completion_tokens *= 2
+    return ((prompt_tokens + completion_tokens) / 1_000_000) * PRICING_PER_1M.get(tier, 5.00)
+
 def est_tokens(text: str) -> int:
     """Rough estimation of tokens (char/4)."""
     return math.ceil(len(text) / 4)
@@ -51,9 +75,8 @@ def check_cost_limit(model_name: str, messages: list) -> bool:
 
     tier = _get_tier_from_model(model_name)
     
-    # Calculate prompt tokens
-    full_text = "".join([str(m.get("content", "")) for m in messages])
-    prompt_tokens = est_tokens(full_text)
+    # Calculate prompt tokens (tokenizer of the target model, memoized)
+    prompt_tokens = count_messages(messages, model_name)
     
     # Estimate completion tokens (heuristic based on tier)
     # Reasoning models generate LOTS of tokens.
@@ -76,3 +99,191 @@ def check_cost_limit(model_name: str, messages: list) -> bool:
         return False
         
     return True
+
+
+# ---------- Rolling Spend Windows ----------
+# Limits in USD per window; 0/unset = unlimited. Global limits apply to all
+# traffic, per-key limits to each hashed API key (see app.main api_key_middleware).
+SPEND_WINDOWS = {"minute": 60, "hour": 3600, "day": 86400}
+SPEND_BACKEND = os.getenv("SPEND_BACKEND", "redis" if os.getenv("REDIS_URL") else "memory")  # memory | redis
+SPEND_KEY_PREFIX = os.getenv("SPEND_KEY_PREFIX", "spend")
+SPEND_REDIS_TIMEOUT_SEC = float(os.getenv("SPEND_REDIS_TIMEOUT_SEC", "0.25"))  # A stalled Redis must not stall requests
+
+
+def _limit(name: str, default: str = "0") -> float:
+    try:
+        return float(os.getenv(name, default) or 0)
+    except ValueError:
+        return 0.0
+
+
+def _spend_limits() -> dict:
+    """{"global": {window: usd}, "key": {window: usd}} with unlimited windows omitted."""
+    global_limits = {
+        "minute": _limit("SPEND_LIMIT_MINUTE_USD"),
+        "hour": _limit("SPEND_LIMIT_HOUR_USD"),
+        "day": _limit("SPEND_LIMIT_DAY_USD", os.getenv("DAILY_BUDGET_USD", "0")),
+    }
+    key_limits = {w: _limit(f"SPEND_LIMIT_KEY_{w.upper()}_USD") for w in SPEND_WINDOWS}
+    return {
+        "global": {w: v for w, v in global_limits.items() if v > 0},
+        "key": {w: v for w, v in key_limits.items() if v > 0},
+    }
+
+
+class SpendTracker:
+    """
+    Sliding-window spend counters (current + weighted previous fixed window).
+    Counters live in process memory, or in Redis (INCRBYFLOAT) so that all
+    workers share one budget.
+
+    The Redis client is synchronous with short socket timeouts: callers on the
+    event loop go through arecord_spend (worker thread); a failed or slow Redis
+    call is logged and treated as no spend.
+    """
+
+    def __init__(self, backend: str = SPEND_BACKEND, redis_url: str = None, prefix: str = SPEND_KEY_PREFIX):
+        self.backend = backend
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # (scope, window) -> [window_index, current_usd, previous_usd]
+        self._mem = {}
+        self._redis = None
+        if backend == "redis":
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(
+                    redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+                    decode_responses=True,
+                    socket_timeout=SPEND_REDIS_TIMEOUT_SEC,
+                    socket_connect_timeout=SPEND_REDIS_TIMEOUT_SEC,
+                )
+                self._redis.ping()
+            except Exception as e:
+                logger.warning(f"Spend tracker: Redis unavailable ({e}); using in-memory counters")
+                self._redis = None
+                self.backend = "memory"
+
+    def _rkey(self, scope: str, window: str, idx: int) -> str:
+        return f"{self.prefix}:{scope}:{window}:{idx}"
+
+    def record(self, cost_usd: float, api_key_id: str = None, now: float = None):
+        """Add spend to the global and per-key counters of every window."""
+        if cost_usd <= 0:
+            return
+        now = time.time() if now is None else now
+        scopes = ["global"] + ([f"key:{api_key_id}"] if api_key_id else [])
+
+        if self._redis is not None:
+            try:
+                pipe = self._redis.pipeline()
+                for scope in scopes:
+                    for window, size in SPEND_WINDOWS.items():
+                        key = self._rkey(scope, window, int(now // size))
+                        pipe.incrbyfloat(key, cost_usd)
+                        pipe.expire(key, size * 2)
+                pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"Spend tracker: Redis write failed ({e})")
+                return
+
+        with self._lock:
+            for scope in scopes:
+                for window, size in SPEND_WINDOWS.items():
+                    idx = int(now // size)
+                    slot = self._mem.get((scope, window))
+                    if slot is None:
+                        slot = self._mem[(scope, window)] = [idx, 0.0, 0.0]
+                    self._roll(slot, idx)
+                    slot[1] += cost_usd
+
+    @staticmethod
+    def _roll(slot: list, idx: int):
+        if slot[0] == idx:
+            return
+        slot[2] = slot[1] if slot[0] == idx - 1 else 0.0
+        slot[1] = 0.0
+        slot[0] = idx
+
+    def spent(self, scope: str, window: str, now: float = None) -> float:
+        """Estimated spend over the trailing window ending now."""
+        now = time.time() if now is None else now
+        size = SPEND_WINDOWS[window]
+        idx = int(now // size)
+        weight = 1.0 - (now - idx * size) / size
+
+        if self._redis is not None:
+            try:
+                cur, prev = self._redis.mget(self._rkey(scope, window, idx), self._rkey(scope, window, idx - 1))
+                return float(cur or 0) + float(prev or 0) * weight
+            except Exception as e:
+                logger.warning(f"Spend tracker: Redis read failed ({e})")
+                return 0.0
+
+        with self._lock:
+            slot = self._mem.get((scope, window))
+            if slot is None:
+                return 0.0
+            self._roll(slot, idx)
+            return slot[1] + slot[2] * weight
+
+    def exhausted(self, api_key_id: str = None, limits: dict = None) -> list:
+        """Names of exhausted windows, e.g. ["global:day", "key:hour"] (empty = OK)."""
+        limits = limits or _spend_limits()
+        out = []
+        for window, limit in limits["global"].items():
+            if self.spent("global", window) >= limit:
+                out.append(f"global:{window}")
+        if api_key_id:
+            for window, limit in limits["key"].items():
+                if self.spent(f"key:{api_key_id}", window) >= limit:
+                    out.append(f"key:{window}")
+        return out
+
+    def status(self, api_key_id: str = None) -> dict:
+        limits = _spend_limits()
+        scopes = {"global": "global"}
+        if api_key_id:
+            scopes["key"] = f"key:{api_key_id}"
+        return {
+            name: {
+                w: {"spent_usd": round(self.spent(scope, w), 6), "limit_usd": limits[name].get(w)}
+                for w in SPEND_WINDOWS
+            }
+            for name, scope in scopes.items()
+        }
+
+
+# Singleton (lazy so env overrides apply)
+_tracker = None
+
+
+def get_spend_tracker() -> SpendTracker:
+    global _tracker
+    if _tracker is None:
+        _tracker = SpendTracker()
+    return _tracker
+
+
+def record_spend(cost_usd: float, api_key_id: str = None):
+    get_spend_tracker().record(cost_usd, api_key_id)
+
+
+async def arecord_spend(cost_usd: float, api_key_id: str = None):
+    """record_spend for async callers: Redis round trips run off the event loop."""
+    if cost_usd <= 0:
+        return
+    tracker = get_spend_tracker()
+    if tracker._redis is None:
+        tracker.record(cost_usd, api_key_id)
+    else:
+        await asyncio.to_thread(tracker.record, cost_usd, api_key_id)
+
+
+def spend_exhausted(api_key_id: str = None) -> list:
+    """Exhausted spend windows for this caller; cloud routing should be skipped if non-empty."""
+    limits = _spend_limits()
+    if not limits["global"] and not limits["key"]:
+        return []
+    return get_spend_tracker().exhausted(api_key_id, limits)
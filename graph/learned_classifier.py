@@ -0,0 +1,322 @@
+"""
+Learned prompt classifier: hashed n-gram features + linear softmax model (NumPy).
+
+A fallback stage between the keyword heuristic and the LLM judge. When the
+heuristic is unsure, the learned model scores the prompt in well under a
+millisecond; if its calibrated confidence clears the judge threshold, its
+labels are used and the judge call is skipped.
+
+Features (hashed into N buckets with a sign bit, log-scaled, L2-normalized):
+  word unigrams and bigrams, character 3-grams, and structural flags (code
+  fences, stack traces, numbered lists, length bucket).
+Both heads (task, complexity) share one weight matrix, so a batch of prompts
+is scored with one gather and one reduce. Confidence is the task probability
+after temperature scaling fit on out-of-fold predictions.
+
+Training is offline (scripts/train_classifier.py) from labeled JSONL (the
+routing corpus, reviewed logs, exported judge outputs). The artifact is a
+compressed .npz with float16 weights. NumPy is optional: without it, or
+without an artifact, the stage is skipped.
+"""
+import json
+import logging
+import math
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency: the stage is disabled without it
+    np = None
+
+logger = logging.getLogger("ai-router.learned-classifier")
+
+N_FEATURES = 2 ** 14
+MAX_CHARS = 4000  # Head + tail of long prompts; the middle adds cost, not signal
+TEMPERATURE_RANGE = (0.05, 20.0)  # Bounds of the temperature-scaling fit
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_NUMBERED = re.compile(r"^\s*\d+[.)]\s", re.M)
+
+
+@dataclass
+class Prediction:
+    task: str
+    complexity: str
+    confidence: float  # Calibrated task probability
+    complexity_confidence: float
+
+
+def prompt_text(messages: List[Dict[str, Any]]) -> str:
+    """Message contents joined, bounded to MAX_CHARS (head and tail)."""
+    text = "\n".join(str(m.get("content") or "") for m in messages)
+    if len(text) > MAX_CHARS:
+        half = MAX_CHARS // 2
+        text = text[:half] + "\n" + text[-half:]
+    return text
+
+
+def _features(text: str) -> List[str]:
+    lower = text.lower()
+    words = _WORD.findall(lower)
+    feats = ["<bias>"]
+    feats += ["w:" + w for w in words]
+    feats += ["b:" + a + " " + b for a, b in zip(words, words[1:])]
+    for w in words[:256]:
+        padded = f"<{w}>"
+        feats += ["c:" + padded[i:i + 3] for i in range(len(padded) - 2)]
+    if "```" in text:
+        feats.append("f:code_fence")
+    if "traceback" in lower or "exception" in lower or "error:" in lower:
+        feats.append("f:trace")
+    if len(_NUMBERED.findall(text)) >= 2:
+        feats.append("f:numbered")
+    feats.append(f"f:len{min(12, int(math.log2(len(words) + 1)))}")
+    return feats
+
+
+def featurize(text: str, n_features: int = N_FEATURES) -> Tuple[List[int], List[float]]:
+    """Sparse (indices, values) for one text."""
+    acc: Dict[int, float] = {}
+    mask = n_features - 1
+    for f in _features(text):
+        h = zlib.crc32(f.encode("utf-8"))
+        idx = h & mask
+        acc[idx] = acc.get(idx, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+    values = [math.copysign(math.log1p(abs(v)), v) for v in acc.values()]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return list(acc), [v / norm for v in values]
+
+
+def _batch(texts: Sequence[str], n_features: int):
+    """Concatenated sparse rows: (indices, values, row offsets, row ids)."""
+    idx, val, offsets, rows = [], [], [], []
+    for r, text in enumerate(texts):
+        i, v = featurize(text, n_features)
+        offsets.append(len(idx))
+        idx += i
+        val += v
+        rows += [r] * len(i)
+    return (np.asarray(idx, dtype=np.int64), np.asarray(val, dtype=np.float32),
+            np.asarray(offsets, dtype=np.int64), np.asarray(rows, dtype=np.int64))
+
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class LearnedClassifier:
+    def __init__(self, W, b, tasks: List[str], complexities: List[str],
+                 temperature: Tuple[float, float] = (1.0, 1.0), meta: Dict[str, Any] = None):
+        self.W = np.asarray(W, dtype=np.float32)
+        self.b = np.asarray(b, dtype=np.float32)
+        self.tasks = list(tasks)
+        self.complexities = list(complexities)
+        self.temperature = tuple(temperature)
+        self.meta = meta or {}
+        self.n_features = self.W.shape[0]
+
+    # ---------- Scoring ----------
+    def logits(self, texts: Sequence[str]):
+        """(batch, n_tasks + n_complexities) raw scores, one gather + one reduce for the batch."""
+        idx, val, offsets, _ = _batch(texts, self.n_features)
+        contrib = self.W[idx] * val[:, None]
+        return np.add.reduceat(contrib, offsets, axis=0) + self.b  # Every row has <bias>: no empty segments
+
+    def probabilities(self, texts: Sequence[str]):
+        z = self.logits(texts)
+        nt = len(self.tasks)
+        return _softmax(z[:, :nt] / self.temperature[0]), _softmax(z[:, nt:] / self.temperature[1])
+
+    def predict(self, texts: Sequence[str]) -> List[Prediction]:
+        if not texts:
+            return []
+        pt, pc = self.probabilities(texts)
+        ti, ci = pt.argmax(axis=1), pc.argmax(axis=1)
+        return [
+            Prediction(self.tasks[t], self.complexities[c], float(pt[r, t]), float(pc[r, c]))
+            for r, (t, c) in enumerate(zip(ti, ci))
+        ]
+
+    def predict_messages(self, messages: List[Dict[str, Any]]) -> Prediction:
+        return self.predict([prompt_text(messages)])[0]
+
+    # ---------- Persistence ----------
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            W=self.W.astype(np.float16),
+            b=self.b,
+            tasks=np.array(self.tasks),
+            complexities=np.array(self.complexities),
+            temperature=np.array(self.temperature, dtype=np.float64),
+            meta=np.array(json.dumps(self.meta)),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "LearnedClassifier":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["W"], data["b"], [str(t) for t in data["tasks"]], [str(c) for c in data["complexities"]],
+                tuple(float(t) for t in data["temperature"]), json.loads(str(data["meta"])),
+            )
+
+
+# ---------- Training ----------
+def _fit(texts, y_task, y_cx, n_tasks, n_cx, n_features, epochs, lr, l2, weights):
+    """Full-batch Adam on softmax cross-entropy for both heads (shared sparse features)."""
+    idx, val, offsets, rows = _batch(texts, n_features)
+    n, k = len(texts), n_tasks + n_cx
+    Y = np.zeros((n, k), dtype=np.float32)
+    Y[np.arange(n), y_task] = 1.0
+    Y[np.arange(n), n_tasks + y_cx] = 1.0
+    w = weights / weights.sum()
+    W = np.zeros((n_features, k), dtype=np.float32)
+    b = np.zeros(k, dtype=np.float32)
+    mW, vW, mb, vb = np.zeros_like(W), np.zeros_like(W), np.zeros_like(b), np.zeros_like(b)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    for step in range(1, epochs + 1):
+        Z = np.add.reduceat(W[idx] * val[:, None], offsets, axis=0) + b
+        P = np.concatenate([_softmax(Z[:, :n_tasks]), _softmax(Z[:, n_tasks:])], axis=1)
+        G = (P - Y) * w[:, None]
+        gW = np.zeros_like(W)
+        np.add.at(gW, idx, G[rows] * val[:, None])
+        gW += l2 * W
+        gb = G.sum(axis=0)
+        for p, g, m, v in ((W, gW, mW, vW), (b, gb, mb, vb)):
+            m *= beta1
+            m += (1 - beta1) * g
+            v *= beta2
+            v += (1 - beta2) * g * g
+            p -= lr * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + eps)
+    return W, b
+
+
+def _best_temperature(logits, y, tol: float = 1e-4) -> float:
+    """
+    Temperature minimizing negative log-likelihood of held-out predictions.
+
+    The NLL is convex in the inverse temperature, so a golden-section search
+    over it finds the optimum anywhere in TEMPERATURE_RANGE (no grid edges).
+    """
+    def nll(beta):
+        p = _softmax(logits * beta)
+        return -float(np.mean(np.log(p[np.arange(len(y)), y] + 1e-12)))
+
+    lo, hi = 1 / TEMPERATURE_RANGE[1], 1 / TEMPERATURE_RANGE[0]
+    ratio = (math.sqrt(5) - 1) / 2
+    a, b = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+    fa, fb = nll(a), nll(b)
+    while hi - lo > tol:
+        if fa < fb:
+            hi, b, fb = b, a, fa
+            a = hi - ratio * (hi - lo)
+            fa = nll(a)
+        else:
+            lo, a, fa = a, b, fb
+            b = lo + ratio * (hi - lo)
+            fb = nll(b)
+    return round(2 / (lo + hi), 4)
+
+
+def train(texts: List[str], tasks: List[str], complexities: List[str], task_labels: List[str],
+          complexity_labels: List[str], weights: Optional[List[float]] = None, folds: int = 5,
+          epochs: int = 300, lr: float = 0.05, l2: float = 1e-4, n_features: int = N_FEATURES,
+          prior: Optional[List[Tuple[str, str, str, float]]] = None,
+          seed: int = 0) -> Tuple["LearnedClassifier", Dict[str, Any]]:
+    """
+    Train on labeled texts. Out-of-fold predictions (k-fold CV) fit the
+    temperatures and give honest accuracy / judge-rate numbers; the returned
+    model is trained on all data. `prior` rows (text, task, complexity, weight),
+    e.g. config keywords, are added to every training split but never scored.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required to train the learned classifier")
+    n = len(texts)
+    prior = prior or []
+    texts = list(texts) + [p[0] for p in prior]
+    y_t = np.array([task_labels.index(t) for t in list(tasks) + [p[1] for p in prior]])
+    y_c = np.array([complexity_labels.index(c) for c in list(complexities) + [p[2] for p in prior]])
+    wts = np.asarray(list(weights if weights is not None else [1.0] * n) + [p[3] for p in prior], dtype=np.float32)
+    nt, nc = len(task_labels), len(complexity_labels)
+
+    oof = np.zeros((n, nt + nc), dtype=np.float32)
+    order = np.random.default_rng(seed).permutation(n)
+    folds = max(2, min(folds, n))
+    for f in range(folds):
+        test = order[f::folds]
+        train_idx = np.concatenate([np.setdiff1d(order, test), np.arange(n, len(texts))])
+        W, b = _fit(
+            [texts[i] for i in train_idx], y_t[train_idx], y_c[train_idx], nt, nc, n_features, epochs, lr, l2,
+            wts[train_idx],
+        )
+        oof[test] = LearnedClassifier(W, b, task_labels, complexity_labels).logits([texts[i] for i in test])
+
+    temperature = (_best_temperature(oof[:, :nt], y_t[:n]), _best_temperature(oof[:, nt:], y_c[:n]))
+    pt, pc = _softmax(oof[:, :nt] / temperature[0]), _softmax(oof[:, nt:] / temperature[1])
+    conf = pt.max(axis=1)
+    task_ok = pt.argmax(axis=1) == y_t[:n]
+    report = {
+        "items": n,
+        "folds": folds,
+        "cv_task_accuracy": round(float(task_ok.mean()), 4),
+        "cv_complexity_accuracy": round(float((pc.argmax(axis=1) == y_c[:n]).mean()), 4),
+        "temperature": temperature,
+        "ece": round(expected_calibration_error(conf, task_ok), 4),
+        "confidence_by_threshold": {
+            str(th): {"coverage": round(float((conf >= th).mean()), 4),
+                      "accuracy": round(float(task_ok[conf >= th].mean()), 4) if (conf >= th).any() else None}
+            for th in (0.5, 0.6, 0.7, 0.8, 0.9)
+        },
+    }
+
+    W, b = _fit(texts, y_t, y_c, nt, nc, n_features, epochs, lr, l2, wts)
+    meta = {
+        "trained_at": time.time(), "n_features": n_features, "max_chars": MAX_CHARS, "prior_items": len(prior),
+        **report,
+    }
+    return LearnedClassifier(W, b, task_labels, complexity_labels, temperature, meta), report
+
+
+def expected_calibration_error(confidence, correct, bins: int = 10) -> float:
+    """Mean |accuracy - confidence| over equal-width confidence bins, weighted by bin size."""
+    confidence, correct = np.asarray(confidence), np.asarray(correct, dtype=np.float32)
+    edges = np.linspace(0, 1, bins + 1)
+    err = 0.0
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        sel = (confidence > lo) & (confidence <= hi)
+        if sel.any():
+            err += sel.mean() * abs(correct[sel].mean() - confidence[sel].mean())
+    return float(err)
+
+
+# ---------- Singleton ----------
+_classifier: Optional[LearnedClassifier] = None
+_loaded_path: Optional[str] = None
+_lock = threading.Lock()
+
+
+def get_classifier(path: Optional[str]) -> Optional[LearnedClassifier]:
+    """Classifier loaded from `path` (cached); None without numpy or artifact."""
+    global _classifier, _loaded_path
+    if not path or np is None:
+        return None
+    if _loaded_path == path:
+        return _classifier
+    with _lock:
+        if _loaded_path != path:
+            try:
+                _classifier = LearnedClassifier.load(path)
+                logger.info(f"Learned classifier loaded from {path} ({len(_classifier.tasks)} tasks, "
+                            f"cv task acc {_classifier.meta.get('cv_task_accuracy')})")
+            except (OSError, KeyError, ValueError) as e:
+                _classifier = None
+                logger.warning(f"Learned classifier unavailable ({path}): {e}")
+            _loaded_path = path
+    return _classifier
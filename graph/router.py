@@ -8,12 +8,13 @@ model without requiring manual flags like `critical=true` or `budget=high`.
 Architecture:
 1. classify_prompt() -> RoutingMeta (task, complexity, confidence)
 2. select_model_from_policy() -> model_id based on (task, complexity)
-3. LLM Judge (optional) -> refinement for ambiguous cases
+3. Learned classifier, semantic router, then LLM Judge (optional) -> refinement for ambiguous cases
 4. Model invocation with SLA monitoring and fallbacks
 """
 
+import asyncio
 import datetime
-import json
+import inspect
 import logging
 import math
 import os
@@ -28,11 +29,21 @@ import yaml
 from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, StateGraph
 
-from graph.cost_guard import PRICING_PER_1M, _get_tier_from_model
-from providers.ollama_client import make_ollama
+from graph import compaction, learned_classifier, semantic_router
+from graph.cost_guard import PRICING_PER_1M, arecord_spend, estimate_cost, pricing_tier, spend_exhausted
+from providers.ollama_client import make_ollama, resolve_num_ctx
 from providers.openai_client import is_cloud_enabled, make_openai
 from providers.openai_client import validate_model_id as validate_openai_id
+from services import router_metrics as prom
+from services import session_store as sessions
+from services import tracing
 from services.gpu_queue import run_on_gpu
+from services.latency_sketch import observe_request as observe_latency
+from services.metrics import record_event
+from services.model_warmup import get_manager as get_warmup_manager
+from services.ollama_pool import get_pool as get_ollama_pool
+from services.serialization import dumps_str
+from services.token_counter import count_messages, count_text
 
 logger = logging.getLogger("ai-router.graph")
 
@@ -72,6 +83,7 @@ REG = {m["id"]: m for m in CONFIG["models"]}
 _merge_env_config(REG)
 
 TASK_TYPES = CONFIG.get("task_types", {})
+prom.set_label_domains(models=REG.keys(), tasks=TASK_TYPES.keys())
 COMPLEXITY_SIGNALS = CONFIG.get("complexity_signals", {})
 ROUTING_POLICY = CONFIG.get("routing_policy", {})
 CLASSIFIER_CFG = CONFIG.get("classifier", {"llm_assisted": False})
@@ -101,8 +113,12 @@ class RoutingMeta:
     confidence: float = 1.0
     requires_search: bool = False
     requires_long_context: bool = False
-    classifier_used: str = "heuristic"  # "heuristic" or "llm"
+    classifier_used: str = "heuristic"  # "heuristic", "learned", "semantic" or "llm"
     quality_score: int = 5 # 1-10 scale (1=Draft, 5=Standard, 10=Production)
+    complexity_boosted: bool = False  # Set by _node_classify when cloud is unavailable
+    prompt_tokens: int = 0  # Tokenizer count of the whole conversation (cost estimates)
+    sticky: bool = False  # Task/complexity kept from the conversation's previous turn
+    compacted_tokens: int = 0  # Prompt size history compaction can reach (0 = compaction off)
 
 # ---------- State ----------
 class RouterState(TypedDict, total=False):
@@ -121,12 +137,77 @@ class RouterState(TypedDict, total=False):
     
     # Cloud availability flag (determined once at request start)
     cloud_available: bool
+    
+    # Exhausted spend windows (e.g. ["global:day"]); cloud is skipped when set
+    spend_limited: List[str]
+    
+    # History compaction stats (set by _node_compact when older turns were summarized)
+    compaction: Dict[str, Any]
+    
+    # perf_counter() at request start (set by the caller or by _node_classify)
+    _latency_start: float
+    
+    # Hashed API key of the caller (for per-key metrics); "anonymous" if auth is off
+    api_key_id: str
+    
+    # Explicit conversation id (X-Conversation-Id); otherwise the message prefix hash is used
+    conversation_id: str
+    
+    # Sticky routing: this turn's decision, stored in the session store after invoke
+    session: Dict[str, Any]
 
 # ---------- Utilities ----------
 def join_messages(msgs: List[Dict[str, str]]) -> str:
     """Concatenate messages into a single string for analysis."""
     return "\n".join([f'{m.get("role", "user")}: {m.get("content", "")}' for m in msgs])
 
+def conversation_chars(msgs: List[Dict[str, str]]) -> int:
+    """len(join_messages(msgs)) without building the string."""
+    return sum(len(m.get("role", "user")) + 2 + len(str(m.get("content", ""))) for m in msgs) + max(0, len(msgs) - 1)
+
+def _clip(text: str, limit: int) -> str:
+    """Head and tail of `text` within `limit` chars (errors and asks sit at the ends)."""
+    if len(text) <= limit:
+        return text
+    head = limit * 2 // 3
+    return text[:head] + "\n...\n" + text[len(text) - (limit - head):]
+
+def classification_window(msgs: List[Dict[str, str]], max_chars: int = None) -> str:
+    """
+    Bounded, role-weighted view of the conversation for classification.
+
+    Same text as join_messages() when the conversation fits in `max_chars`
+    (classifier.window.max_chars; 0 disables the bound). Otherwise the last user
+    message and the system prompt get their configured shares and the rest of
+    the budget is spread over the other messages, each clipped to head + tail,
+    so the keyword and regex scans cost the same for 20k or 2M characters.
+    """
+    window_cfg = CLASSIFIER_CFG.get("window", {})
+    if max_chars is None:
+        max_chars = window_cfg.get("max_chars", 16000)
+    if not max_chars or conversation_chars(msgs) <= max_chars:
+        return join_messages(msgs)
+
+    contents = [str(m.get("content", "")) for m in msgs]
+    roles = [m.get("role", "user") for m in msgs]
+
+    limits: Dict[int, int] = {}
+    last_user = next((i for i in range(len(msgs) - 1, -1, -1) if roles[i] == "user"), len(msgs) - 1)
+    limits[last_user] = min(len(contents[last_user]), int(max_chars * window_cfg.get("last_user_share", 0.5)))
+    system = next((i for i, r in enumerate(roles) if r == "system" and i != last_user), None)
+    if system is not None:
+        limits[system] = min(len(contents[system]), int(max_chars * window_cfg.get("system_share", 0.2)))
+
+    # Water-fill the remaining budget over the other messages: short ones whole, long ones clipped
+    others = sorted((i for i in range(len(msgs)) if i not in limits), key=lambda i: len(contents[i]))
+    remaining = max(0, max_chars - sum(limits.values()))
+    for n, i in enumerate(others):
+        limits[i] = min(len(contents[i]), remaining // (len(others) - n))
+        remaining -= limits[i]
+
+    kept = (i for i in range(len(msgs)) if limits[i] or i == last_user)
+    return "\n".join(f"{roles[i]}: {_clip(contents[i], limits[i])}" for i in kept)
+
 def est_tokens(txt: str) -> int:
     """Estimate token count (rough heuristic: ~4 chars per token)."""
     return max(1, math.ceil(len(txt) / 4))
@@ -181,9 +262,10 @@ def classify_prompt(messages: List[Dict[str, str]]) -> RoutingMeta:
     3. Token count analysis
     4. Structural analysis (numbered lists, code blocks, etc.)
     """
-    txt = join_messages(messages).lower()
-    txt_original = join_messages(messages)
-    token_count = est_tokens(txt_original)
+    # Scans run on a bounded window; the size heuristic still sees the whole conversation
+    txt_original = classification_window(messages)
+    txt = txt_original.lower()
+    token_count = max(1, math.ceil(conversation_chars(messages) / 4))
     
     # Initialize with defaults
     detected_task = "simple_qa"
@@ -272,7 +354,9 @@ def classify_prompt(messages: List[Dict[str, str]]) -> RoutingMeta:
             )
     
     # Determine if long context is needed
-    requires_long_context = token_count > 4000
+    # chars/4 estimate: tokenizing the whole conversation would undo the bounded window
+    prompt_tokens = token_count
+    requires_long_context = prompt_tokens > 4000
     
     return RoutingMeta(
         task=detected_task,
@@ -280,9 +364,81 @@ def classify_prompt(messages: List[Dict[str, str]]) -> RoutingMeta:
         confidence=confidence,
         requires_search=False,  # Could be extended for RAG
         requires_long_context=requires_long_context,
+        prompt_tokens=prompt_tokens,
         classifier_used="heuristic"
     )
 
+def classify_prompt_learned(messages: List[Dict[str, str]], heuristic_meta: RoutingMeta) -> RoutingMeta:
+    """
+    Second opinion from the learned classifier (graph/learned_classifier.py).
+
+    Only consulted when the heuristic is below the judge threshold; its labels
+    are taken when its calibrated confidence clears classifier.learned.min_confidence,
+    which then keeps the LLM judge from being called.
+    """
+    learned_cfg = CLASSIFIER_CFG.get("learned", {})
+    threshold = CLASSIFIER_CFG.get("heuristic_confidence_threshold", 0.7)
+    if not learned_cfg.get("enabled", False) or heuristic_meta.confidence >= threshold:
+        return heuristic_meta
+
+    path = learned_cfg.get("path")
+    clf = learned_classifier.get_classifier(str(ROOT / path) if path else None)
+    if clf is None:
+        return heuristic_meta
+
+    pred = clf.predict_messages(messages)
+    if pred.task not in TASK_TYPES or pred.confidence < learned_cfg.get("min_confidence", threshold):
+        logger.debug(f"Learned classifier unsure ({pred.task}/{pred.complexity} @ {pred.confidence:.2f})")
+        return heuristic_meta
+
+    heuristic_meta.task = pred.task
+    heuristic_meta.complexity = pred.complexity
+    heuristic_meta.confidence = pred.confidence
+    heuristic_meta.classifier_used = "learned"
+    return heuristic_meta
+
+def get_semantic_index():
+    """Semantic router for classifier.semantic (None when disabled)."""
+    return semantic_router.get_router(CLASSIFIER_CFG.get("semantic", {}))
+
+def classify_prompt_semantic(messages: List[Dict[str, str]], meta: RoutingMeta) -> RoutingMeta:
+    """
+    Nearest task/complexity centroid of the latest user message (graph/semantic_router.py).
+
+    Only consulted while the earlier stages are below the judge threshold; taken
+    when the cosine similarity clears classifier.semantic.min_similarity and
+    beats every other task's centroid by min_margin.
+    """
+    semantic_cfg = CLASSIFIER_CFG.get("semantic", {})
+    threshold = CLASSIFIER_CFG.get("heuristic_confidence_threshold", 0.7)
+    if not semantic_cfg.get("enabled", False) or meta.confidence >= threshold:
+        return meta
+
+    index = get_semantic_index()
+    user_msgs = [m for m in messages if m.get("role", "user") == "user"]
+    match = index.classify(str((user_msgs or messages or [{}])[-1].get("content") or "")) if index else None
+    if match is None or match.task not in TASK_TYPES:
+        return meta
+    min_similarity, min_margin = semantic_cfg.get("min_similarity", 0.7), semantic_cfg.get("min_margin", 0.02)
+    weak = match.similarity < min_similarity or match.margin < min_margin
+    if weak:
+        logger.debug(
+            f"Semantic match too weak ({match.task}/{match.complexity} "
+            f"sim={match.similarity:.2f} margin={match.margin:.2f})"
+        )
+        return meta
+
+    meta.task = match.task
+    meta.complexity = match.complexity
+    meta.confidence = match.similarity
+    meta.classifier_used = "semantic"
+    return meta
+
+def classify_prompt_local(messages: List[Dict[str, str]]) -> RoutingMeta:
+    """Heuristic, then the learned and semantic stages while confidence stays below the judge threshold."""
+    routing_meta = classify_prompt_learned(messages, classify_prompt(messages))
+    return classify_prompt_semantic(messages, routing_meta)
+
 def classify_prompt_with_llm(messages: List[Dict[str, str]], heuristic_meta: RoutingMeta) -> RoutingMeta:
     """
     Use an LLM to refine classification when heuristics are uncertain.
@@ -303,7 +459,7 @@ def classify_prompt_with_llm(messages: List[Dict[str, str]], heuristic_meta: Rou
         return heuristic_meta
     
     try:
-        prompt_text = join_messages(messages)[:2000]
+        prompt_text = classification_window(messages, 2000)
         template = CLASSIFIER_CFG.get("prompt_template", "Classify: {prompt}")
         classifier_prompt = template.format(prompt=prompt_text)
         
@@ -311,8 +467,10 @@ def classify_prompt_with_llm(messages: List[Dict[str, str]], heuristic_meta: Rou
         model_id = CLASSIFIER_CFG.get("llm_model", "gpt-5-nano")
         chain = _build_chain(model_id) if model_id in REG else _build_chain("gpt-5-nano")
         
-        result = chain.invoke({"messages": [{"role": "user", "content": classifier_prompt}]})
+        with tracing.span("judge", model=model_id):
+            result = chain.invoke({"messages": [{"role": "user", "content": classifier_prompt}]})
         result_str = str(result).upper()
+        judge_outcome = "unparsed"
         
         # Parse response
         task_match = re.search(r"TASK:\s*(\w+)", result_str)
@@ -337,20 +495,97 @@ def classify_prompt_with_llm(messages: List[Dict[str, str]], heuristic_meta: Rou
 
             heuristic_meta.classifier_used = "llm"
             heuristic_meta.confidence = 0.9
+            judge_outcome = "refined"
+        
+        prom.observe_judge_call(judge_outcome)
         
     except Exception as e:
         logger.warning(f"LLM classifier failed: {e}. Using heuristic result.")
+        prom.observe_judge_call("error")
     
     return heuristic_meta
 
 # ---------- MODEL SELECTION ----------
-def select_model_from_policy(routing_meta: RoutingMeta, budget_override: str = None) -> str:
+def expected_completion_tokens(complexity: str) -> int:
+    """Expected completion length for a complexity level (complexity_signals.max_tokens)."""
+    sized = [cfg["max_tokens"] for cfg in COMPLEXITY_SIGNALS.values() if "max_tokens" in cfg]
+    default = max(sized) if sized else 1000
+    return COMPLEXITY_SIGNALS.get(complexity, {}).get("max_tokens", default)
+
+def estimate_model_cost(model_id: str, routing_meta: RoutingMeta) -> float:
+    """Estimated USD cost of sending this request to a registry model."""
+    meta = REG.get(model_id, {})
+    return estimate_cost(
+        meta.get("name", model_id),
+        routing_meta.prompt_tokens,
+        expected_completion_tokens(routing_meta.complexity),
+        meta.get("provider"),
+    )
+
+def _within_budget(model_id: str, routing_meta: RoutingMeta, budget: str = None) -> bool:
+    """True if the estimated cost fits BUD[budget].max_cost_usd (no budget = no cap)."""
+    max_cost = BUD.get(budget, {}).get("max_cost_usd") if budget else None
+    if max_cost is None:
+        return True
+    est = estimate_model_cost(model_id, routing_meta)
+    if est > max_cost:
+        logger.info(f"Skipping {model_id}: est. ${est:.4f} > budget '{budget}' ${max_cost:.2f}")
+        return False
+    return True
+
+def context_window(model_id: str) -> int:
+    """Effective context window of a registry model (None = unknown, no limit)."""
+    meta = REG.get(model_id, {})
+    if meta.get("provider", "ollama") == "ollama":
+        return resolve_num_ctx(meta.get("name", model_id), meta.get("context_window"))
+    return meta.get("context_window")
+
+def _fits_context(model_id: str, routing_meta: RoutingMeta) -> bool:
+    """
+    True if the prompt plus the expected completion fits the model's window.
+    For models the compact stage applies to, the prompt is its size after compaction.
+    """
+    window = context_window(model_id)
+    if not window:
+        return True
+    prompt_tokens = routing_meta.prompt_tokens
+    meta = REG.get(model_id, {})
+    if routing_meta.compacted_tokens and compaction.applies_to(meta):
+        target = compaction.target_tokens(meta, window)
+        prompt_tokens = compaction.effective_prompt_tokens(prompt_tokens, routing_meta.compacted_tokens, target)
+    needed = prompt_tokens + expected_completion_tokens(routing_meta.complexity)
+    if needed > window:
+        logger.info(f"Skipping {model_id}: needs ~{needed} tokens > context window {window}")
+        return False
+    return True
+
+def _long_context_fallback(routing_meta: RoutingMeta, cloud_available: bool, budget: str = None) -> str:
+    """Any registry model that fits the prompt: local first, then the lowest tier."""
+    fitting = [
+        model_id for model_id, meta in REG.items()
+        if (meta.get("provider") != "openai" or cloud_available)
+        and "routing_judge" not in meta.get("capabilities", [])
+        and _fits_context(model_id, routing_meta)
+        and _within_budget(model_id, routing_meta, budget)
+    ]
+    fitting.sort(key=lambda m: (REG[m].get("provider") == "openai", REG[m].get("tier", 0)))
+    return fitting[0] if fitting else None
+
+def select_model_from_policy(
+    routing_meta: RoutingMeta, budget_override: str = None, cloud_available: bool = None
+) -> str:
     """
     Select the optimal model based on routing policy and availability.
     
     Uses the routing_policy config to map (task, complexity) -> model list,
-    then picks the first available model from the list.
+    then picks the first available model from the list whose context window
+    fits the prompt and whose estimated cost fits the request budget
+    (budget.<name>.max_cost_usd).
+    `cloud_available` is the per-request decision from _node_classify
+    (None = evaluate the config/env/key gates here).
     """
+    if cloud_available is None:
+        cloud_available = _is_cloud_available()
     task = routing_meta.task
     complexity = routing_meta.complexity
     
@@ -368,6 +603,7 @@ def select_model_from_policy(routing_meta: RoutingMeta, budget_override: str = N
     
     # Filter by availability
     available_models = []
+    skipped_for_context = False
     for model_id in model_list:
         if model_id not in REG:
             continue
@@ -375,17 +611,30 @@ def select_model_from_policy(routing_meta: RoutingMeta, budget_override: str = N
         meta = REG[model_id]
         provider = meta.get("provider", "ollama")
         # Check if cloud is available
-        if provider == "openai" and not _is_cloud_available():
+        if provider == "openai" and not cloud_available:
+            continue
+        
+        if not _within_budget(model_id, routing_meta, budget_override):
+            continue
+        
+        if not _fits_context(model_id, routing_meta):
+            skipped_for_context = True
             continue
         
         available_models.append(model_id)
     
-    # Fallback chain
+    # Nothing in the policy list is usable (cloud off, over budget or prompt too long):
+    # the local model for the task family, else any registry model that holds the prompt
     if not available_models:
-        # Try local models first
-        if "deepseek-coder-v2-16b" in REG:
-            return "deepseek-coder-v2-16b"
-        return "llama-3.1-8b-instruct"
+        local = "local-code" if routing_meta.task in ["code_gen", "code_review", "code_crit_debug"] else "local-chat"
+        if local in REG and _fits_context(local, routing_meta):
+            return local
+        fallback = _long_context_fallback(routing_meta, cloud_available, budget_override)
+        if fallback:
+            return fallback
+        if skipped_for_context:
+            logger.warning(f"No model fits ~{routing_meta.prompt_tokens} prompt tokens; using {local}")
+        return local
     
     return available_models[0]
 
@@ -402,7 +651,7 @@ def pick_model_id(state: RouterState) -> str:
         return "o3" if state.get("budget") == "high" else "gpt-5.2-codex-high"
     
     # Use new automatic classification
-    routing_meta = classify_prompt(msgs)
+    routing_meta = classify_prompt_local(msgs)
     
     # Refine with LLM if needed
     routing_meta = classify_prompt_with_llm(msgs, routing_meta)
@@ -441,7 +690,13 @@ def _build_chain(model_id: str):
     real_id, params, provider = resolve_model_alias(model_id)
 
     if provider == "ollama":
-        return make_ollama(real_id, temperature=float(os.getenv("OLLAMA_TEMPERATURE", "0.1")))
+        return make_ollama(
+            real_id,
+            temperature=float(os.getenv("OLLAMA_TEMPERATURE", "0.1")),
+            num_ctx=REG[model_id].get("context_window"),
+            base_urls=REG[model_id].get("base_urls"),
+            registry_url=REG[model_id].get("base_url"),
+        )
     else:
         # STRICT FALLBACK: If Cloud is disabled via Env/Config, NEVER return an OpenAI chain.
         if not _is_cloud_available():
@@ -494,10 +749,11 @@ async def _model_branch(x: Dict[str, Any]) -> Any:
     model_id = x.get("model_id", "llama-3.1-8b-instruct")
     chain = _get_chain(model_id)
     
-    # Add fallbacks for local models
-    if model_id == "llama-3.1-8b-instruct" and _fallback_enabled():
+    # Add cloud fallbacks for local models (not once cloud is unavailable or over budget)
+    cloud_fallback = _fallback_enabled() and x.get("cloud_available", True)
+    if model_id == "llama-3.1-8b-instruct" and cloud_fallback:
         chain = chain.with_fallbacks([_get_chain("gpt-5-mini")])
-    elif model_id == "deepseek-coder-v2-16b" and _fallback_enabled():
+    elif model_id == "deepseek-coder-v2-16b" and cloud_fallback:
         chain = chain.with_fallbacks([_get_chain("gpt-5.2-codex-high")])
     
     return await chain.ainvoke({"messages": x["messages"]})
@@ -505,8 +761,14 @@ async def _model_branch(x: Dict[str, Any]) -> Any:
 BRANCH = RunnableLambda(_model_branch)
 
 # ---------- SLA Monitoring ----------
-def _sla_wrap(runnable):
-    """Wrap a runnable with SLA monitoring and fallback."""
+def _sla_wrap(runnable, cloud_available: bool = True):
+    """
+    Wrap a runnable with SLA monitoring and fallback.
+
+    Cloud fallbacks only run when cloud_available (False when cloud is down or the
+    spend limit is exhausted). The fallback that served the request is recorded as
+    x["fallback_model"] so the caller bills and reports it instead of the primary.
+    """
     if not SLA.get("enabled", True):
         return runnable
     
@@ -534,12 +796,15 @@ def _sla_wrap(runnable):
             logger.error(f"Primary chain {model_id} failed: {e}")
             
             # Attempt cloud fallback
-            if _fallback_enabled():
+            if _fallback_enabled() and cloud_available:
                 fallback_models = ["gpt-5-mini", "gpt-5.2-codex-high"]
                 for fb_model in fallback_models:
                     try:
                         fb_chain = _get_chain(fb_model)
-                        return await fb_chain.ainvoke({"messages": x["messages"]})
+                        out = await fb_chain.ainvoke({"messages": x["messages"]})
+                        prom.observe_fallback(model_id, fb_model)
+                        x["fallback_model"] = fb_model
+                        return out
                     except Exception as fb_err:
                         logger.error(f"Fallback {fb_model} failed: {fb_err}")
                         continue
@@ -548,23 +813,109 @@ def _sla_wrap(runnable):
     return RunnableLambda(_call)
 
 # ---------- Graph Nodes ----------
+# ---------- Sticky Routing ----------
+def _session_keys(state: RouterState) -> Tuple[Any, str]:
+    """(key of the previous turn's decision, prefix of this turn's key) for the conversation."""
+    scope = state.get("api_key_id") or "anonymous"
+    if state.get("conversation_id"):
+        key = f"id:{scope}:{state['conversation_id']}"
+        return key, key
+    return sessions.prefix_keys(state["messages"], scope)
+
+def _apply_sticky(meta: RoutingMeta, previous: sessions.StickyRoute) -> RoutingMeta:
+    """
+    Keep the conversation's previous task/complexity unless this turn changes it meaningfully:
+    a different task classified with at least STICKY_SWITCH_CONFIDENCE, or a higher
+    complexity (a conversation can escalate but is not downgraded mid-session).
+    """
+    if meta.task != previous.task and meta.confidence >= sessions.SWITCH_CONFIDENCE:
+        logger.info(f"Sticky route changed: {previous.task} -> {meta.task} (confidence {meta.confidence:.2f})")
+        return meta
+    levels = ["low", "medium", "high", "critical"]
+    if meta.task == previous.task and levels.index(meta.complexity) > levels.index(previous.complexity):
+        return meta
+    meta.task = previous.task
+    meta.complexity = previous.complexity
+    meta.confidence = max(meta.confidence, previous.confidence)
+    meta.sticky = True
+    return meta
+
+def _sticky_model(state: RouterState, routing_meta: RoutingMeta) -> Any:
+    """The model that served the previous turn, when the route is unchanged and it is still allowed."""
+    session = state.get("session") or {}
+    model_id = session.get("model_id")
+    if not routing_meta.sticky or model_id not in REG:
+        return None
+    if (session.get("task"), session.get("complexity")) != (routing_meta.task, routing_meta.complexity):
+        return None
+    if REG[model_id].get("provider") == "openai" and not state.get("cloud_available"):
+        return None
+    if not _within_budget(model_id, routing_meta, state.get("budget")) or not _fits_context(model_id, routing_meta):
+        return None
+    return model_id
+
+def _remember_route(state: RouterState, model_id: str, output: str):
+    """Store this turn's decision under the key the conversation's next turn will look up."""
+    session = state.get("session")
+    if not session:
+        return
+    key = session["key"] if state.get("conversation_id") else sessions.chain_key(session["key"], "assistant", output)
+    sessions.get_store().put(key, sessions.StickyRoute(
+        task=session["task"],
+        complexity=session["complexity"],
+        confidence=session["confidence"],
+        model_id=model_id,
+        turns=session["turns"],
+    ))
+
 def _node_classify(state: RouterState) -> RouterState:
     """Classify the prompt and determine routing metadata."""
+    started = time.perf_counter()
     msgs = state["messages"]
     
     # Determine cloud availability ONCE at request start
     # This combines: config gate + env gate + key gate + auth status cache
     cloud_available = _is_cloud_available() and is_cloud_enabled()
     
+    # Rolling spend windows (global / per API key): degrade to local when exhausted
+    spend_limited = spend_exhausted(state.get("api_key_id")) if cloud_available else []
+    if spend_limited:
+        logger.warning(f"Spend limit reached ({', '.join(spend_limited)}): routing to local models")
+        cloud_available = False
+    
     logger.info(f"Request start: cloud_available={cloud_available}")
     
-    # Automatic classification
-    routing_meta = classify_prompt(msgs)
+    # Automatic classification (learned / semantic stages when the heuristic is unsure)
+    routing_meta = classify_prompt_local(msgs)
     
-    # Refine with LLM if enabled and uncertain (only if cloud is available)
-    if cloud_available:
+    # Sticky routing: keep the conversation's previous route unless this turn changes it
+    previous, session_key = None, None
+    if sessions.ENABLED:
+        lookup_key, session_key = _session_keys(state)
+        previous = sessions.get_store().get(lookup_key)
+        if previous:
+            routing_meta = _apply_sticky(routing_meta, previous)
+    
+    # Refine with LLM if enabled and still uncertain (only if cloud is available)
+    if cloud_available and not routing_meta.sticky:
         routing_meta = classify_prompt_with_llm(msgs, routing_meta)
     
+    # Decision stored for the next turn (before the per-request overrides below)
+    session = None
+    if session_key:
+        session = {
+            "key": session_key,
+            "task": routing_meta.task,
+            "complexity": routing_meta.complexity,
+            "confidence": routing_meta.confidence,
+            "turns": previous.turns + 1 if previous else 1,
+            "model_id": previous.model_id if previous else None,
+        }
+    
+    # Smallest prompt the compact stage can produce (lets long histories stay local)
+    if compaction.ENABLED:
+        routing_meta.compacted_tokens = compaction.min_prompt_tokens(msgs)
+    
     # Apply legacy overrides if present
     if state.get("critical", False):
         routing_meta.complexity = "critical"
@@ -580,8 +931,14 @@ def _node_classify(state: RouterState) -> RouterState:
         logger.info(f"Cloud unavailable: applying complexity_boost for {routing_meta.complexity} task")
     
     result = {"routing_meta": asdict(routing_meta), "cloud_available": cloud_available}
+    if session:
+        result["session"] = session
+    if spend_limited:
+        result["spend_limited"] = spend_limited
     if complexity_boosted:
         result["routing_meta"]["complexity_boosted"] = True
+    if not state.get("_latency_start"):
+        result["_latency_start"] = started
     
     return result
 
@@ -590,7 +947,11 @@ def _node_route(state: RouterState) -> RouterState:
     routing_meta_dict = state.get("routing_meta", {})
     routing_meta = RoutingMeta(**routing_meta_dict) if routing_meta_dict else classify_prompt(state["messages"])
     
-    model_id = select_model_from_policy(routing_meta, state.get("budget"))
+    # Same route as the previous turn: stay on its model (no GPU swap, Ollama prefix cache reuse)
+    model_id = _sticky_model(state, routing_meta) or select_model_from_policy(
+        routing_meta, state.get("budget"), state.get("cloud_available")
+    )
+    prom.observe_decision(routing_meta.task, routing_meta.complexity, model_id)
     
     return {"model_id": model_id, "attempts": [{"model": model_id, "status": "pending"}]}
 
@@ -622,13 +983,105 @@ def _evaluate_response(task: str, text: str) -> Tuple[bool, str]:
     return True, "ok"
 
 
+async def _on_local_gpu(model_id: str, func, *args):
+    """Run func on the GPU lane of the least-loaded Ollama endpoint serving model_id."""
+    model_name = REG.get(model_id, {}).get("name", model_id)
+    get_warmup_manager().record_demand(model_name)
+    async with get_ollama_pool().lease(model_name) as endpoint:
+        return await run_on_gpu(func, *args, lane=endpoint.lane if endpoint else None, model=model_name)
+
+async def _summarize_history(previous: str, messages: List[Dict[str, str]], max_tokens: int) -> str:
+    """LLM summarizer for history compaction (HISTORY_SUMMARY_MODE=llm)."""
+    model_id = os.getenv("HISTORY_SUMMARY_MODEL", "local-chat")
+    transcript = join_messages(messages)
+    if previous:
+        transcript = f"Earlier summary:\n{previous}\n\nNew messages:\n{transcript}"
+    prompt = (
+        f"Summarize this conversation in at most {max_tokens} tokens. Keep decisions, "
+        f"requirements, file names, identifiers and open questions. No preamble.\n\n{transcript}"
+    )
+    chain = _get_chain(model_id)
+    with tracing.span("summarize", model=model_id):
+        if REG.get(model_id, {}).get("provider", "ollama") == "ollama":
+            out = await _on_local_gpu(model_id, chain.ainvoke, {"messages": [{"role": "user", "content": prompt}]})
+        else:
+            out = await chain.ainvoke({"messages": [{"role": "user", "content": prompt}]})
+    return str(out).strip()
+
+if compaction.SUMMARY_MODE == "llm":
+    compaction.set_summarizer(_summarize_history)
+
+async def _node_compact(state: RouterState) -> RouterState:
+    """Summarize older turns when the history is over the selected model's target."""
+    model_id = state.get("model_id", "")
+    meta = REG.get(model_id, {})
+    if not compaction.applies_to(meta):
+        return {}
+    
+    target = compaction.target_tokens(meta, context_window(model_id))
+    if not target:
+        return {}
+    
+    try:
+        messages, stats = await compaction.get_compactor().compact(
+            state["messages"], target, meta.get("name", model_id)
+        )
+    except Exception as e:
+        logger.warning(f"History compaction failed, sending full history: {e}")
+        return {}
+    
+    if not stats.tokens_saved:
+        return {}
+    
+    logger.info(
+        f"Compacted history for {model_id}: {stats.tokens_before} -> {stats.tokens_after} tokens "
+        f"({stats.summarized_messages} messages summarized, cache={stats.summary_cache})"
+    )
+    prom.observe_compaction(model_id, stats.tokens_saved, stats.summary_cache)
+    return {"messages": messages, "compaction": compaction.stats_dict(stats)}
+
+
+async def _invoke_timed(runnable, payload: Dict[str, Any], provider: str, timings: Dict[str, float]):
+    """
+    Invoke a model chain, accumulating GPU queue wait and provider time (ms).
+    Only local models (Ollama) go through the GPU queue, on the lane of the
+    endpoint leased from the Ollama pool.
+    """
+    t_enqueue = time.perf_counter()
+    started = {"t": t_enqueue}
+
+    async def _run(x):
+        started["t"] = time.perf_counter()
+        return await runnable.ainvoke(x)
+
+    try:
+        if provider == "ollama":
+            return await _on_local_gpu(payload.get("model_id"), _run, payload)
+        return await _run(payload)
+    finally:
+        t_end = time.perf_counter()
+        queue_wait = started["t"] - t_enqueue
+        provider_time = t_end - started["t"]
+        if provider == "ollama":
+            tracing.record_span("gpu_queue", t_enqueue, started["t"], model=payload.get("model_id"))
+        tracing.record_span("provider", started["t"], t_end, model=payload.get("model_id"), provider=provider)
+        timings["queue_wait"] += queue_wait * 1000
+        timings["provider"] += provider_time * 1000
+        prom.observe_attempt(provider, payload.get("model_id"), queue_wait, provider_time)
+
+
+def _count_usage(messages: List[Dict[str, Any]], output: str, model_name: str) -> Tuple[int, int]:
+    """(prompt tokens, completion tokens) with the served model's tokenizer."""
+    return count_messages(messages, model_name), count_text(output, model_name)
+
+
 async def _node_invoke(state: RouterState) -> RouterState:
     """Invoke the selected model with quality gating and fallback."""
-    wrapped = _sla_wrap(BRANCH)
     current_model = state.get("model_id", "llama-3.1-8b-instruct")
     
     # Get cloud_available from state (determined once in _node_classify)
     cloud_available = state.get("cloud_available", False)
+    wrapped = _sla_wrap(BRANCH, cloud_available)
     
     # Get initial routing meta for policy lookup
     routing_meta_dict = state.get("routing_meta", {})
@@ -642,6 +1095,7 @@ async def _node_invoke(state: RouterState) -> RouterState:
     escalation_reason = None
     
     attempts_log = state.get("attempts", [])
+    timings = {"queue_wait": 0.0, "provider": 0.0}
     
     # Loop for retry/escalation
     while attempt_count < max_attempts:
@@ -654,15 +1108,13 @@ async def _node_invoke(state: RouterState) -> RouterState:
             meta = REG.get(current_model, {})
             provider = meta.get("provider", "ollama")
             
-            if provider == "ollama":
-                # Run with GPU Queue limits
-                out_chain = await run_on_gpu(
-                    wrapped.ainvoke, 
-                    {"messages": state["messages"], "model_id": current_model}
-                )
-            else:
-                # Cloud/API runs directly without blocking GPU queue
-                out_chain = await wrapped.ainvoke({"messages": state["messages"], "model_id": current_model})
+            # Local runs with GPU Queue limits; Cloud/API runs directly without blocking the queue
+            payload = {"messages": state["messages"], "model_id": current_model, "cloud_available": cloud_available}
+            out_chain = await _invoke_timed(wrapped, payload, provider, timings)
+            if payload.get("fallback_model"):
+                # Served by an SLA fallback: bill and report the model that answered
+                attempts_log.append({"model": current_model, "status": "fallback"})
+                current_model = payload["fallback_model"]
             
             out_text = str(out_chain) 
             
@@ -700,6 +1152,10 @@ async def _node_invoke(state: RouterState) -> RouterState:
                     if cand_meta.get("provider") == "openai" and not cloud_available:
                         logger.info(f"Skipping cloud escalation to {candidate}: cloud_available=False")
                         continue
+                    if not _within_budget(candidate, routing_meta, state.get("budget")):
+                        continue
+                    if not _fits_context(candidate, routing_meta):
+                        continue
                     next_model = candidate
                     break
             except ValueError:
@@ -707,6 +1163,7 @@ async def _node_invoke(state: RouterState) -> RouterState:
                 
             if next_model:
                 logger.info(f"Escalating from {current_model} to {next_model}")
+                prom.observe_escalation(reason)
                 current_model = next_model
                 escalated = True
                 escalation_reason = reason
@@ -732,6 +1189,7 @@ async def _node_invoke(state: RouterState) -> RouterState:
                 # Fallback to local immediately if possible, but usually auth failure is fatal for cloud
                 if _fallback_enabled():
                      logger.warning("Attempting fallback to local-code due to cloud auth failure.")
+                     prom.observe_fallback(current_model, "local-code")
                      wrapped = _get_chain("local-code") # Force local
                      continue
                 break
@@ -752,30 +1210,42 @@ async def _node_invoke(state: RouterState) -> RouterState:
             break
     
     # Build usage/telemetry
-    prompt = join_messages(state["messages"])
-    latency_start = state.get("_latency_start", time.perf_counter())
+    latency_start = state.get("_latency_start") or time.perf_counter()
+    elapsed_ms = (time.perf_counter() - latency_start) * 1000
     
     # Ensure usage dict is robust
     out_str = str(final_out) if final_out else ""
     
+    # Count with the served model's tokenizer (falls back to len/4 when unavailable)
+    provider_model = REG.get(current_model, {}).get("name", current_model)
+    # (off the event loop: a new conversation tokenizes its whole history)
+    prompt_tokens, completion_tokens = await asyncio.to_thread(
+        _count_usage, state["messages"], out_str, provider_model
+    )
+    
+    if final_status != "failed" and not isinstance(final_out, dict):
+        _remember_route(state, current_model, out_str)
+    
     usage = {
-        "prompt_tokens_est": est_tokens(prompt),
-        "completion_tokens_est": est_tokens(out_str),
-        "total_tokens_est": est_tokens(prompt) + est_tokens(out_str),
+        "prompt_tokens_est": prompt_tokens,
+        "completion_tokens_est": completion_tokens,
+        "total_tokens_est": prompt_tokens + completion_tokens,
         "resolved_model_id": current_model,
         "config_path": CONFIG_PATH,
-        "latency_ms_router": int((time.perf_counter() - latency_start) * 1000),
+        "latency_ms_router": int(elapsed_ms),
         "routing_meta": asdict(routing_meta),
         "attempts": attempts_log,
         "classifier_used": routing_meta.classifier_used,
         "cloud_available": cloud_available,  # Use state value instead of calling function
         "escalated": escalated,
-        "escalation_reason": escalation_reason
+        "escalation_reason": escalation_reason,
+        "spend_limited": state.get("spend_limited", []),
+        "compaction": state.get("compaction"),
     }
     
     # ---------- METRICS & LOGGING ----------
     try:
-        tier = _get_tier_from_model(current_model)
+        tier = pricing_tier(provider_model, REG.get(current_model, {}).get("provider"))
         price_per_1m = PRICING_PER_1M.get(tier, 5.0)
         total_tokens = usage["total_tokens_est"]
         cost_usd = (total_tokens / 1_000_000) * price_per_1m
@@ -792,11 +1262,29 @@ async def _node_invoke(state: RouterState) -> RouterState:
             "cost_est_usd": round(cost_usd, 6),
             "status": final_status,
             "escalated": escalated,
-            "cloud_available": cloud_available  # Added to structured logs
+            "cloud_available": cloud_available,  # Added to structured logs
+            "api_key_id": state.get("api_key_id") or "anonymous",
+            "queue_wait_ms": round(timings["queue_wait"], 2),
+            "provider_ms": round(timings["provider"], 2),
+            "prompt_tokens": prompt_tokens,
+            "prompt_tokens_saved": (state.get("compaction") or {}).get("tokens_saved", 0),
         }
         
         # Log to stderr (for journalctl)
-        logger.info(f"METRIC: {json.dumps(metric_event)}")
+        logger.info(f"METRIC: {dumps_str(metric_event)}")
+        
+        # Rolling aggregates for /debug/metrics (+ append to logs/metrics.jsonl)
+        record_event(metric_event)
+        await arecord_spend(cost_usd, metric_event["api_key_id"])
+        
+        prom.observe_usage(tier, cost_usd, usage["prompt_tokens_est"], usage["completion_tokens_est"])
+        
+        # Latency percentiles per model/task/complexity/tier
+        overhead_ms = elapsed_ms - timings["queue_wait"] - timings["provider"]
+        observe_latency(
+            {"routing_overhead": max(0.0, overhead_ms), **timings},
+            {"model": current_model, "task": routing_meta.task, "complexity": routing_meta.complexity, "tier": tier},
+        )
         
     except Exception as e:
         logger.error(f"Metrics logging failed: {e}")
@@ -804,6 +1292,19 @@ async def _node_invoke(state: RouterState) -> RouterState:
     return {"output": final_out, "usage": usage, "attempts": attempts_log}
 
 # ---------- Graph Builder ----------
+def _traced(name: str, node):
+    """Wrap a graph node in a tracing span (no-op when tracing is off)."""
+    if inspect.iscoroutinefunction(node):
+        async def _async_node(state: RouterState) -> RouterState:
+            with tracing.span(name):
+                return await node(state)
+        return _async_node
+
+    def _node(state: RouterState) -> RouterState:
+        with tracing.span(name):
+            return node(state)
+    return _node
+
 def build_compiled_router():
     """
     Build the compiled LangGraph router.
@@ -811,18 +1312,24 @@ def build_compiled_router():
     Graph flow:
     1. classify -> Automatic task/complexity detection
     2. route -> Policy-based model selection
-    3. invoke -> Model invocation with SLA monitoring
+    3. compact -> History compaction (only if HISTORY_COMPACTION_ENABLED=1)
+    4. invoke -> Model invocation with SLA monitoring
     """
     g = StateGraph(RouterState)
     
-    g.add_node("classify", _node_classify)
-    g.add_node("route", _node_route)
-    g.add_node("invoke", _node_invoke)
+    g.add_node("classify", _traced("classify", _node_classify))
+    g.add_node("route", _traced("route", _node_route))
+    g.add_node("invoke", _traced("invoke", _node_invoke))
     
-    # Linear flow: classify -> route -> invoke -> END
+    # Linear flow: classify -> route -> [compact ->] invoke -> END
     g.set_entry_point("classify")
     g.add_edge("classify", "route")
-    g.add_edge("route", "invoke")
+    if compaction.ENABLED:
+        g.add_node("compact", _traced("compact", _node_compact))
+        g.add_edge("route", "compact")
+        g.add_edge("compact", "invoke")
+    else:
+        g.add_edge("route", "invoke")
     g.add_edge("invoke", END)
     
     return g.compile()
@@ -833,7 +1340,7 @@ def debug_router_decision(messages: List[Dict[str, str]]) -> Dict[str, Any]:
     Debug helper: show what routing decision would be made for a prompt.
     Used by GET /debug/router_decision endpoint.
     """
-    routing_meta = classify_prompt(messages)
+    routing_meta = classify_prompt_local(messages)
     routing_meta = classify_prompt_with_llm(messages, routing_meta)
     
     model_id = select_model_from_policy(routing_meta)
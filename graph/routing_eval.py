@@ -0,0 +1,237 @@
+"""
+Routing accuracy and classifier throughput evaluation.
+
+Runs a labeled prompt corpus through classify_prompt_local (the heuristic plus
+the learned and semantic stages, as served) and select_model_from_policy and
+reports:
+- throughput (prompts/sec) and per-stage time (join, tokenize, classify, policy);
+- task / complexity accuracy with confusion matrices (gold -> predicted);
+- routing agreement: how often the predicted labels pick the same model the
+  gold labels would (a wrong label that routes to the same model costs nothing);
+- how often the LLM judge would be triggered (confidence below threshold).
+
+Corpus lines are JSON: {"id", "prompt" | "messages", "task", "complexity"}.
+Results carry the commit and hashes of the corpus and router config, so runs
+saved by scripts/bench_routing.py can be compared across commits.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from graph import router
+from graph.router import (
+    RoutingMeta,
+    classify_prompt,
+    classify_prompt_local,
+    join_messages,
+    select_model_from_policy,
+)
+from services.token_counter import count_messages, get_counter
+
+COMPLEXITIES = ["low", "medium", "high", "critical"]
+
+# Config from Env
+CORPUS_PATH = os.getenv("ROUTING_CORPUS", str(router.ROOT / "tests" / "routing" / "data" / "routing_corpus.jsonl"))
+
+
+def load_corpus(path: str = None) -> List[Dict[str, Any]]:
+    """Load and validate a labeled corpus; `prompt` is normalized to `messages`."""
+    path = path or CORPUS_PATH
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "messages" not in item:
+                item["messages"] = [{"role": "user", "content": item.pop("prompt")}]
+            if item.get("task") not in router.TASK_TYPES:
+                raise ValueError(f"{path}:{lineno}: unknown task {item.get('task')!r}")
+            if item.get("complexity") not in COMPLEXITIES:
+                raise ValueError(f"{path}:{lineno}: unknown complexity {item.get('complexity')!r}")
+            item.setdefault("id", f"line-{lineno}")
+            items.append(item)
+    return items
+
+
+def confusion_matrix(pairs: Iterable[tuple], labels: List[str]) -> Dict[str, Dict[str, int]]:
+    """gold -> predicted -> count, for the given label order (labels seen only in pairs are appended)."""
+    pairs = list(pairs)
+    labels = labels + sorted({label for pair in pairs for label in pair} - set(labels))
+    matrix = {gold: {pred: 0 for pred in labels} for gold in labels}
+    for gold, pred in pairs:
+        matrix[gold][pred] += 1
+    return matrix
+
+
+def _timing(samples: List[float]) -> Dict[str, float]:
+    """Microsecond summary of a list of durations in seconds."""
+    us = sorted(s * 1e6 for s in samples)
+    return {
+        "mean_us": round(statistics.fmean(us), 2),
+        "p50_us": round(us[len(us) // 2], 2),
+        "p95_us": round(us[min(len(us) - 1, int(len(us) * 0.95))], 2),
+    }
+
+
+def _sha(path: str) -> str:
+    try:
+        return hashlib.sha256(pathlib.Path(path).read_bytes()).hexdigest()[:12]
+    except OSError:
+        return "NA"
+
+
+def _git(*args) -> subprocess.CompletedProcess:
+    return subprocess.run(["git", *args], cwd=router.ROOT, capture_output=True, text=True, timeout=5)
+
+
+def _commit() -> str:
+    try:
+        out = _git("rev-parse", "--short", "HEAD")
+        dirty = _git("status", "--porcelain", "--untracked-files=no")
+        return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "") if out.returncode == 0 else "unknown"
+    except Exception:
+        return "unknown"
+
+
+def evaluate(corpus: List[Dict[str, Any]], repeat: int = 5, cloud_available: bool = True,
+             budget: Optional[str] = None, corpus_path: str = None,
+             heuristic_only: bool = False) -> Dict[str, Any]:
+    """
+    Run the corpus `repeat` times (timings) and score the predictions of the last pass.
+
+    Classification goes through classify_prompt_local, the pipeline the graph runs;
+    `heuristic_only` scores the keyword heuristic on its own.
+    """
+    if not corpus:
+        raise ValueError("Empty corpus")
+    stages: Dict[str, List[float]] = {"join": [], "tokenize": [], "classify": [], "policy": []}
+    counter = get_counter()
+    predictions: List[RoutingMeta] = []
+    models: List[str] = []
+    classify = classify_prompt if heuristic_only else classify_prompt_local
+
+    for _ in range(max(1, repeat)):
+        counter._cache.clear()  # Every pass sees a cold tokenizer cache, like new traffic
+        predictions, models = [], []
+        for item in corpus:
+            msgs = item["messages"]
+            t0 = time.perf_counter()
+            join_messages(msgs)
+            t1 = time.perf_counter()
+            count_messages(msgs)
+            t2 = time.perf_counter()
+            counter._cache.clear()  # classify tokenizes again; keep it cold
+            meta = classify(msgs)
+            t3 = time.perf_counter()
+            model_id = select_model_from_policy(meta, budget, cloud_available)
+            t4 = time.perf_counter()
+            stages["join"].append(t1 - t0)
+            stages["tokenize"].append(t2 - t1)
+            stages["classify"].append(t3 - t2)
+            stages["policy"].append(t4 - t3)
+            predictions.append(meta)
+            models.append(model_id)
+    # classify already joins and tokenizes; a routing decision is classify + policy
+    total = sum(stages["classify"]) + sum(stages["policy"])
+
+    threshold = router.CLASSIFIER_CFG.get("heuristic_confidence_threshold", 0.7)
+    task_pairs, complexity_pairs, misses = [], [], []
+    task_ok = complexity_ok = both_ok = routing_ok = judge = 0
+    for item, meta, model_id in zip(corpus, predictions, models):
+        gold_meta = RoutingMeta(
+            task=item["task"], complexity=item["complexity"],
+            prompt_tokens=meta.prompt_tokens, requires_long_context=meta.requires_long_context,
+        )
+        gold_model = select_model_from_policy(gold_meta, budget, cloud_available)
+        task_pairs.append((item["task"], meta.task))
+        complexity_pairs.append((item["complexity"], meta.complexity))
+        t_ok, c_ok = item["task"] == meta.task, item["complexity"] == meta.complexity
+        task_ok += t_ok
+        complexity_ok += c_ok
+        both_ok += t_ok and c_ok
+        routing_ok += gold_model == model_id
+        judge += meta.confidence < threshold
+        if not (t_ok and c_ok):
+            misses.append({
+                "id": item["id"],
+                "gold": f"{item['task']}/{item['complexity']}",
+                "pred": f"{meta.task}/{meta.complexity}",
+                "confidence": round(meta.confidence, 2),
+                "model": model_id,
+                "gold_model": gold_model,
+            })
+
+    n = len(corpus)
+    return {
+        "meta": {
+            "commit": _commit(),
+            "ts": time.time(),
+            "corpus": str(corpus_path or CORPUS_PATH),
+            "corpus_sha": _sha(corpus_path or CORPUS_PATH),
+            "config_sha": _sha(router.CONFIG_PATH),
+            "items": n,
+            "repeat": max(1, repeat),
+            "cloud_available": cloud_available,
+            "budget": budget or "default",
+            "classifier": "heuristic" if heuristic_only else "local",
+            "tokenizer": counter.stats().get("backend"),
+            "python": platform.python_version(),
+        },
+        "throughput": {"prompts_per_sec": round(n * max(1, repeat) / total, 1) if total else None},
+        "stages": {name: _timing(samples) for name, samples in stages.items()},
+        "accuracy": {
+            "task": round(task_ok / n, 4),
+            "complexity": round(complexity_ok / n, 4),
+            "both": round(both_ok / n, 4),
+            "routing": round(routing_ok / n, 4),
+        },
+        "judge": {
+            "enabled": bool(router.CLASSIFIER_CFG.get("llm_assisted", False)),
+            "threshold": threshold,
+            "trigger_rate": round(judge / n, 4),
+        },
+        "confusion": {
+            "task": confusion_matrix(task_pairs, list(router.TASK_TYPES)),
+            "complexity": confusion_matrix(complexity_pairs, list(COMPLEXITIES)),
+        },
+        "misses": misses,
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Human-readable deltas between two evaluate() results."""
+    lines = []
+    for key in ("corpus_sha", "config_sha", "cloud_available", "budget", "classifier", "tokenizer"):
+        if old["meta"].get(key) != new["meta"].get(key):
+            lines.append(
+                f"! {key} differs ({old['meta'].get(key)} -> {new['meta'].get(key)}): "
+                "results are not directly comparable"
+            )
+    for metric, value in new["accuracy"].items():
+        before = old["accuracy"].get(metric)
+        if before is not None:
+            lines.append(f"accuracy.{metric:<11} {before:.3f} -> {value:.3f} ({value - before:+.3f})")
+    before, after = old["judge"]["trigger_rate"], new["judge"]["trigger_rate"]
+    lines.append(f"judge.trigger_rate   {before:.3f} -> {after:.3f} ({after - before:+.3f})")
+    before, after = old["throughput"]["prompts_per_sec"], new["throughput"]["prompts_per_sec"]
+    if before and after:
+        lines.append(f"prompts_per_sec      {before:.1f} -> {after:.1f} ({(after - before) / before:+.1%})")
+    for stage, timing in new["stages"].items():
+        prev = old["stages"].get(stage)
+        if prev and prev["p50_us"]:
+            change = (timing["p50_us"] - prev["p50_us"]) / prev["p50_us"]
+            lines.append(f"{stage + '.p50_us':<20} {prev['p50_us']:.1f} -> {timing['p50_us']:.1f} ({change:+.1%})")
+    old_misses = {m["id"] for m in old.get("misses", [])}
+    new_misses = {m["id"] for m in new.get("misses", [])}
+    if new_misses - old_misses:
+        lines.append(f"newly misclassified: {', '.join(sorted(new_misses - old_misses))}")
+    if old_misses - new_misses:
+        lines.append(f"fixed: {', '.join(sorted(old_misses - new_misses))}")
+    return lines
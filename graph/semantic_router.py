@@ -0,0 +1,279 @@
+"""
+Embedding-based semantic router: nearest task/complexity centroid.
+
+Keyword matching misses paraphrases and non-English prompts. This stage embeds
+the latest user message with a local Ollama embedding model and looks up the
+nearest centroid in an in-memory index built from config/semantic_examples.yaml
+(one centroid per task/complexity pair, mean of the normalized example vectors).
+The cosine similarity to that centroid is the confidence.
+
+- Embeddings go through POST /api/embed. Index builds send examples in batches;
+  concurrent requests are micro-batched (callers arriving within
+  SEMANTIC_BATCH_WINDOW_MS share one call) and cached per text.
+- The index builds in the background at startup; until it is ready, or while
+  the embedding endpoint is failing, the stage is skipped rather than adding
+  latency. A failed build is retried in the background by the first lookup
+  after SEMANTIC_RETRY_SEC, as are failed lookups once the index is ready.
+- reload() re-reads the example file and swaps in a new index at runtime.
+"""
+import hashlib
+import logging
+import os
+import pathlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import yaml
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency: the stage is disabled without it
+    np = None
+
+logger = logging.getLogger("ai-router.semantic")
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+# Config from Env
+EMBED_TIMEOUT_SEC = float(os.getenv("SEMANTIC_EMBED_TIMEOUT_SEC", "2"))
+BATCH_WINDOW_MS = float(os.getenv("SEMANTIC_BATCH_WINDOW_MS", "2"))
+BUILD_BATCH_SIZE = int(os.getenv("SEMANTIC_BUILD_BATCH_SIZE", "32"))
+CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+RETRY_SEC = float(os.getenv("SEMANTIC_RETRY_SEC", "60"))
+MAX_CHARS = int(os.getenv("SEMANTIC_MAX_CHARS", "2000"))
+
+Embedder = Callable[[List[str]], List[List[float]]]
+
+
+@dataclass
+class SemanticMatch:
+    task: str
+    complexity: str
+    similarity: float
+    margin: float  # Similarity gap to the best centroid of a different task
+
+
+class OllamaEmbedder:
+    """POST /api/embed over one keep-alive client."""
+
+    def __init__(self, model: str, base_url: str, timeout: float = EMBED_TIMEOUT_SEC):
+        import httpx
+
+        self.model = model
+        self.client = httpx.Client(base_url=base_url.rstrip("/"), timeout=timeout)
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        resp = self.client.post("/api/embed", json={"model": self.model, "input": texts})
+        resp.raise_for_status()
+        return resp.json()["embeddings"]
+
+
+class _MicroBatcher:
+    """Callers arriving within `window` seconds share one embedding call."""
+
+    def __init__(self, embed: Embedder, window: float):
+        self.embed = embed
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, Future]] = []
+        self._leading = False
+
+    def submit(self, text: str, timeout: float) -> List[float]:
+        fut: Future = Future()
+        with self._lock:
+            self._pending.append((text, fut))
+            leader = not self._leading
+            self._leading = True
+        if leader:
+            if self.window > 0:
+                time.sleep(self.window)
+            with self._lock:
+                batch, self._pending, self._leading = self._pending, [], False
+            try:
+                vectors = self.embed([t for t, _ in batch])
+                for (_, f), v in zip(batch, vectors):
+                    f.set_result(v)
+            except Exception as e:
+                for _, f in batch:
+                    f.set_exception(e)
+        return fut.result(timeout=timeout)
+
+
+def _normalize(m):
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.where(norms == 0, 1.0, norms)
+
+
+def _match(sims, labels: List[Tuple[str, str]]) -> SemanticMatch:
+    """Best centroid and its margin over the best centroid of another task."""
+    best = int(sims.argmax())
+    task, complexity = labels[best]
+    others = [s for (t, _), s in zip(labels, sims) if t != task]
+    return SemanticMatch(task, complexity, float(sims[best]), float(sims[best] - max(others)) if others else 1.0)
+
+
+def load_examples(path: str) -> List[Tuple[str, str, str]]:
+    """(text, task, complexity) rows from the example YAML (task -> complexity -> [texts])."""
+    with open(path, encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    return [
+        (str(text), task, complexity)
+        for task, levels in data.items()
+        for complexity, texts in (levels or {}).items()
+        for text in texts or []
+    ]
+
+
+class SemanticRouter:
+    def __init__(self, cfg: Dict[str, Any], embed: Optional[Embedder] = None):
+        self.cfg = cfg
+        self.examples_path = str(ROOT / cfg.get("examples", "config/semantic_examples.yaml"))
+        if embed is None:
+            from services.ollama_pool import resolve_base_urls
+            embed = OllamaEmbedder(cfg.get("model", "nomic-embed-text"), resolve_base_urls()[0])
+        self.embed_batch = embed
+        self.batcher = _MicroBatcher(embed, BATCH_WINDOW_MS / 1000)
+        self.labels: List[Tuple[str, str]] = []
+        self.centroids = None
+        self.built_at: Optional[float] = None
+        self.build_ms: Optional[float] = None
+        self.examples = 0
+        self.last_error: Optional[str] = None
+        self._failed_at = 0.0
+        self._build_failed_at: Optional[float] = None
+        self._build_thread: Optional[threading.Thread] = None
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.centroids is not None
+
+    # ---------- Index ----------
+    def build(self) -> Dict[str, Any]:
+        """Embed every example and swap in the new centroid index."""
+        if np is None:
+            raise RuntimeError("numpy is required for the semantic router")
+        with self._build_lock:
+            t0 = time.perf_counter()
+            rows = load_examples(self.examples_path)
+            if not rows:
+                raise ValueError(f"No examples in {self.examples_path}")
+            vectors = []
+            for i in range(0, len(rows), BUILD_BATCH_SIZE):
+                vectors += self.embed_batch([text for text, _, _ in rows[i:i + BUILD_BATCH_SIZE]])
+            vecs = _normalize(np.asarray(vectors, dtype=np.float32))
+            groups: "OrderedDict[Tuple[str, str], List[int]]" = OrderedDict()
+            for i, (_, task, complexity) in enumerate(rows):
+                groups.setdefault((task, complexity), []).append(i)
+            centroids = _normalize(np.stack([vecs[idx].mean(axis=0) for idx in groups.values()]))
+            with self._lock:
+                self.labels, self.centroids = list(groups), centroids
+            self.examples = len(rows)
+            self.built_at = time.time()
+            self.build_ms = round((time.perf_counter() - t0) * 1000, 1)
+            self.last_error = None
+            logger.info(f"Semantic index built: {len(rows)} examples -> {len(groups)} centroids in {self.build_ms} ms")
+            return self.status()
+
+    def reload(self) -> Dict[str, Any]:
+        """Rebuild from the example file (the old index keeps serving until the new one is ready)."""
+        return self.build()
+
+    def start(self) -> Optional[threading.Thread]:
+        """
+        Build the index on a background thread (startup must not wait for embeddings).
+
+        Returns the build thread, or None when a build is already running.
+        """
+        def _run():
+            try:
+                self.build()
+                self._build_failed_at = None
+            except Exception as e:
+                self._build_failed_at = time.time()
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning(f"Semantic index build failed, retrying in {RETRY_SEC:.0f}s: {self.last_error}")
+        with self._lock:
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return None
+            self._build_thread = threading.Thread(target=_run, name="semantic-index", daemon=True)
+            self._build_thread.start()
+            return self._build_thread
+
+    # ---------- Lookup ----------
+    def _vector(self, text: str):
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            vec = self._cache.get(key)
+            if vec is not None:
+                self._cache.move_to_end(key)
+                return vec
+        vec = _normalize(np.asarray(self.batcher.submit(text, EMBED_TIMEOUT_SEC), dtype=np.float32))
+        with self._lock:
+            self._cache[key] = vec
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return vec
+
+    def classify(self, text: str) -> Optional[SemanticMatch]:
+        """Nearest centroid for `text`, or None when the index or embeddings are unavailable."""
+        if not self.ready:
+            failed_at = self._build_failed_at
+            if failed_at is not None and time.time() - failed_at >= RETRY_SEC:
+                self.start()  # Retry the failed build; this lookup still skips the stage
+            return None
+        if not text.strip():
+            return None
+        if time.time() - self._failed_at < RETRY_SEC:
+            return None
+        try:
+            vec = self._vector(text[:MAX_CHARS])
+        except Exception as e:
+            self._failed_at = time.time()
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.warning(f"Semantic embedding failed, skipping the stage for {RETRY_SEC:.0f}s: {self.last_error}")
+            return None
+        with self._lock:
+            labels, centroids = self.labels, self.centroids
+        return _match(centroids @ vec, labels)
+
+    def classify_many(self, texts: Sequence[str]) -> List[Optional[SemanticMatch]]:
+        """Batch lookup: one embedding call for all texts (no cache, no micro-batching)."""
+        if not self.ready:
+            return [None] * len(texts)
+        with self._lock:
+            labels, centroids = self.labels, self.centroids
+        vecs = _normalize(np.asarray(self.embed_batch([t[:MAX_CHARS] for t in texts]), dtype=np.float32))
+        return [_match(row, labels) for row in vecs @ centroids.T]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "model": self.cfg.get("model", "nomic-embed-text"),
+            "examples": self.examples,
+            "centroids": len(self.labels),
+            "built_at": self.built_at,
+            "build_ms": self.build_ms,
+            "cached": len(self._cache),
+            "last_error": self.last_error,
+        }
+
+
+_router: Optional[SemanticRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router(cfg: Dict[str, Any] = None) -> Optional[SemanticRouter]:
+    """Singleton for the `classifier.semantic` config (None when disabled or numpy is missing)."""
+    global _router
+    if _router is None and cfg and cfg.get("enabled") and np is not None:
+        with _router_lock:
+            if _router is None:
+                _router = SemanticRouter(cfg)
+    return _router
@@ -3,6 +3,10 @@ import os
 from langchain_core.runnables import RunnableLambda
 from langchain_ollama import ChatOllama
 
+from services import router_metrics as prom
+from services.model_warmup import get_manager as get_warmup_manager
+from services.ollama_pool import current_endpoint, get_pool, resolve_base_urls
+
 
 def validate_model_id(model_name: str) -> bool:
     """
@@ -27,15 +31,33 @@ def validate_model_id(model_name: str) -> bool:
     except Exception:
         return False
 
-def make_ollama(model: str, temperature: float = 0.1):
-    base_url = os.getenv("OLLAMA_BASE_URL") or os.getenv("OLLAMA_URL") or "http://localhost:11434"
+def _env_prefix(model: str) -> str:
+    """Configuration tier (Coder vs Instruct) for a local model name."""
+    return "OLLAMA_CODER" if model == os.getenv("OLLAMA_CODER_MODEL") else "OLLAMA_INSTRUCT"
+
+def resolve_num_ctx(model: str, num_ctx: int = None) -> int:
+    """
+    Context window sent to Ollama as num_ctx.
+    Precedence: tier env override > registry context_window > OLLAMA_NUM_CTX > 4096.
+    """
+    override = os.getenv(f"{_env_prefix(model)}_NUM_CTX")
+    if override:
+        return int(override)
+    if num_ctx:
+        return int(num_ctx)
+    return int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+
+def make_ollama(
+    model: str, temperature: float = 0.1, num_ctx: int = None, base_urls: list = None, registry_url: str = None
+):
+    # One client per endpoint; the pool picks the least-loaded healthy one per request
+    urls = get_pool().register(model, resolve_base_urls(base_urls, registry_url))
     
     # Determine configuration tier (Coder vs Instruct)
-    is_coder = model == os.getenv("OLLAMA_CODER_MODEL")
-    prefix = "OLLAMA_CODER" if is_coder else "OLLAMA_INSTRUCT"
+    prefix = _env_prefix(model)
     
     # Load Tier-specific parameters
-    num_ctx = int(os.getenv(f"{prefix}_NUM_CTX", os.getenv("OLLAMA_NUM_CTX", "4096")))
+    num_ctx = resolve_num_ctx(model, num_ctx)
     num_predict = int(os.getenv(f"{prefix}_NUM_PREDICT", os.getenv("OLLAMA_NUM_PREDICT", "-1")))
     
     env_temp = os.getenv(f"{prefix}_TEMPERATURE")
@@ -47,18 +69,46 @@ def make_ollama(model: str, temperature: float = 0.1):
     seed = int(os.getenv("OLLAMA_SEED", "42"))
     keep_alive = os.getenv(f"{prefix}_KEEP_ALIVE") or os.getenv("OLLAMA_KEEP_ALIVE", None)
 
-    llm = ChatOllama(
-        model=model,
-        base_url=base_url,
-        temperature=temperature,
-        num_ctx=num_ctx,
-        num_predict=num_predict,
-        top_p=top_p,
-        repeat_penalty=repeat_penalty,
-        seed=seed,
-        keep_alive=keep_alive
-    )
+    llms = {
+        url: ChatOllama(
+            model=model,
+            base_url=url,
+            temperature=temperature,
+            num_ctx=num_ctx,
+            num_predict=num_predict,
+            top_p=top_p,
+            repeat_penalty=repeat_penalty,
+            seed=seed,
+            keep_alive=keep_alive
+        )
+        for url in urls
+    }
+
+    if len(llms) == 1:
+        llm = next(iter(llms.values()))
+    else:
+        def _select():
+            # Endpoint leased by the router (graph.router._invoke_timed), else least-loaded
+            url = current_endpoint()
+            if url not in llms:
+                ep = get_pool().pick(model)
+                url = ep.url if ep and ep.url in llms else urls[0]
+            return llms[url]
+
+        async def _acall(msgs):
+            return await _select().ainvoke(msgs)
+
+        llm = RunnableLambda(lambda msgs: _select().invoke(msgs), afunc=_acall)
 
     to_msgs = RunnableLambda(lambda x: x["messages"])
-    to_text = RunnableLambda(lambda m: getattr(m, "content", str(m)))
+    prom.add_local_models([model])
+
+    def _to_text(m):
+        # Ollama reports load_duration (ns); a large value means this call paid a cold load
+        load_ns = (getattr(m, "response_metadata", None) or {}).get("load_duration")
+        if load_ns:
+            get_warmup_manager().record_load(model, load_ns / 1e9)
+        return getattr(m, "content", str(m))
+
+    to_text = RunnableLambda(_to_text)
     return to_msgs | llm | to_text
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Per-request routing overhead microbenchmarks.
+
+Times each piece of the request path in-process, across prompt sizes from 10
+characters to 200k, so HTTP cost and routing cost can be told apart:
+  join_messages, classification_window, classify_prompt,
+  select_model_from_policy                                    (per size)
+  graph ainvoke against a null provider                       (per size)
+  POST /route through ASGI with all middleware                (per size)
+  JSON encode of the response / decode of the request body    (per size)
+  serialization layer vs stdlib json: response body and the
+  /v1/responses SSE frames, as a share of /route time          (per size)
+  graph compile, middleware overhead (/healthz vs a bare app) (once)
+
+Results are compared with a stored baseline (median per call); anything slower
+than --threshold (and above a small absolute noise floor) is flagged.
+
+Examples:
+  python scripts/bench_overhead.py                  # run, compare with logs/bench/overhead-baseline.json
+  python scripts/bench_overhead.py --save-baseline  # run and make this the new baseline
+  python scripts/bench_overhead.py --check          # exit 1 on regressions (CI)
+  python scripts/bench_overhead.py --sizes 10,1000 --quick
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Isolated, local-only environment: no cloud probes, metrics go to a temp dir
+_TMP = tempfile.mkdtemp(prefix="ai-router-bench-")
+os.environ.setdefault("AI_ROUTER_ENV", "test")
+os.environ.setdefault("ENABLE_OPENAI_FALLBACK", "0")
+os.environ.setdefault("METRICS_LOG_PATH", os.path.join(_TMP, "metrics.jsonl"))
+os.environ.setdefault("METRICS_DB_PATH", os.path.join(_TMP, "metrics.db"))
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(_TMP, "jobs.db"))
+
+BASELINE_PATH = "logs/bench/overhead-baseline.json"
+SIZES = [10, 100, 1_000, 10_000, 100_000, 200_000]
+NOISE_FLOOR_US = 5.0  # Ignore regressions smaller than this in absolute terms
+
+NULL_REPLY = "```python\ndef ok():\n    return True\n```\n- issue: none, fix applied"
+
+def make_prompt(size):
+    """Deterministic prompt of exactly `size` characters (mixed prose and code)."""
+    unit = "Please review this function for bugs. def add(a, b): return a + b  # TODO "
+    return (unit * (size // len(unit) + 1))[:size]
+
+def _clock(fn, min_time, rounds):
+    """Median and min seconds per call over `rounds` rounds of at least `min_time` each."""
+    fn()  # Warm-up
+    number, t = 1, 0.0
+    while True:  # Calibrate calls per round
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        t = time.perf_counter() - t0
+        if t >= min_time or number >= 1_000_000:
+            break
+        number *= 2 if t == 0 else max(2, min(10, int(min_time / t) + 1))
+    per_call = [t / number]
+    for _ in range(rounds - 1):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - t0) / number)
+    return {"median_us": round(statistics.median(per_call) * 1e6, 3), "min_us": round(min(per_call) * 1e6, 3), "calls": number * rounds}
+
+def _legacy_sse_frames(response_obj):
+    """/v1/responses frames as built before services/serialization.py (stdlib json per frame)."""
+    item = response_obj["output"][0]
+    text = item["content"][0]["text"]
+    events = [
+        ("response.created", {"response": {**response_obj, "status": "in_progress", "output": []}}),
+        ("response.output_item.added", {"output_index": 0, "item": {**item, "status": "in_progress", "content": []}}),
+        ("response.content_part.added", {"item_id": "item_0", "output_index": 0, "content_index": 0, "part": {"type": "output_text", "text": ""}}),
+        ("response.output_text.delta", {"item_id": "item_0", "output_index": 0, "content_index": 0, "delta": text}),
+        ("response.output_text.done", {"item_id": "item_0", "output_index": 0, "content_index": 0, "text": text}),
+        ("response.output_item.done", {"output_index": 0, "item": item}),
+        ("response.completed", {"response": response_obj}),
+    ]
+    return [f"event: {name}\ndata: {json.dumps({'type': name, 'sequence_number': seq, **data})}\n\n".encode()
+            for seq, (name, data) in enumerate(events)]
+
+def _aclock(loop, make_coro, min_time, rounds):
+    return _clock(lambda: loop.run_until_complete(make_coro()), min_time, rounds)
+
+@contextlib.contextmanager
+def null_provider():
+    """Replace every prebuilt chain with one that answers instantly (restored on exit)."""
+    from langchain_core.runnables import RunnableLambda
+
+    from graph import router
+
+    async def _reply(_):
+        return NULL_REPLY
+
+    saved = dict(router.CHAINS)
+    router.CHAINS.update({model_id: RunnableLambda(_reply) for model_id in router.REG})
+    try:
+        yield
+    finally:
+        router.CHAINS.clear()
+        router.CHAINS.update(saved)
+
+def run_suite(sizes=None, min_time=0.2, rounds=5):
+    from fastapi import FastAPI
+    from httpx import ASGITransport, AsyncClient
+
+    from app import main
+    from graph.router import (
+        build_compiled_router,
+        classification_window,
+        classify_prompt,
+        join_messages,
+        select_model_from_policy,
+    )
+    from services.serialization import dumps
+    from services.token_counter import get_counter
+
+    counter = get_counter()
+    api_key = os.getenv("AI_ROUTER_API_KEY")
+    headers = {"X-API-Key": api_key} if api_key else {}
+    results = {}
+    loop = asyncio.new_event_loop()
+
+    bare = FastAPI()
+    bare.get("/healthz")(lambda: {"ok": True})
+
+    async def _get(client, path):
+        return await client.get(path)
+
+    async def _post(client, path, body):
+        return await client.post(path, content=body, headers={**headers, "content-type": "application/json"})
+
+    app_client = AsyncClient(transport=ASGITransport(app=main.app), base_url="http://bench")
+    bare_client = AsyncClient(transport=ASGITransport(app=bare), base_url="http://bench")
+    limiter_enabled = main.limiter.enabled
+    main.limiter.enabled = False  # Time the request path, not 429s from the rate limiter
+    try:
+        with null_provider():
+            probe = loop.run_until_complete(_post(app_client, "/route", json.dumps({"messages": [{"content": "hi"}]})))
+            probe.raise_for_status()
+            results["graph_compile"] = _clock(build_compiled_router, min_time, rounds)
+            full = _aclock(loop, lambda: _get(app_client, "/healthz"), min_time, rounds)
+            base = _aclock(loop, lambda: _get(bare_client, "/healthz"), min_time, rounds)
+            results["asgi_healthz_app"] = full
+            results["asgi_healthz_bare"] = base
+            results["middleware_overhead"] = {"median_us": round(full["median_us"] - base["median_us"], 3)}
+
+            router_app = build_compiled_router()
+            for size in sizes or SIZES:
+                msgs = [{"role": "user", "content": make_prompt(size)}]
+                meta = classify_prompt(msgs)
+                state = {"messages": msgs, "budget": "balanced", "prefer_code": False, "critical": False, "api_key_id": "bench"}
+                body = json.dumps({"messages": msgs}).encode()
+                response = {"output": NULL_REPLY + make_prompt(size), "usage": {"resolved_model_id": "local-code", "prompt_tokens_est": size // 4}}
+                response_obj = {
+                    "id": "resp-1", "object": "response", "created": 1, "status": "completed", "model": "local-code",
+                    "output": [{"id": "item_0", "type": "message", "role": "assistant", "status": "completed",
+                                "content": [{"type": "output_text", "text": response["output"]}]}],
+                    "usage": {"input_tokens": size // 4, "output_tokens": size // 4, "total_tokens": size // 2},
+                }
+
+                def classify():
+                    counter._cache.clear()  # New prompts miss the tokenizer cache
+                    classify_prompt(msgs)
+
+                results[f"join_messages[{size}]"] = _clock(lambda: join_messages(msgs), min_time, rounds)
+                results[f"classification_window[{size}]"] = _clock(lambda: classification_window(msgs), min_time, rounds)
+                results[f"classify_prompt[{size}]"] = _clock(classify, min_time, rounds)
+                results[f"select_model_from_policy[{size}]"] = _clock(lambda: select_model_from_policy(meta), min_time, rounds)
+                results[f"json_dumps_response[{size}]"] = _clock(lambda: json.dumps(response), min_time, rounds)
+                results[f"json_loads_request[{size}]"] = _clock(lambda: json.loads(body), min_time, rounds)
+                results[f"serialize_response[{size}]"] = _clock(lambda: dumps(response), min_time, rounds)
+                results[f"sse_frames_stdlib[{size}]"] = _clock(lambda: _legacy_sse_frames(response_obj), min_time, rounds)
+                results[f"sse_frames[{size}]"] = _clock(lambda: list(main._response_sse_frames(response_obj)), min_time, rounds)
+                results[f"graph_ainvoke_null[{size}]"] = _aclock(loop, lambda: router_app.ainvoke(dict(state)), min_time, rounds)
+                results[f"asgi_route_null[{size}]"] = _aclock(loop, lambda: _post(app_client, "/route", body), min_time, rounds)
+    finally:
+        main.limiter.enabled = limiter_enabled
+        loop.run_until_complete(app_client.aclose())
+        loop.run_until_complete(bare_client.aclose())
+        loop.close()
+
+    return {
+        "meta": {
+            "ts": time.time(),
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()} x{os.cpu_count()}",
+            "min_time": min_time,
+            "rounds": rounds,
+        },
+        "results": results,
+    }
+
+def find_regressions(baseline, current, threshold=0.2):
+    """Benchmarks whose median grew by more than `threshold` (and NOISE_FLOOR_US) vs the baseline."""
+    flagged = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before or before["median_us"] <= 0:
+            continue
+        delta = now["median_us"] - before["median_us"]
+        if delta > NOISE_FLOOR_US and delta / before["median_us"] > threshold:
+            flagged.append({"name": name, "baseline_us": before["median_us"], "current_us": now["median_us"], "change": round(delta / before["median_us"], 3)})
+    return flagged
+
+def print_report(current, baseline=None):
+    print(f"{'Benchmark':<36} {'median us':>12} {'min us':>12} {'baseline':>12} {'change':>8}")
+    for name, r in current["results"].items():
+        before = (baseline or {}).get("results", {}).get(name)
+        change = f"{(r['median_us'] - before['median_us']) / before['median_us']:+.1%}" if before and before["median_us"] > 0 else ""
+        min_us = f"{r['min_us']:.2f}" if "min_us" in r else ""
+        base_us = f"{before['median_us']:.2f}" if before else ""
+        print(f"{name:<36} {r['median_us']:>12.2f} {min_us:>12} {base_us:>12} {change:>8}")
+
+def print_serialization_share(current):
+    """Response/SSE encoding time as a share of the /route request time, stdlib json vs the serialization layer."""
+    results = current["results"]
+    sizes = [name[len("serialize_response["):-1] for name in results if name.startswith("serialize_response[")]
+    if not sizes:
+        return
+    print(f"\n{'Serialization share of /route':<36} {'stdlib':>12} {'layer':>12} {'sse stdlib us':>14} {'sse layer us':>14}")
+    for size in sizes:
+        route_us = results[f"asgi_route_null[{size}]"]["median_us"]
+        stdlib_us = results[f"json_dumps_response[{size}]"]["median_us"]
+        layer_us = results[f"serialize_response[{size}]"]["median_us"]
+        print(f"{'size ' + size:<36} {stdlib_us / route_us:>12.1%} {layer_us / route_us:>12.1%} "
+              f"{results[f'sse_frames_stdlib[{size}]']['median_us']:>14.2f} {results[f'sse_frames[{size}]']['median_us']:>14.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Router per-request overhead microbenchmarks")
+    parser.add_argument("--sizes", help=f"Comma-separated prompt sizes in characters (default {','.join(map(str, SIZES))})")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="Short rounds (smoke run, noisy)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged as a regression")
+    parser.add_argument("--check", action="store_true", help="Exit 1 when regressions are found")
+    parser.add_argument("--out", help="Also write this run's results to a file")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else SIZES
+    min_time, rounds = (0.02, 3) if args.quick else (args.min_time, args.rounds)
+    current = run_suite(sizes, min_time, rounds)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("machine") != current["meta"]["machine"] or baseline["meta"].get("python") != current["meta"]["python"]:
+            print(f"! Baseline was recorded on {baseline['meta'].get('machine')} / Python {baseline['meta'].get('python')}: compare with care")
+
+    print_report(current, baseline)
+    print_serialization_share(current)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nSaved baseline {args.baseline}")
+        return
+
+    if baseline:
+        regressions = find_regressions(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for r in regressions:
+                print(f"  {r['name']}: {r['baseline_us']:.2f} -> {r['current_us']:.2f} us ({r['change']:+.1%})")
+            if args.check:
+                sys.exit(1)
+        else:
+            print(f"\nNo regressions over {args.threshold:.0%} vs {args.baseline}")
+
+if __name__ == "__main__":
+    main()
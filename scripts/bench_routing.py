@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Routing accuracy & classifier throughput benchmark.
+
+Runs the labeled corpus (tests/routing/data/routing_corpus.jsonl) through
+classify_prompt and the routing policy (graph/routing_eval.py), prints accuracy,
+confusion matrices, judge trigger rate and per-stage timings, and saves the
+result under logs/bench/ tagged with the commit so runs can be compared.
+
+Examples:
+  python scripts/bench_routing.py                          # run + save logs/bench/routing-<commit>.json
+  python scripts/bench_routing.py --compare latest         # diff against the previous saved run
+  python scripts/bench_routing.py --local-only --misses    # cloud unavailable; list misclassified prompts
+  python scripts/bench_routing.py --import reviewed.jsonl  # append labeled prompts from production logs
+
+Imported lines need "prompt" or "messages" plus human-reviewed "task" and
+"complexity"; unlabeled or duplicate prompts are skipped.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("AI_ROUTER_ENV", "test")  # No cloud auth probes while benchmarking
+
+from graph import router
+from graph.routing_eval import COMPLEXITIES, CORPUS_PATH, compare, evaluate, load_corpus
+
+BENCH_DIR = "logs/bench"
+
+def _prompt_key(messages):
+    return hashlib.sha256(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def import_labeled(src, corpus_path):
+    """Append labeled records from `src` to the corpus, skipping unlabeled and duplicate prompts."""
+    existing = {_prompt_key(item["messages"]) for item in load_corpus(corpus_path)}
+    added = skipped = 0
+    with open(src, encoding="utf-8") as f, open(corpus_path, "a", encoding="utf-8") as out:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            messages = rec.get("messages") or ([{"role": "user", "content": rec["prompt"]}] if rec.get("prompt") else None)
+            if not messages or rec.get("task") not in router.TASK_TYPES or rec.get("complexity") not in COMPLEXITIES:
+                skipped += 1
+                continue
+            key = _prompt_key(messages)
+            if key in existing:
+                skipped += 1
+                continue
+            existing.add(key)
+            item = {"id": rec.get("id") or f"log-{key[:10]}", "messages": messages, "task": rec["task"], "complexity": rec["complexity"]}
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+            added += 1
+    print(f"Imported {added} prompts into {corpus_path} ({skipped} skipped)")
+
+def print_matrix(title, matrix):
+    labels = [label for label in matrix if any(matrix[label].values()) or any(row[label] for row in matrix.values())]
+    width = max(len(label) for label in labels) + 2
+    print(f"\n{title} (rows = gold, columns = predicted)")
+    print(" " * width + "".join(f"{label[:6]:>7}" for label in labels))
+    for gold in labels:
+        print(f"{gold:<{width}}" + "".join(f"{matrix[gold][pred] or '.':>7}" for pred in labels))
+
+def print_report(result, misses=False):
+    meta, acc = result["meta"], result["accuracy"]
+    print(f"Commit {meta['commit']}  corpus={meta['items']} prompts ({meta['corpus_sha']})  config={meta['config_sha']}")
+    print(f"cloud_available={meta['cloud_available']}  budget={meta['budget']}  classifier={meta.get('classifier', 'heuristic')}  tokenizer={meta['tokenizer']}  repeat={meta['repeat']}")
+    print(f"\nThroughput: {result['throughput']['prompts_per_sec']} prompts/sec (classify + policy)")
+    print(f"{'Stage':<10} {'mean us':>10} {'p50 us':>10} {'p95 us':>10}")
+    for stage, t in result["stages"].items():
+        print(f"{stage:<10} {t['mean_us']:>10.1f} {t['p50_us']:>10.1f} {t['p95_us']:>10.1f}")
+    print(f"\nAccuracy: task {acc['task']:.1%}  complexity {acc['complexity']:.1%}  both {acc['both']:.1%}  routing {acc['routing']:.1%}")
+    judge = result["judge"]
+    print(f"Judge would trigger on {judge['trigger_rate']:.1%} of prompts (confidence < {judge['threshold']}, enabled={judge['enabled']})")
+    print_matrix("Task", result["confusion"]["task"])
+    print_matrix("Complexity", result["confusion"]["complexity"])
+    if misses and result["misses"]:
+        print("\nMisclassified:")
+        for m in result["misses"]:
+            flag = "" if m["model"] == m["gold_model"] else f"  -> {m['model']} (gold routes to {m['gold_model']})"
+            print(f"  {m['id']:<12} gold={m['gold']:<28} pred={m['pred']:<28} conf={m['confidence']}{flag}")
+
+def latest_result(exclude=None):
+    runs = [p for p in glob.glob(os.path.join(BENCH_DIR, "routing-*.json")) if p != exclude]
+    return max(runs, key=os.path.getmtime) if runs else None
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Router routing accuracy benchmark")
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="Labeled JSONL corpus")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the corpus for timings")
+    parser.add_argument("--local-only", action="store_true", help="Route as if cloud were unavailable")
+    parser.add_argument("--budget", choices=["low", "balanced", "high"], help="Budget override for the policy")
+    parser.add_argument("--heuristic-only", action="store_true",
+                        help="Score the keyword heuristic alone, without the learned and semantic stages")
+    parser.add_argument("--out", help="Result file (default logs/bench/routing-<commit>.json)")
+    parser.add_argument("--no-save", action="store_true", help="Do not write a result file")
+    parser.add_argument("--compare", help="Previous result file, or 'latest'")
+    parser.add_argument("--misses", action="store_true", help="List misclassified prompts")
+    parser.add_argument("--json", action="store_true", help="Print the raw result as JSON")
+    parser.add_argument("--import", dest="import_path", help="Append labeled prompts (JSONL) to the corpus and exit")
+    args = parser.parse_args()
+
+    if args.import_path:
+        import_labeled(args.import_path, args.corpus)
+        return
+
+    result = evaluate(load_corpus(args.corpus), repeat=args.repeat, cloud_available=not args.local_only,
+                      budget=args.budget, corpus_path=args.corpus, heuristic_only=args.heuristic_only)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result, misses=args.misses)
+
+    out = args.out or os.path.join(BENCH_DIR, f"routing-{result['meta']['commit']}.json")
+    baseline = latest_result(exclude=out) if args.compare == "latest" else args.compare
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f)
+        print(f"\nCompared with {baseline} ({previous['meta']['commit']}):")
+        for line in compare(previous, result):
+            print(f"  {line}")
+    elif args.compare:
+        print("\nNo previous result to compare with.")
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved {out}")
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,155 @@
 #!/usr/bin/env python3
+"""
+AI Router cost & latency report.
+
+Reads the SQLite metrics store (services/metrics_store.py) that the router
+fills in batches, using its hourly/daily rollups so queries over months of
+traffic stay fast. Older JSONL logs can be backfilled incrementally with
+--ingest (only bytes appended since the last run are read).
+
+Examples:
+  python scripts/cost_report.py                        # totals by tier (all time)
+  python scripts/cost_report.py --since 7d --by model  # last 7 days per model
+  python scripts/cost_report.py --since 2025-12-01 --until 2026-01-01 --by api_key
+  python scripts/cost_report.py --rollup day --model local-code
+  python scripts/cost_report.py --ingest logs/metrics.jsonl
+"""
+import argparse
 import datetime
 import json
 import os
-from collections import defaultdict
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.metrics_store import METRICS_DB_PATH, MetricsStore
 
 LOG_FILE = "logs/metrics.jsonl"
+INGEST_BATCH = 1000
+
+def parse_time(value):
+    """Accept ISO dates/datetimes or relative spans like 30m, 24h, 7d."""
+    if value is None:
+        return None
+    m = re.fullmatch(r"(\d+)([mhd])", value.strip())
+    if m:
+        mult = {"m": 60, "h": 3600, "d": 86400}[m.group(2)]
+        return time.time() - int(m.group(1)) * mult
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+def ingest_jsonl(store, path):
+    """Append new lines of a metrics JSONL file to the store (resumes from last offset)."""
+    if not os.path.exists(path):
+        print(f"No logs found at {path}")
+        return 0
+
+    source = os.path.abspath(path)
+    offset = store.get_offset(source)
+    if offset > os.path.getsize(path):
+        offset = 0  # File was rotated/truncated
+
+    inserted = 0
+    batch = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break  # Partial line still being written
+            offset += len(raw)
+            try:
+                batch.append(json.loads(raw))
+            except ValueError:
+                continue
+            if len(batch) >= INGEST_BATCH:
+                inserted += store.write_batch(batch)
+                batch = []
+    if batch:
+        inserted += store.write_batch(batch)
+    store.set_offset(source, offset)
+    return inserted
 
-def load_metrics():
-    if not os.path.exists(LOG_FILE):
-        print(f"No logs found at {LOG_FILE}")
-        return []
-    
-    data = []
-    with open(LOG_FILE, "r") as f:
-        for line in f:
-            if line.strip():
-                try:
-                    data.append(json.loads(line))
-                except:
-                    pass
-    return data
-
-def generate_report():
-    metrics = load_metrics()
-    if not metrics:
+def _fmt_bucket(bucket, period):
+    dt = datetime.datetime.fromtimestamp(bucket, tz=datetime.timezone.utc)
+    return dt.strftime("%Y-%m-%d %H:00Z" if period == "hour" else "%Y-%m-%d")
+
+def generate_report(store, args):
+    since, until = parse_time(args.since), parse_time(args.until)
+    filters = {k: v for k, v in (("model", args.model), ("task", args.task), ("tier", args.tier), ("api_key", args.api_key)) if v}
+
+    t0 = time.perf_counter()
+    if args.rollup:
+        rows = store.timeline(args.rollup, since, until, group_by=args.by if args.by_given else None, filters=filters)
+    else:
+        rows = store.summary(since, until, group_by=args.by, filters=filters)
+    query_ms = (time.perf_counter() - t0) * 1000
+
+    if args.json:
+        print(json.dumps({"rows": rows, "query_ms": round(query_ms, 2)}, indent=2))
         return
 
-    total_reqs = len(metrics)
-    total_cost = sum(m.get("cost_est_usd", 0) for m in metrics)
-    total_tokens = sum(m.get("tokens_total", 0) for m in metrics)
-    
-    # By Tier
-    by_tier = defaultdict(int)
-    cost_by_tier = defaultdict(float)
-    
-    for m in metrics:
-        t = m.get("tier", "unknown")
-        by_tier[t] += 1
-        cost_by_tier[t] += m.get("cost_est_usd", 0)
-        
+    total_reqs = sum(r["requests"] for r in rows)
+    total_cost = sum(r["cost_usd"] for r in rows)
+    total_tokens = sum(r["tokens"] for r in rows)
+
     print("\n=== AI ROUTER COST REPORT ===")
     print(f"Generated: {datetime.datetime.now().isoformat()}")
+    if since or until:
+        def fmt(t):
+            return datetime.datetime.fromtimestamp(t).isoformat(timespec="minutes") if t else "-"
+        print(f"Range    : {fmt(since)} .. {fmt(until)}")
+    if filters:
+        print(f"Filters  : {filters}")
     print("-" * 30)
     print(f"Total Requests : {total_reqs}")
     print(f"Total Tokens   : {total_tokens:,}")
     print(f"Total Cost     : ${total_cost:.6f}")
     print("-" * 30)
-    print("Usage by Tier:")
-    
-    for tier, count in sorted(by_tier.items()):
-        cost = cost_by_tier[tier]
-        pct = (count / total_reqs) * 100
-        print(f"  - {tier.upper():<10} : {count:>4} reqs ({pct:>5.1f}%) | ${cost:.6f}")
-        
+
+    if not total_reqs:
+        print("No metrics in range.")
+    elif args.rollup:
+        print(f"Usage per {args.rollup}:")
+        for r in rows:
+            label = _fmt_bucket(r["bucket"], args.rollup)
+            if "group" in r:
+                label += f"  {r['group']}"
+            print(f"  - {label:<32} : {r['requests']:>6} reqs | {r['tokens']:>10,} tok | ${r['cost_usd']:.6f} | {r['avg_latency_ms']:>6} ms")
+    else:
+        print(f"Usage by {args.by.replace('_', ' ').title()}:")
+        for r in sorted(rows, key=lambda r: -r["cost_usd"]):
+            pct = (r["requests"] / total_reqs) * 100
+            print(f"  - {str(r['group']).upper():<24} : {r['requests']:>6} reqs ({pct:>5.1f}%) | ${r['cost_usd']:.6f} | {r['avg_latency_ms']:>6} ms")
+
     print("-" * 30)
-    
-    # Validation
-    local_tiers = ["local"] # Need to ensure generic local is mapped to 'local'? 
-    # Actually in code: _get_tier_from_model returns 'standard' or whatever keys we logic out.
-    # Wait, _get_tier_from_model defaults to 'standard' if not matched.
-    # Llama/DeepSeek logic in cost_guard?
-    # Let's check cost_guard logic again.
-    
-    pass
+    print(f"(query {query_ms:.1f} ms)")
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="AI Router cost & latency report")
+    p.add_argument("--db", default=os.getenv("METRICS_DB_PATH", METRICS_DB_PATH) or "logs/metrics.db")
+    p.add_argument("--ingest", nargs="?", const=LOG_FILE, help="Backfill from a metrics JSONL file before reporting")
+    p.add_argument("--since", help="Start (ISO date/datetime or 30m/24h/7d)")
+    p.add_argument("--until", help="End, exclusive (same formats)")
+    p.add_argument("--by", choices=["tier", "model", "task", "api_key"], help="Group totals (default: tier)")
+    p.add_argument("--rollup", choices=["hour", "day"], help="Timeline per hour/day instead of totals")
+    p.add_argument("--model")
+    p.add_argument("--task")
+    p.add_argument("--tier")
+    p.add_argument("--api-key", dest="api_key", help="Hashed API key id (as logged)")
+    p.add_argument("--json", action="store_true", help="Machine-readable output")
+    args = p.parse_args(argv)
+    args.by_given = args.by is not None
+    args.by = args.by or "tier"
+
+    store = MetricsStore(args.db)
+    try:
+        if args.ingest:
+            n = ingest_jsonl(store, args.ingest)
+            print(f"Ingested {n} new events from {args.ingest}", file=sys.stderr)
+        generate_report(store, args)
+    finally:
+        store.close()
 
 if __name__ == "__main__":
-    generate_report()
+    main()
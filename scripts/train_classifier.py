@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Train the learned prompt classifier (graph/learned_classifier.py).
+
+Reads labeled JSONL ({"prompt" | "messages", "task", "complexity"}): the routing
+corpus, reviewed production logs, and exported LLM judge outputs. Judge labels
+are noisier than reviewed ones, so they get --judge-weight. Runs k-fold
+cross-validation to fit the confidence temperature and report honest accuracy,
+calibration and how many judge calls the stage would replace, then trains on
+everything and writes the compressed artifact.
+
+Examples:
+  python scripts/train_classifier.py                                   # corpus -> config/learned_classifier.npz
+  python scripts/train_classifier.py --data reviewed.jsonl --judge judge_export.jsonl
+  python scripts/train_classifier.py --out /tmp/clf.npz --folds 10 --epochs 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("AI_ROUTER_ENV", "test")  # No cloud auth probes while training
+
+from graph import learned_classifier as lc
+from graph import router
+from graph.routing_eval import COMPLEXITIES, CORPUS_PATH
+
+DEFAULT_OUT = str(router.ROOT / "config" / "learned_classifier.npz")
+
+def load_labeled(paths, weight):
+    """(text, task, complexity, weight) for every labeled line with known labels."""
+    rows, skipped = [], 0
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                messages = rec.get("messages") or ([{"role": "user", "content": rec["prompt"]}] if rec.get("prompt") else None)
+                if not messages or rec.get("task") not in router.TASK_TYPES or rec.get("complexity") not in COMPLEXITIES:
+                    skipped += 1
+                    continue
+                rows.append((lc.prompt_text(messages), rec["task"], rec["complexity"], weight))
+    return rows, skipped
+
+def keyword_prior(weight):
+    """One training row per configured task keyword (a prior for tasks with few labeled prompts)."""
+    return [
+        (kw, task, cfg.get("complexity_default", "low"), weight)
+        for task, cfg in router.TASK_TYPES.items()
+        for kw in cfg.get("keywords", [])
+        if cfg.get("complexity_default", "low") in COMPLEXITIES
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the learned prompt classifier")
+    parser.add_argument("--data", nargs="*", default=[CORPUS_PATH], help="Reviewed labeled JSONL files")
+    parser.add_argument("--judge", nargs="*", default=[], help="JSONL of LLM judge labels (weighted by --judge-weight)")
+    parser.add_argument("--judge-weight", type=float, default=0.5)
+    parser.add_argument("--keyword-weight", type=float, default=0.5, help="Weight of config keyword rows (0 disables)")
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--lr", type=float, default=0.05)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--features", type=int, default=lc.N_FEATURES, help="Hash buckets (power of two)")
+    args = parser.parse_args()
+
+    reviewed, skipped = load_labeled(args.data, 1.0)
+    judged, skipped_judge = load_labeled(args.judge, args.judge_weight)
+    rows = reviewed + judged
+    if not rows:
+        sys.exit("No labeled prompts found")
+    prior = keyword_prior(args.keyword_weight) if args.keyword_weight > 0 else []
+    print(f"Training on {len(reviewed)} reviewed + {len(judged)} judge-labeled prompts ({skipped + skipped_judge} skipped), "
+          f"{len(prior)} keyword rows")
+
+    texts, tasks, complexities, weights = (list(col) for col in zip(*rows))
+    t0 = time.perf_counter()
+    clf, report = lc.train(texts, tasks, complexities, list(router.TASK_TYPES), COMPLEXITIES, weights=weights,
+                           folds=args.folds, epochs=args.epochs, lr=args.lr, l2=args.l2, n_features=args.features,
+                           prior=prior)
+    print(f"Trained in {time.perf_counter() - t0:.1f}s")
+
+    threshold = router.CLASSIFIER_CFG.get("heuristic_confidence_threshold", 0.7)
+    heuristic_judge = sum(router.classify_prompt([{"role": "user", "content": t}]).confidence < threshold for t in texts)
+    at = report["confidence_by_threshold"].get(str(threshold))
+    print(f"\nCross-validated ({report['folds']} folds): task {report['cv_task_accuracy']:.1%}  "
+          f"complexity {report['cv_complexity_accuracy']:.1%}  ECE {report['ece']:.3f}  temperature {report['temperature']}")
+    for th, row in report["confidence_by_threshold"].items():
+        acc = f"{row['accuracy']:.1%}" if row["accuracy"] is not None else "n/a"
+        print(f"  confidence >= {th}: covers {row['coverage']:.1%} of prompts at {acc} task accuracy")
+    if at:
+        print(f"Judge calls: heuristic alone would call it on {heuristic_judge}/{len(texts)} prompts; "
+              f"the learned stage answers {at['coverage']:.0%} of prompts on its own at >= {threshold}")
+
+    sample = texts[: min(256, len(texts))]
+    t0 = time.perf_counter()
+    for t in sample:
+        clf.predict([t])
+    single = (time.perf_counter() - t0) / len(sample)
+    t0 = time.perf_counter()
+    clf.predict(sample)
+    batched = (time.perf_counter() - t0) / len(sample)
+    print(f"Latency: {single * 1e6:.0f} us/prompt single, {batched * 1e6:.0f} us/prompt batched ({len(sample)})")
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    clf.save(args.out)
+    print(f"\nSaved {args.out} ({os.path.getsize(args.out) / 1024:.0f} KiB)")
+
+if __name__ == "__main__":
+    main()
@@ -3,23 +3,69 @@ import logging
 import os
 import time
 import uuid
+from typing import List, Optional, Tuple
 
 import redis.asyncio as redis
 
+from services import router_metrics as prom
+
 logger = logging.getLogger("ai-router.gpu-queue")
 
 # Config from Env
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 MAX_WORKERS = int(os.getenv("GPU_QUEUE_MAX_WORKERS", "1"))
 QUEUE_TIMEOUT = int(os.getenv("GPU_QUEUE_TIMEOUT", "60"))
+POLL_SEC = 0.5
 
 # Check if queue should be enabled (only if Redis URL is set)
 ENABLED = bool(os.getenv("REDIS_URL") or os.getenv("GPU_QUEUE_ENABLED"))
 
+# fifo | model_affinity (serve queued requests for the loaded model first, to avoid swaps)
+SCHEDULER = os.getenv("GPU_QUEUE_SCHEDULER", "fifo").lower()
+MAX_BATCH = int(os.getenv("GPU_QUEUE_MAX_BATCH", "8"))  # Same-model starts before the head must be served
+MAX_WAIT_SEC = float(os.getenv("GPU_QUEUE_MAX_WAIT_SEC", "10"))  # Head older than this is served next
+
+def _keys(lane: str = None):
+    """Redis keys for a GPU lane (one lane per Ollama endpoint; None = single host)."""
+    if not lane:
+        return "gpu:queue", "gpu:active"
+    return f"gpu:queue:{lane}", f"gpu:active:{lane}"
+
+def _affinity_keys(lane: str = None):
+    """Per-lane keys for model_affinity: request meta hash, current model, run length."""
+    suffix = f":{lane}" if lane else ""
+    return f"gpu:meta{suffix}", f"gpu:model{suffix}", f"gpu:run{suffix}"
+
+def choose_next(
+    entries: List[Tuple[str, str, float]],
+    current_model: Optional[str],
+    run_length: int,
+    now: float,
+    max_batch: int = None,
+    max_wait: float = None,
+) -> Optional[str]:
+    """
+    Pick the next request to start from queued (request_id, model, enqueued_at).
+    Prefers the model already loaded on the GPU, unless the head of the queue has
+    waited max_wait seconds or the current model has run max_batch times in a row.
+    """
+    if not entries:
+        return None
+    max_batch = MAX_BATCH if max_batch is None else max_batch
+    max_wait = MAX_WAIT_SEC if max_wait is None else max_wait
+    head_id, _, head_ts = entries[0]
+    if current_model is None or now - head_ts >= max_wait or run_length >= max_batch:
+        return head_id
+    for request_id, model, _ in entries:
+        if model == current_model:
+            return request_id
+    return head_id
+
 class GpuQueue:
     def __init__(self):
         self._redis = None
         self._enabled = ENABLED
+        self._lanes = set()
 
     async def connect(self):
         if not self._enabled:
@@ -37,17 +83,22 @@ class GpuQueue:
         if self._redis:
             await self._redis.close()
 
-    async def execute_limited(self, func, *args, **kwargs):
+    async def execute_limited(self, func, *args, lane: str = None, model: str = None, **kwargs):
         """
         Executes an async function ensuring max concurrency on GPU.
+        Each lane (GPU host) has its own FIFO and MAX_WORKERS slots.
+        With GPU_QUEUE_SCHEDULER=model_affinity, `model` groups queued requests.
         If Disabled or Redis fail, runs immediately (fallback).
         """
         if not self._enabled or not self._redis:
             return await func(*args, **kwargs)
 
+        if SCHEDULER == "model_affinity" and model:
+            return await self._execute_affinity(func, args, kwargs, lane, model)
+
         request_id = str(uuid.uuid4())
-        queue_key = "gpu:queue"
-        active_key = "gpu:active"
+        queue_key, active_key = _keys(lane)
+        self._lanes.add(lane)
         
         t0 = time.time()
         
@@ -94,7 +145,7 @@ class GpuQueue:
                         pass
                 
                 # Backoff wait
-                await asyncio.sleep(0.5)
+                await asyncio.sleep(POLL_SEC)
 
             # 3. Execute
             try:
@@ -110,18 +161,89 @@ class GpuQueue:
             await self._redis.srem(active_key, request_id)
             raise e
 
+    async def _execute_affinity(self, func, args, kwargs, lane: str, model: str):
+        """Like the FIFO path, but the next slot goes to choose_next() instead of the head."""
+        request_id = str(uuid.uuid4())
+        queue_key, active_key = _keys(lane)
+        meta_key, model_key, run_key = _affinity_keys(lane)
+        self._lanes.add(lane)
+        t0 = time.time()
+
+        pipe = self._redis.pipeline()
+        pipe.hset(meta_key, request_id, f"{t0}|{model}")
+        pipe.rpush(queue_key, request_id)
+        await pipe.execute()
+
+        try:
+            while True:
+                if time.time() - t0 > QUEUE_TIMEOUT:
+                    raise TimeoutError(f"GPU Queue Timeout ({QUEUE_TIMEOUT}s)")
+
+                if await self._redis.scard(active_key) < MAX_WORKERS:
+                    ids = await self._redis.lrange(queue_key, 0, -1)
+                    metas = await self._redis.hmget(meta_key, ids) if ids else []
+                    entries = []
+                    for rid, meta in zip(ids, metas):
+                        ts, _, m = (meta or f"{t0}|").partition("|")
+                        entries.append((rid, m, float(ts)))
+                    current = await self._redis.get(model_key)
+                    run_length = int(await self._redis.get(run_key) or 0)
+
+                    if choose_next(entries, current, run_length, time.time()) == request_id:
+                        pipe = self._redis.pipeline()
+                        pipe.lrem(queue_key, 1, request_id)
+                        pipe.sadd(active_key, request_id)
+                        results = await pipe.execute()
+                        if results[0] == 1:
+                            # Track the run of same-model starts on this lane
+                            run = run_length + 1 if current == model else 1
+                            if current == model:
+                                await self._redis.incr(run_key)
+                            else:
+                                await self._redis.set(model_key, model)
+                                await self._redis.set(run_key, 1)
+                                if current:
+                                    prom.observe_model_switch(lane)
+                            await self._redis.hdel(meta_key, request_id)
+                            logger.info(f"Acquired GPU slot for {request_id[:8]} ({model}, run={run})")
+                            break
+                        await self._redis.srem(active_key, request_id)
+
+                await asyncio.sleep(POLL_SEC)
+
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                await self._redis.srem(active_key, request_id)
+                logger.info(f"Released GPU slot for {request_id[:8]}")
+
+        except Exception as e:
+            await self._redis.lrem(queue_key, 0, request_id)
+            await self._redis.srem(active_key, request_id)
+            await self._redis.hdel(meta_key, request_id)
+            raise e
+
     async def get_metrics(self):
         """Returns queue depth and active workers."""
         if not self._enabled or not self._redis:
             return {"enabled": False}
         
-        queue_len = await self._redis.llen("gpu:queue")
-        active_count = await self._redis.scard("gpu:active")
+        lanes = {}
+        for lane in sorted(self._lanes | {None}, key=lambda name: name or ""):
+            queue_key, active_key = _keys(lane)
+            lanes[lane or "default"] = {
+                "queue_depth": await self._redis.llen(queue_key),
+                "active_workers": await self._redis.scard(active_key),
+            }
+        if len(lanes) > 1 and not any(lanes["default"].values()):
+            del lanes["default"]
         return {
             "enabled": True,
-            "queue_depth": queue_len,
-            "active_workers": active_count,
-            "max_workers": MAX_WORKERS
+            "queue_depth": sum(stats["queue_depth"] for stats in lanes.values()),
+            "active_workers": sum(stats["active_workers"] for stats in lanes.values()),
+            "max_workers": MAX_WORKERS * len(lanes),
+            "scheduler": SCHEDULER,
+            "lanes": lanes,
         }
 
 # Validating singleton
@@ -133,6 +255,6 @@ async def get_queue() -> GpuQueue:
     return _queue
 
 # Helper for wrapping logic
-async def run_on_gpu(func, *args, **kwargs):
+async def run_on_gpu(func, *args, lane: str = None, model: str = None, **kwargs):
     q = await get_queue()
-    return await q.execute_limited(func, *args, **kwargs)
+    return await q.execute_limited(func, *args, lane=lane, model=model, **kwargs)
@@ -0,0 +1,257 @@
+"""
+Deferred jobs that soak up idle GPU capacity.
+
+Non-interactive work (ticket classification, document summaries) is submitted
+as a job instead of competing with IDE users in gpu:queue. Jobs are persisted
+in SQLite (survive restarts; jobs left running by a crash are re-queued) and a
+background runner starts them only while interactive load is at or below
+JOBS_IDLE_QUEUE_THRESHOLD. Load is checked before every job start, so when
+interactive traffic returns the runner stops at the next job boundary: running
+jobs finish, queued ones wait.
+
+Interactive load is the GPU queue depth (Redis queue enabled) or the requests
+outstanding on the Ollama pool, minus the jobs the runner itself has in flight.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("ai-router.jobs")
+
+# Config from Env
+JOBS_ENABLED = str(os.getenv("JOBS_ENABLED", "1")) == "1"
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "logs/jobs.db")
+IDLE_QUEUE_THRESHOLD = int(os.getenv("JOBS_IDLE_QUEUE_THRESHOLD", "0"))  # Max interactive requests waiting/running
+MAX_CONCURRENCY = int(os.getenv("JOBS_MAX_CONCURRENCY", "1"))
+POLL_SEC = float(os.getenv("JOBS_POLL_SEC", "2"))
+RETENTION_SEC = float(os.getenv("JOBS_RETENTION_SEC", str(7 * 86400)))  # Finished jobs are purged after this
+
+STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    api_key_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        with self._lock:
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+            ).rowcount
+        if requeued:
+            logger.info(f"Re-queued {requeued} jobs interrupted by a restart")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def submit(self, request: Dict[str, Any], api_key_id: str = "anonymous") -> str:
+        job_id = f"job-{uuid.uuid4().hex[:16]}"
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, api_key_id, status, request, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, api_key_id, json.dumps(request), time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, api_key_id, status, request, result, error, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "api_key_id", "status", "request", "result", "error", "created_at", "started_at", "finished_at")
+        job = dict(zip(keys, row))
+        job["request"] = json.loads(job["request"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job as running and return it (None if nothing is queued)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), row[0]),
+            )
+        return self.get(row[0])
+
+    def finish(self, job_id: str, result: Dict[str, Any] = None, error: str = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?"
+                " WHERE id = ? AND status = 'running'",
+                (
+                    "failed" if error else "done",
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            ).rowcount == 1
+
+    def purge(self, older_than: float) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?", (older_than,)
+            ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        out = {s: 0 for s in STATUSES}
+        out.update(dict(rows))
+        return out
+
+
+async def interactive_load() -> int:
+    """Requests from interactive traffic waiting for or running on the GPU."""
+    from services.gpu_queue import get_queue
+    from services.ollama_pool import get_pool
+
+    metrics = await (await get_queue()).get_metrics()
+    if metrics.get("enabled"):
+        return metrics["queue_depth"] + metrics["active_workers"]
+    return sum(ep.outstanding for ep in get_pool().endpoints.values())
+
+
+class JobRunner:
+    """Starts queued jobs while the GPU is idle; `invoke(request, api_key_id)` runs one through the router."""
+
+    def __init__(self, store: JobStore, invoke: Callable[[Dict[str, Any], str], Awaitable[Dict[str, Any]]],
+                 load: Callable[[], Awaitable[int]] = None):
+        self.store = store
+        self.invoke = invoke
+        self.load = load or interactive_load
+        self.running: Dict[str, asyncio.Task] = {}
+        self.preempted = 0  # Ticks where queued jobs waited for interactive load to drop
+        self._task: Optional[asyncio.Task] = None
+
+    async def tick(self) -> int:
+        """Start as many jobs as capacity and idleness allow. Returns how many were started."""
+        started = 0
+        while len(self.running) < MAX_CONCURRENCY:
+            # Our own jobs also sit in the GPU queue / pool; only the rest is interactive
+            if await self.load() - len(self.running) > IDLE_QUEUE_THRESHOLD:
+                if self.store.counts()["queued"]:
+                    self.preempted += 1
+                break
+            job = self.store.claim_next()
+            if job is None:
+                break
+            self.running[job["id"]] = asyncio.create_task(self._run(job))
+            started += 1
+        return started
+
+    async def _run(self, job: Dict[str, Any]):
+        t0 = time.perf_counter()
+        try:
+            out = await self.invoke(job["request"], job["api_key_id"])
+            if isinstance(out, dict) and out.get("type") == "upstream_error":
+                self.store.finish(job["id"], error=out.get("error", "Unknown upstream error"))
+            else:
+                self.store.finish(job["id"], result={"output": out.get("output", ""), "usage": out.get("usage") or {}})
+            logger.info(f"Job {job['id']} finished in {time.perf_counter() - t0:.1f}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Job {job['id']} failed: {e}")
+            self.store.finish(job["id"], error=str(e))
+        finally:
+            self.running.pop(job["id"], None)
+
+    async def _loop(self):
+        last_purge = 0.0
+        while True:
+            try:
+                await self.tick()
+                if time.time() - last_purge > 3600:
+                    last_purge = time.time()
+                    self.store.purge(last_purge - RETENTION_SEC)
+            except Exception as e:
+                logger.warning(f"Job runner tick failed: {e}")
+            await asyncio.sleep(POLL_SEC)
+
+    def start(self):
+        if self._task is None and JOBS_ENABLED:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        tasks = ([self._task] if self._task else []) + list(self.running.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._task = None
+        # Jobs cut off by shutdown run again on the next start (see JobStore.__init__)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": JOBS_ENABLED,
+            "running": len(self.running),
+            "max_concurrency": MAX_CONCURRENCY,
+            "idle_queue_threshold": IDLE_QUEUE_THRESHOLD,
+            "preempted_ticks": self.preempted,
+            "jobs": self.store.counts(),
+        }
+
+
+# Singletons
+_store: Optional[JobStore] = None
+_runner: Optional[JobRunner] = None
+
+
+def get_store() -> JobStore:
+    global _store
+    if _store is None:
+        # Read at first use (not import) so env overrides apply
+        _store = JobStore(os.getenv("JOBS_DB_PATH", JOBS_DB_PATH))
+    return _store
+
+
+def get_runner(invoke: Callable[[Dict[str, Any], str], Awaitable[Dict[str, Any]]] = None) -> Optional[JobRunner]:
+    """The process-wide runner; created on the first call that provides `invoke`."""
+    global _runner
+    if _runner is None and invoke is not None:
+        _runner = JobRunner(get_store(), invoke)
+    return _runner
@@ -0,0 +1,272 @@
+"""
+Streaming latency percentiles (p50/p90/p99) per model, task, complexity and tier.
+
+Uses a log-bucketed quantile sketch (DDSketch style): every value lands in a
+bucket whose width is a fixed fraction of its magnitude, so quantiles carry a
+bounded relative error, memory is capped by a maximum bucket count, and two
+sketches merge exactly by adding bucket counts. That last property is what lets
+several uvicorn workers publish their sketches and be combined into one view.
+"""
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger("ai-router.latency")
+
+# Config from Env
+RELATIVE_ACCURACY = float(os.getenv("LATENCY_SKETCH_ACCURACY", "0.01"))
+MAX_BUCKETS = int(os.getenv("LATENCY_SKETCH_MAX_BUCKETS", "2048"))
+SKETCH_DIR = os.getenv("LATENCY_SKETCH_DIR")  # Shared dir for cross-worker merge (optional)
+FLUSH_INTERVAL_SEC = float(os.getenv("LATENCY_SKETCH_FLUSH_SEC", "10"))
+
+STAGES = ("routing_overhead", "queue_wait", "provider")
+DIMENSIONS = ("model", "task", "complexity", "tier")
+QUANTILES = (0.5, 0.9, 0.99)
+MAX_KEYS_PER_DIMENSION = 64  # Label values beyond this are folded into "other"
+MIN_VALUE_MS = 0.01
+
+
+class QuantileSketch:
+    """Fixed-memory, mergeable quantile sketch for positive values (ms)."""
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, max_buckets: int = MAX_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value: float, count: int = 1):
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value < MIN_VALUE_MS:
+            self.zero_count += count
+            return
+        idx = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[idx] = self.buckets.get(idx, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        # Fold the lowest buckets together: keeps the tail accurate, which is what we care about
+        keys = sorted(self.buckets)
+        excess = len(keys) - self.max_buckets
+        target = keys[excess]
+        folded = sum(self.buckets.pop(k) for k in keys[:excess])
+        self.buckets[target] += folded
+
+    def merge(self, other: "QuantileSketch"):
+        if other._gamma != self._gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for idx, n in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen > rank:
+                # Bucket midpoint (relative to its bounds) keeps error within relative_accuracy
+                value = 2 * self._gamma ** idx / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        out = {"count": self.count}
+        for q in QUANTILES:
+            out[f"p{int(q * 100)}"] = round(self.quantile(q), 2)
+        out["avg"] = round(self.sum / self.count, 2) if self.count else 0.0
+        out["max"] = round(self.max, 2)
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "buckets": {str(k): v for k, v in self.buckets.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(relative_accuracy=data.get("relative_accuracy", RELATIVE_ACCURACY))
+        sketch.buckets = {int(k): int(v) for k, v in data.get("buckets", {}).items()}
+        sketch.zero_count = data.get("zero_count", 0)
+        sketch.count = data.get("count", 0)
+        sketch.sum = data.get("sum", 0.0)
+        sketch.min = data.get("min", 0.0) if sketch.count else math.inf
+        sketch.max = data.get("max", 0.0)
+        return sketch
+
+
+class LatencySketches:
+    """Sketches keyed by (stage, dimension, label value), plus an "all" rollup per stage."""
+
+    def __init__(self, sketch_dir: Optional[str] = None):
+        self.sketch_dir = sketch_dir
+        self._lock = threading.Lock()
+        self._sketches: Dict[str, Dict[str, Dict[str, QuantileSketch]]] = {
+            stage: {dim: {} for dim in ("all",) + DIMENSIONS} for stage in STAGES
+        }
+        self._last_flush = time.time()
+
+    def observe(self, stage: str, value_ms: float, labels: Dict[str, str]):
+        if stage not in self._sketches:
+            raise ValueError(f"Unknown latency stage: {stage}")
+        value_ms = max(0.0, float(value_ms))
+        with self._lock:
+            by_dim = self._sketches[stage]
+            self._get(by_dim["all"], "all").add(value_ms)
+            for dim in DIMENSIONS:
+                label = str(labels.get(dim) or "unknown")
+                self._get(by_dim[dim], label).add(value_ms)
+        if self.sketch_dir and time.time() - self._last_flush >= FLUSH_INTERVAL_SEC:
+            self.flush()
+
+    @staticmethod
+    def _get(table: Dict[str, QuantileSketch], label: str) -> QuantileSketch:
+        sketch = table.get(label)
+        if sketch is None:
+            if len(table) >= MAX_KEYS_PER_DIMENSION:
+                label = "other"
+                sketch = table.get(label)
+            if sketch is None:
+                sketch = table[label] = QuantileSketch()
+        return sketch
+
+    def merge(self, other: "LatencySketches"):
+        with self._lock:
+            for stage, by_dim in other._sketches.items():
+                for dim, table in by_dim.items():
+                    for label, sketch in table.items():
+                        self._get(self._sketches[stage][dim], label).merge(sketch)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                stage: {dim: {label: s.to_dict() for label, s in table.items()} for dim, table in by_dim.items()}
+                for stage, by_dim in self._sketches.items()
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencySketches":
+        out = cls()
+        for stage, by_dim in data.items():
+            if stage not in out._sketches:
+                continue
+            for dim, table in by_dim.items():
+                if dim not in out._sketches[stage]:
+                    continue
+                for label, raw in table.items():
+                    out._get(out._sketches[stage][dim], label).merge(QuantileSketch.from_dict(raw))
+        return out
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                stage: {dim: {label: s.summary() for label, s in table.items()} for dim, table in by_dim.items()}
+                for stage, by_dim in self._sketches.items()
+            }
+
+    # ---------- Cross-worker merge ----------
+    def flush(self):
+        """Publish this worker's sketches to the shared dir (atomic replace)."""
+        if not self.sketch_dir:
+            return
+        self._last_flush = time.time()
+        path = os.path.join(self.sketch_dir, f"latency-{os.getpid()}.json")
+        try:
+            os.makedirs(self.sketch_dir, exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.to_dict(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Failed to publish latency sketches to {path}: {e}")
+
+    def merged_with_peers(self) -> "LatencySketches":
+        """This worker's sketches merged with the latest snapshot of every other worker."""
+        merged = LatencySketches.from_dict(self.to_dict())
+        for data in _load_peer_snapshots(self.sketch_dir):
+            merged.merge(LatencySketches.from_dict(data))
+        return merged
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Exists, owned by another user
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _load_peer_snapshots(sketch_dir: Optional[str]) -> Iterable[Dict[str, Any]]:
+    """Snapshots of the other live workers; files left by exited workers are removed."""
+    if not sketch_dir:
+        return []
+    own = f"latency-{os.getpid()}.json"
+    out = []
+    for path in glob.glob(os.path.join(sketch_dir, "latency-*.json")):
+        name = os.path.basename(path)
+        if name == own:
+            continue
+        pid = name[len("latency-"):-len(".json")]
+        if not pid.isdigit() or not _pid_alive(int(pid)):
+            logger.debug(f"Dropping latency snapshot of exited worker: {path}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path, "r") as f:
+                out.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.debug(f"Skipping unreadable latency snapshot {path}: {e}")
+    return out
+
+
+# Singleton
+_sketches = LatencySketches(SKETCH_DIR)
+
+
+def get_sketches() -> LatencySketches:
+    return _sketches
+
+
+def observe_request(timings_ms: Dict[str, float], labels: Dict[str, str]):
+    """Record one request's per-stage timings (keys from STAGES)."""
+    for stage, value in timings_ms.items():
+        if stage in STAGES and value is not None:
+            _sketches.observe(stage, value, labels)
@@ -0,0 +1,265 @@
+"""
+Rolling in-memory metrics for /debug/metrics.
+
+Every routed request emits one metric event (see graph.router._node_invoke).
+Instead of re-parsing logs/metrics.jsonl on each call, events are folded into
+running aggregates as they are emitted, and appended to the JSONL log so the
+aggregates can be rebuilt from a bounded tail of it after a restart. Log lines
+are written by a background thread, never on the request path.
+
+Memory is bounded: totals are scalars, breakdowns are keyed by registry model
+ids / tiers / tasks, and time windows use fixed-size minute buckets.
+"""
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from services.serialization import dumps_str
+
+logger = logging.getLogger("ai-router.metrics")
+
+# Config from Env
+METRICS_LOG_PATH = os.getenv("METRICS_LOG_PATH", "logs/metrics.jsonl")
+RESTORE_TAIL_LINES = int(os.getenv("METRICS_RESTORE_TAIL_LINES", "10000"))
+
+BUCKET_SEC = 60
+RETENTION_SEC = 24 * 3600
+WINDOWS = {"last_5m": 300, "last_1h": 3600, "last_24h": RETENTION_SEC}
+
+
+def _event_ts(event: Dict[str, Any]) -> float:
+    """Epoch seconds for an event (falls back to now for malformed ts)."""
+    ts = event.get("ts")
+    if ts:
+        try:
+            return datetime.datetime.fromisoformat(ts).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return time.time()
+
+
+def _new_breakdown() -> Dict[str, Any]:
+    return {"requests": 0, "cost_usd": 0.0, "tokens": 0}
+
+
+class MetricsAggregator:
+    def __init__(self, log_path: Optional[str] = None, persist: bool = True):
+        self.log_path = log_path
+        self.persist = persist and bool(log_path)
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self.restored_events = 0
+        self._log_queue: queue.Queue = queue.Queue(maxsize=100_000)
+        self._log_thread: Optional[threading.Thread] = None
+
+        self.total_requests = 0
+        self.total_cost_usd = 0.0
+        self.total_tokens = 0
+        self.latency_sum_ms = 0
+        self.escalations = 0
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+        self.by_tier: Dict[str, Dict[str, Any]] = {}
+        self.by_task: Dict[str, int] = {}
+        self.by_status: Dict[str, int] = {}
+        # bucket_start -> [requests, cost_usd, tokens, latency_sum_ms]
+        self._buckets: Dict[int, list] = {}
+
+    # ---------- Ingestion ----------
+    def record(self, event: Dict[str, Any]):
+        """Fold one metric event into the aggregates and append it to the log."""
+        with self._lock:
+            self._apply(event)
+        if self.persist:
+            self._append(event)
+
+    def _apply(self, event: Dict[str, Any]):
+        cost = float(event.get("cost_est_usd", 0) or 0)
+        tokens = int(event.get("tokens_total", 0) or 0)
+        latency = int(event.get("latency_ms", 0) or 0)
+
+        self.total_requests += 1
+        self.total_cost_usd += cost
+        self.total_tokens += tokens
+        self.latency_sum_ms += latency
+        if event.get("escalated"):
+            self.escalations += 1
+
+        breakdowns = ((self.by_model, event.get("model_id", "unknown")), (self.by_tier, event.get("tier", "unknown")))
+        for table, key in breakdowns:
+            row = table.get(key)
+            if row is None:
+                row = table[key] = _new_breakdown()
+            row["requests"] += 1
+            row["cost_usd"] += cost
+            row["tokens"] += tokens
+
+        task = event.get("task", "unknown")
+        self.by_task[task] = self.by_task.get(task, 0) + 1
+        status = event.get("status", "unknown")
+        self.by_status[status] = self.by_status.get(status, 0) + 1
+
+        # Time windows (events older than the retention are counted in totals only)
+        now = time.time()
+        ts = _event_ts(event)
+        if ts < now - RETENTION_SEC:
+            return
+        start = int(ts // BUCKET_SEC) * BUCKET_SEC
+        bucket = self._buckets.get(start)
+        if bucket is None:
+            bucket = self._buckets[start] = [0, 0.0, 0, 0]
+            self._prune(now)
+        bucket[0] += 1
+        bucket[1] += cost
+        bucket[2] += tokens
+        bucket[3] += latency
+
+    def _prune(self, now: float):
+        cutoff = now - RETENTION_SEC
+        for start in [s for s in self._buckets if s + BUCKET_SEC <= cutoff]:
+            del self._buckets[start]
+
+    def _append(self, event: Dict[str, Any]):
+        """Queue one log line for the writer thread (started on first use)."""
+        if self._log_thread is None:
+            with self._lock:
+                if self._log_thread is None:
+                    self._log_thread = threading.Thread(target=self._write_loop, name="metrics-log-writer", daemon=True)
+                    self._log_thread.start()
+        try:
+            self._log_queue.put_nowait(dumps_str(event) + "\n")
+        except queue.Full:
+            logger.warning("Metrics log queue full, dropping event")
+
+    def _write_loop(self):
+        while True:
+            lines = [self._log_queue.get()]
+            while True:
+                try:
+                    lines.append(self._log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                logger.warning(f"Failed to persist {len(lines)} metric events to {self.log_path}: {e}")
+            for _ in lines:
+                self._log_queue.task_done()
+
+    def flush(self):
+        """Wait until every queued log line has been written."""
+        self._log_queue.join()
+
+    # ---------- Restore ----------
+    def restore(self, max_lines: int = RESTORE_TAIL_LINES) -> int:
+        """Rebuild aggregates from the last `max_lines` events of the log."""
+        if not self.log_path or not os.path.exists(self.log_path):
+            return 0
+
+        lines = _tail_lines(self.log_path, max_lines)
+        restored = 0
+        with self._lock:
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(event)
+                restored += 1
+            self.restored_events += restored
+
+        logger.info(f"Restored {restored} metric events from {self.log_path}")
+        return restored
+
+    # ---------- Read ----------
+    def snapshot(self) -> Dict[str, Any]:
+        """Aggregated view; cost is independent of how much history exists."""
+        now = time.time()
+        with self._lock:
+            windows = {}
+            for name, span in WINDOWS.items():
+                reqs, cost, tokens, lat = 0, 0.0, 0, 0
+                for start, (b_reqs, b_cost, b_tokens, b_lat) in self._buckets.items():
+                    if start + BUCKET_SEC > now - span:
+                        reqs += b_reqs
+                        cost += b_cost
+                        tokens += b_tokens
+                        lat += b_lat
+                windows[name] = {
+                    "requests": reqs,
+                    "cost_usd": round(cost, 6),
+                    "tokens": tokens,
+                    "avg_latency_ms": int(lat / reqs) if reqs else 0,
+                }
+
+            return {
+                "total_requests": self.total_requests,
+                "total_cost_usd": round(self.total_cost_usd, 6),
+                "total_tokens": self.total_tokens,
+                "avg_latency_ms": int(self.latency_sum_ms / self.total_requests) if self.total_requests else 0,
+                "escalations": self.escalations,
+                "models": {k: v["requests"] for k, v in self.by_model.items()},
+                "tiers": {k: v["requests"] for k, v in self.by_tier.items()},
+                "by_model": {k: {**v, "cost_usd": round(v["cost_usd"], 6)} for k, v in self.by_model.items()},
+                "by_tier": {k: {**v, "cost_usd": round(v["cost_usd"], 6)} for k, v in self.by_tier.items()},
+                "tasks": dict(self.by_task),
+                "statuses": dict(self.by_status),
+                "windows": windows,
+                "restored_events": self.restored_events,
+                "since": datetime.datetime.fromtimestamp(self._started_at).isoformat(),
+            }
+
+
+def _tail_lines(path: str, max_lines: int, chunk_size: int = 65536) -> list:
+    """Read the last `max_lines` lines of a file without scanning all of it."""
+    if max_lines <= 0:
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= max_lines:
+            step = min(chunk_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    # First line may be partial when we stopped mid-file
+    if pos > 0 and lines:
+        lines = lines[1:]
+    return lines[-max_lines:]
+
+
+# Singleton (built lazily so env overrides apply)
+_aggregator: Optional[MetricsAggregator] = None
+_aggregator_lock = threading.Lock()
+
+
+def get_aggregator() -> MetricsAggregator:
+    global _aggregator
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                agg = MetricsAggregator(os.getenv("METRICS_LOG_PATH", METRICS_LOG_PATH))
+                agg.restore(int(os.getenv("METRICS_RESTORE_TAIL_LINES", str(RESTORE_TAIL_LINES))))
+                _aggregator = agg
+    return _aggregator
+
+
+def record_event(event: Dict[str, Any]):
+    """Helper used by the router to emit a metric event."""
+    get_aggregator().record(event)
+
+    # Batched write to the SQLite analytics store (see scripts/cost_report.py)
+    from services.metrics_store import get_writer
+    writer = get_writer()
+    if writer is not None:
+        writer.submit(event)
@@ -0,0 +1,331 @@
+"""
+Indexed SQLite store for metric events (cost & latency analytics).
+
+Events emitted by the router are queued and written in batches by a background
+thread into a WAL-mode SQLite database. Each batch also upserts hourly and daily
+rollups (per model / task / tier / API key), so range reports over months read
+a few thousand rollup rows instead of every event.
+
+Used by services.metrics (live ingestion) and scripts/cost_report.py (reports
+and backfill from logs/metrics.jsonl).
+"""
+import datetime
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("ai-router.metrics-store")
+
+# Config from Env ("" disables the store)
+METRICS_DB_PATH = os.getenv("METRICS_DB_PATH", "logs/metrics.db")
+BATCH_SIZE = int(os.getenv("METRICS_DB_BATCH_SIZE", "200"))
+FLUSH_INTERVAL_SEC = float(os.getenv("METRICS_DB_FLUSH_SEC", "2"))
+
+PERIODS = {"hour": 3600, "day": 86400}
+GROUP_COLUMNS = {"model": "model_id", "task": "task", "tier": "tier", "api_key": "api_key_id"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    prompt_id TEXT UNIQUE,
+    ts REAL NOT NULL,
+    task TEXT,
+    complexity TEXT,
+    model_id TEXT,
+    tier TEXT,
+    api_key_id TEXT,
+    status TEXT,
+    escalated INTEGER,
+    tokens_total INTEGER,
+    latency_ms INTEGER,
+    cost_usd REAL,
+    queue_wait_ms REAL,
+    provider_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_model_ts ON events (model_id, ts);
+CREATE INDEX IF NOT EXISTS idx_events_task_ts ON events (task, ts);
+CREATE INDEX IF NOT EXISTS idx_events_key_ts ON events (api_key_id, ts);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    model_id TEXT NOT NULL,
+    task TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    api_key_id TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    cost_usd REAL NOT NULL,
+    latency_ms_sum INTEGER NOT NULL,
+    escalations INTEGER NOT NULL,
+    PRIMARY KEY (period, bucket, model_id, task, tier, api_key_id)
+);
+
+CREATE TABLE IF NOT EXISTS ingest_offsets (
+    source TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO rollups (period, bucket, model_id, task, tier, api_key_id,
+                     requests, tokens, cost_usd, latency_ms_sum, escalations)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (period, bucket, model_id, task, tier, api_key_id) DO UPDATE SET
+    requests = requests + excluded.requests,
+    tokens = tokens + excluded.tokens,
+    cost_usd = cost_usd + excluded.cost_usd,
+    latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum,
+    escalations = escalations + excluded.escalations
+"""
+
+
+def _epoch(ts: Any) -> float:
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    try:
+        return datetime.datetime.fromisoformat(ts).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+class MetricsStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------- Write ----------
+    def write_batch(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Insert events (deduplicated by prompt_id) and fold them into rollups. Returns rows inserted."""
+        rollups: Dict[Tuple, List] = {}
+        inserted = 0
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN")
+            try:
+                for ev in events:
+                    ts = _epoch(ev.get("ts"))
+                    row = (
+                        ev.get("prompt_id"), ts, ev.get("task", "unknown"), ev.get("complexity", "unknown"),
+                        ev.get("model_id", "unknown"), ev.get("tier", "unknown"), ev.get("api_key_id") or "anonymous",
+                        ev.get("status"), int(bool(ev.get("escalated"))), int(ev.get("tokens_total", 0) or 0),
+                        int(ev.get("latency_ms", 0) or 0), float(ev.get("cost_est_usd", 0) or 0),
+                        ev.get("queue_wait_ms"), ev.get("provider_ms"),
+                    )
+                    cur.execute(
+                        "INSERT OR IGNORE INTO events (prompt_id, ts, task, complexity, model_id, tier, api_key_id, "
+                        "status, escalated, tokens_total, latency_ms, cost_usd, queue_wait_ms, provider_ms) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        row,
+                    )
+                    if cur.rowcount != 1:
+                        continue  # Already ingested (e.g. JSONL backfill overlapping live writes)
+                    inserted += 1
+                    for period, span in PERIODS.items():
+                        key = (period, int(ts // span) * span, row[4], row[2], row[5], row[6])
+                        acc = rollups.setdefault(key, [0, 0, 0.0, 0, 0])
+                        acc[0] += 1
+                        acc[1] += row[9]
+                        acc[2] += row[11]
+                        acc[3] += row[10]
+                        acc[4] += row[8]
+                cur.executemany(UPSERT_ROLLUP, [k + tuple(v) for k, v in rollups.items()])
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return inserted
+
+    def get_offset(self, source: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT offset FROM ingest_offsets WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else 0
+
+    def set_offset(self, source: str, offset: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ingest_offsets (source, offset) VALUES (?, ?) "
+                "ON CONFLICT (source) DO UPDATE SET offset = excluded.offset",
+                (source, offset),
+            )
+
+    # ---------- Read ----------
+    def summary(self, since: Optional[float] = None, until: Optional[float] = None,
+                group_by: Optional[str] = None, filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        Totals over [since, until) from hourly rollups (hour precision),
+        optionally grouped by model / task / tier / api_key and filtered on the same keys.
+        """
+        return self._rollup_query("hour", since, until, group_by, filters, by_bucket=False)
+
+    def timeline(self, period: str = "day", since: Optional[float] = None, until: Optional[float] = None,
+                 group_by: Optional[str] = None, filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """One row per hour/day bucket (and group)."""
+        return self._rollup_query(period, since, until, group_by, filters, by_bucket=True)
+
+    def _rollup_query(self, period, since, until, group_by, filters, by_bucket) -> List[Dict[str, Any]]:
+        if period not in PERIODS:
+            raise ValueError(f"Unknown rollup period: {period}")
+        if group_by is not None and group_by not in GROUP_COLUMNS:
+            raise ValueError(f"Unknown group: {group_by}")
+
+        where, params = ["period = ?"], [period]
+        if since is not None:
+            where.append("bucket >= ?")
+            params.append(int(since // PERIODS[period]) * PERIODS[period])
+        if until is not None:
+            where.append("bucket < ?")
+            params.append(until)
+        for key, value in (filters or {}).items():
+            if key not in GROUP_COLUMNS:
+                raise ValueError(f"Unknown filter: {key}")
+            where.append(f"{GROUP_COLUMNS[key]} = ?")
+            params.append(value)
+
+        keys = []
+        if by_bucket:
+            keys.append("bucket")
+        if group_by:
+            keys.append(GROUP_COLUMNS[group_by])
+        select_keys = "".join(f"{k}, " for k in keys)
+        group_sql = f"GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}" if keys else ""
+
+        sql = (
+            f"SELECT {select_keys}SUM(requests), SUM(tokens), SUM(cost_usd), SUM(latency_ms_sum), SUM(escalations) "
+            f"FROM rollups WHERE {' AND '.join(where)} {group_sql}"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        out = []
+        for row in rows:
+            reqs, tokens, cost, lat, esc = row[len(keys):]
+            if not reqs:
+                continue
+            item = dict(zip(["bucket", "group"] if by_bucket else ["group"], row[:len(keys)]))
+            if not group_by:
+                item.pop("group", None)
+            item.update({
+                "requests": reqs,
+                "tokens": tokens,
+                "cost_usd": round(cost, 6),
+                "avg_latency_ms": int(lat / reqs),
+                "escalations": esc,
+            })
+            out.append(item)
+        return out
+
+    def events(self, since: Optional[float] = None, until: Optional[float] = None,
+               filters: Optional[Dict[str, str]] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Raw events (newest first) using the ts / (key, ts) indexes."""
+        where, params = ["1 = 1"], []
+        if since is not None:
+            where.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("ts < ?")
+            params.append(until)
+        for key, value in (filters or {}).items():
+            where.append(f"{GROUP_COLUMNS[key]} = ?")
+            params.append(value)
+        params.append(limit)
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT * FROM events WHERE {' AND '.join(where)} ORDER BY ts DESC LIMIT ?", params
+            )
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+
+class BatchWriter:
+    """Buffers events and writes them to the store from a background thread."""
+
+    def __init__(self, store: MetricsStore, batch_size: int = BATCH_SIZE, flush_sec: float = FLUSH_INTERVAL_SEC):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_sec = flush_sec
+        self._queue: queue.Queue = queue.Queue(maxsize=100_000)
+        self._thread = threading.Thread(target=self._run, name="metrics-store-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, event: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            logger.warning("Metrics store queue full, dropping event")
+
+    def _drain(self, first: Any = None, wait: bool = True) -> int:
+        batch = []
+        markers = 0
+        item = first
+        deadline = time.time() + self.flush_sec
+        while True:
+            if item is _FLUSH:
+                markers += 1  # Flush requested: write what we hold now
+                break
+            if item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+            try:
+                timeout = max(0.0, deadline - time.time())
+                item = self._queue.get(timeout=timeout) if wait else self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if batch:
+            try:
+                self.store.write_batch(batch)
+            except Exception as e:
+                logger.error(f"Metrics store batch write failed ({len(batch)} events): {e}")
+        for _ in range(len(batch) + markers):
+            self._queue.task_done()
+        return len(batch) + markers
+
+    def _run(self):
+        while True:
+            self._drain(self._queue.get())
+
+    def flush(self):
+        """Write everything queued so far, including a batch the writer thread is holding."""
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+
+_FLUSH = object()
+
+
+# Singleton (built lazily so env overrides apply)
+_writer: Optional[BatchWriter] = None
+_writer_lock = threading.Lock()
+_disabled = False
+
+
+def get_writer() -> Optional[BatchWriter]:
+    global _writer, _disabled
+    if _writer is None and not _disabled:
+        with _writer_lock:
+            path = os.getenv("METRICS_DB_PATH", METRICS_DB_PATH)
+            if _writer is None and not _disabled:
+                if not path:
+                    _disabled = True
+                    return None
+                try:
+                    _writer = BatchWriter(MetricsStore(path))
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"Metrics store disabled ({path}): {e}")
+                    _disabled = True
+    return _writer
@@ -0,0 +1,195 @@
+"""
+Model warm-up and keep-alive manager.
+
+Loading a local model into VRAM takes seconds, so the first request after
+Ollama unloads it pays that cost. This manager:
+- preloads the configured local models on every endpoint at startup;
+- tracks recent demand per model (requests in the last MODEL_DEMAND_WINDOW_SEC);
+- periodically re-issues a keep-alive for models in demand so they stay
+  resident, and unloads (keep_alive=0) resident models that went idle, so a
+  busy model is not evicted by one nobody is using;
+- records cold loads: Ollama reports load_duration on every response, and
+  anything over MODEL_COLD_LOAD_MS means the model had to be (re)loaded.
+
+Ollama loads a model without generating when /api/generate gets no prompt.
+"""
+import asyncio
+import collections
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import Deque, Dict, List, Optional
+
+from services import router_metrics as prom
+from services.ollama_pool import get_pool
+
+logger = logging.getLogger("ai-router.warmup")
+
+# Config from Env
+ENABLED = str(os.getenv("MODEL_WARMUP_ENABLED", "1")) == "1"
+PRELOAD_MODELS = [m.strip() for m in os.getenv("MODEL_WARMUP_PRELOAD", "").split(",") if m.strip()]  # empty = all local
+INTERVAL_SEC = float(os.getenv("MODEL_WARMUP_INTERVAL_SEC", "60"))
+DEMAND_WINDOW_SEC = float(os.getenv("MODEL_DEMAND_WINDOW_SEC", "600"))
+HOT_MIN_REQUESTS = int(os.getenv("MODEL_HOT_MIN_REQUESTS", "1"))
+HOT_KEEP_ALIVE = os.getenv("MODEL_HOT_KEEP_ALIVE", "30m")
+IDLE_UNLOAD_SEC = float(os.getenv("MODEL_IDLE_UNLOAD_SEC", "1800"))  # 0 = never unload
+COLD_LOAD_MS = float(os.getenv("MODEL_COLD_LOAD_MS", "500"))
+REQUEST_TIMEOUT_SEC = float(os.getenv("MODEL_WARMUP_TIMEOUT_SEC", "120"))
+
+LOAD_HISTORY_SEC = 3600
+
+
+class WarmupManager:
+    def __init__(self, pool=None):
+        self.pool = pool or get_pool()
+        self._lock = threading.Lock()
+        self._demand: Dict[str, Deque[float]] = collections.defaultdict(collections.deque)
+        self._last_used: Dict[str, float] = {}
+        # (ts, model, load_seconds) of cold loads in the last hour
+        self._loads: Deque[tuple] = collections.deque()
+        self._task: Optional[asyncio.Task] = None
+        self.resident: Dict[str, List[str]] = {}  # endpoint url -> loaded model names (/api/ps)
+        self._started = time.time()  # Preloaded models count as used at startup
+
+    # ---------- Demand / load tracking ----------
+    def record_demand(self, model: str, now: float = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            q = self._demand[model]
+            q.append(now)
+            self._last_used[model] = now
+            self._trim(q, now)
+
+    @staticmethod
+    def _trim(q: Deque[float], now: float):
+        while q and q[0] < now - DEMAND_WINDOW_SEC:
+            q.popleft()
+
+    def demand(self, model: str, now: float = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            q = self._demand.get(model)
+            if not q:
+                return 0
+            self._trim(q, now)
+            return len(q)
+
+    def record_load(self, model: str, load_sec: float, now: float = None) -> bool:
+        """Record load time reported by Ollama; returns True if it was a cold load."""
+        if load_sec * 1000 < COLD_LOAD_MS:
+            return False  # Already resident
+        now = time.time() if now is None else now
+        with self._lock:
+            self._loads.append((now, model, load_sec))
+            while self._loads and self._loads[0][0] < now - LOAD_HISTORY_SEC:
+                self._loads.popleft()
+        prom.observe_model_load(model, load_sec)
+        logger.info(f"Cold load of {model}: {load_sec * 1000:.0f} ms")
+        return True
+
+    def stats(self, now: float = None) -> Dict:
+        now = time.time() if now is None else now
+        with self._lock:
+            loads = [load for load in self._loads if load[0] >= now - LOAD_HISTORY_SEC]
+        models = set(self.pool.by_model) | {load[1] for load in loads}
+        out = {}
+        for model in sorted(models):
+            mine = [load for load in loads if load[1] == model]
+            out[model] = {
+                "requests_in_window": self.demand(model, now),
+                "cold_loads_1h": len(mine),
+                "load_seconds_1h": round(sum(load[2] for load in mine), 3),
+                "resident_on": [url for url, names in self.resident.items() if model in names],
+            }
+        return {
+            "models": out,
+            "load_seconds_1h": round(sum(load[2] for load in loads), 3),
+            "cold_loads_1h": len(loads),
+        }
+
+    # ---------- Ollama calls ----------
+    async def _keep_alive(self, client, url: str, model: str, keep_alive):
+        t0 = time.perf_counter()
+        resp = await client.post(
+            f"{url}/api/generate",
+            json={"model": model, "keep_alive": keep_alive, "stream": False},
+            timeout=REQUEST_TIMEOUT_SEC,
+        )
+        resp.raise_for_status()
+        if keep_alive != 0:
+            data = resp.json() if resp.content else {}
+            load_ns = data.get("load_duration") or 0
+            self.record_load(model, load_ns / 1e9 if load_ns else time.perf_counter() - t0)
+
+    async def _refresh_resident(self, client):
+        for url in list(self.pool.endpoints):
+            try:
+                resp = await client.get(f"{url}/api/ps", timeout=5)
+                resp.raise_for_status()
+                self.resident[url] = [m.get("name") for m in resp.json().get("models", [])]
+            except Exception as e:
+                logger.debug(f"/api/ps failed on {url}: {e}")
+
+    async def preload(self, client, models: List[str] = None):
+        models = models or PRELOAD_MODELS or list(self.pool.by_model)
+        for model in models:
+            for url in self.pool.by_model.get(model, []):
+                try:
+                    await self._keep_alive(client, url, model, HOT_KEEP_ALIVE)
+                    logger.info(f"Preloaded {model} on {url}")
+                except Exception as e:
+                    logger.warning(f"Preload of {model} on {url} failed: {e}")
+
+    async def tick(self, client, now: float = None):
+        """One maintenance pass: keep hot models resident, unload idle ones."""
+        now = time.time() if now is None else now
+        await self._refresh_resident(client)
+        hot_models = {m for m in self.pool.by_model if self.demand(m, now) >= HOT_MIN_REQUESTS}
+        for model, urls in list(self.pool.by_model.items()):
+            hot = model in hot_models
+            idle_for = now - self._last_used.get(model, self._started)
+            for url in urls:
+                loaded = self.resident.get(url, [])
+                resident = model in loaded
+                # Never evict another hot model to load this one (avoids swap thrash on one GPU)
+                blocked = any(m in hot_models for m in loaded if m != model)
+                try:
+                    if hot and (resident or not blocked):
+                        await self._keep_alive(client, url, model, HOT_KEEP_ALIVE)
+                    elif resident and IDLE_UNLOAD_SEC and idle_for >= IDLE_UNLOAD_SEC:
+                        await self._keep_alive(client, url, model, 0)
+                        logger.info(f"Unloaded idle model {model} from {url}")
+                except Exception as e:
+                    logger.debug(f"Keep-alive for {model} on {url} failed: {e}")
+
+    async def _run(self):
+        import httpx
+        async with httpx.AsyncClient() as client:
+            await self.preload(client)
+            while True:
+                await asyncio.sleep(INTERVAL_SEC)
+                await self.tick(client)
+
+    def start(self):
+        if self._task is None and ENABLED:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+# Singleton
+_manager: Optional[WarmupManager] = None
+
+
+def get_manager() -> WarmupManager:
+    global _manager
+    if _manager is None:
+        _manager = WarmupManager()
+    return _manager
@@ -0,0 +1,219 @@
+"""
+Ollama endpoint pool.
+
+Local models can be served by several Ollama hosts. The pool tracks, per
+endpoint, how many requests are outstanding (queued on its GPU lane or
+running) and whether it is healthy, and routes each request to the healthy
+endpoint with the fewest outstanding requests.
+
+Health is checked actively (GET /api/tags on a background task, which also
+records which models each host has) and passively (a connection error marks
+the endpoint down until the next successful check).
+
+Endpoints per model, highest precedence first:
+1. `base_urls` on the registry entry
+2. OLLAMA_ENDPOINTS (comma-separated, shared by all local models)
+3. OLLAMA_BASE_URL / OLLAMA_URL
+4. `base_url` on the registry entry
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger("ai-router.ollama-pool")
+
+# Config from Env
+HEALTH_INTERVAL_SEC = float(os.getenv("OLLAMA_HEALTH_INTERVAL_SEC", "10"))
+HEALTH_TIMEOUT_SEC = float(os.getenv("OLLAMA_HEALTH_TIMEOUT_SEC", "2"))
+DEFAULT_URL = "http://localhost:11434"
+
+_current_endpoint: contextvars.ContextVar = contextvars.ContextVar("ai_router_ollama_endpoint", default=None)
+
+
+def resolve_base_urls(base_urls: Optional[List[str]] = None, registry_url: Optional[str] = None) -> List[str]:
+    """Endpoint URLs for a local model (see module docstring for precedence)."""
+    if base_urls:
+        urls = list(base_urls)
+    elif os.getenv("OLLAMA_ENDPOINTS"):
+        urls = os.getenv("OLLAMA_ENDPOINTS").split(",")
+    else:
+        urls = [os.getenv("OLLAMA_BASE_URL") or os.getenv("OLLAMA_URL") or registry_url or DEFAULT_URL]
+    out = []
+    for u in urls:
+        u = u.strip().rstrip("/")
+        if u and u not in out:
+            out.append(u)
+    return out
+
+
+class Endpoint:
+    __slots__ = ("url", "lane", "healthy", "outstanding", "failures", "last_check", "last_error", "models")
+
+    def __init__(self, url: str, lane: Optional[str]):
+        self.url = url
+        self.lane = lane  # GPU queue lane (None = the default gpu:queue keys)
+        self.healthy = True
+        self.outstanding = 0
+        self.failures = 0
+        self.last_check = 0.0
+        self.last_error: Optional[str] = None
+        self.models: List[str] = []  # From /api/tags
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "lane": self.lane or "default",
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "models": self.models,
+        }
+
+
+def _lane_name(url: str) -> str:
+    parsed = urlparse(url)
+    return parsed.netloc or url
+
+
+class OllamaPool:
+    def __init__(self):
+        self.endpoints: Dict[str, Endpoint] = {}
+        self.by_model: Dict[str, List[str]] = {}
+        self._rr = 0
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- Registration ----------
+    def register(self, model: str, urls: List[str]) -> List[str]:
+        """Attach endpoints to a model name; endpoints are shared across models."""
+        with self._lock:
+            for url in urls:
+                if url not in self.endpoints:
+                    self.endpoints[url] = Endpoint(url, None)
+            self.by_model[model] = list(urls)
+            self._assign_lanes()
+        return urls
+
+    def _assign_lanes(self):
+        # A single host keeps the legacy gpu:queue keys; several hosts get a lane each
+        multi = len(self.endpoints) > 1
+        for ep in self.endpoints.values():
+            ep.lane = _lane_name(ep.url) if multi else None
+
+    # ---------- Selection ----------
+    def pick(self, model: str) -> Optional[Endpoint]:
+        """Healthy endpoint with the fewest outstanding requests (any endpoint if all are down)."""
+        urls = self.by_model.get(model) or list(self.endpoints)
+        candidates = [self.endpoints[u] for u in urls if u in self.endpoints]
+        if not candidates:
+            return None
+        healthy = [ep for ep in candidates if ep.healthy] or candidates
+        with self._lock:
+            self._rr += 1
+            least = min(ep.outstanding for ep in healthy)
+            tied = [ep for ep in healthy if ep.outstanding == least]
+            return tied[self._rr % len(tied)]
+
+    @contextlib.asynccontextmanager
+    async def lease(self, model: str):
+        """Hold an endpoint for one request (queue wait + call); yields None if unknown."""
+        ep = self.pick(model)
+        if ep is None:
+            yield None
+            return
+        with self._lock:
+            ep.outstanding += 1
+        token = _current_endpoint.set(ep.url)
+        try:
+            yield ep
+        except Exception as e:
+            if _is_connection_error(e):
+                self.mark_down(ep, e)
+            raise
+        finally:
+            _current_endpoint.reset(token)
+            with self._lock:
+                ep.outstanding -= 1
+
+    def mark_down(self, ep: Endpoint, error: Exception):
+        if ep.healthy:
+            logger.warning(f"Ollama endpoint {ep.url} marked unhealthy: {error}")
+        ep.healthy = False
+        ep.failures += 1
+        ep.last_error = str(error)[:200]
+
+    # ---------- Health checks ----------
+    async def check(self, client) -> None:
+        async def _one(ep: Endpoint):
+            try:
+                resp = await client.get(f"{ep.url}/api/tags", timeout=HEALTH_TIMEOUT_SEC)
+                resp.raise_for_status()
+                ep.models = [m.get("name") for m in resp.json().get("models", [])]
+                if not ep.healthy:
+                    logger.info(f"Ollama endpoint {ep.url} is healthy again")
+                ep.healthy = True
+                ep.last_error = None
+            except Exception as e:
+                self.mark_down(ep, e)
+            ep.last_check = time.time()
+
+        await asyncio.gather(*[_one(ep) for ep in list(self.endpoints.values())])
+
+    async def _run(self):
+        import httpx
+        async with httpx.AsyncClient() as client:
+            while True:
+                await self.check(client)
+                await asyncio.sleep(HEALTH_INTERVAL_SEC)
+
+    def start(self):
+        """Start active health checks (only useful with more than one endpoint)."""
+        if self._task is None and len(self.endpoints) > 1 and HEALTH_INTERVAL_SEC > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def lanes(self) -> List[Optional[str]]:
+        return [ep.lane for ep in self.endpoints.values()]
+
+    def status(self) -> Dict:
+        return {
+            "endpoints": [ep.to_dict() for ep in self.endpoints.values()],
+            "models": dict(self.by_model),
+        }
+
+
+def _is_connection_error(e: Exception) -> bool:
+    """Host unreachable (not slow generations or GPU queue timeouts)."""
+    if isinstance(e, ConnectionError):
+        return True
+    try:
+        import httpx
+        return isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+    except ImportError:
+        return False
+
+
+def current_endpoint() -> Optional[str]:
+    """Endpoint URL leased for the current request (None outside a lease)."""
+    return _current_endpoint.get()
+
+
+# Singleton
+_pool = OllamaPool()
+
+
+def get_pool() -> OllamaPool:
+    return _pool
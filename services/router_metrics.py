@@ -0,0 +1,165 @@
+"""
+Router-specific Prometheus collectors.
+
+Registered on the default prometheus_client registry, so they are served by the
+same /metrics endpoint that prometheus-fastapi-instrumentator exposes.
+
+Label values are clamped to known domains (registry model ids, configured task
+types, fixed complexity levels and escalation reasons); anything else is
+reported as "other" so cardinality stays bounded whatever clients send.
+"""
+from typing import Iterable
+
+from prometheus_client import Counter, Histogram
+
+COMPLEXITIES = {"low", "medium", "high", "critical"}
+ESCALATION_REASONS = {
+    "empty_response",
+    "missing_code_block",
+    "missing_review_content",
+    "missing_structure_bullets",
+}
+JUDGE_OUTCOMES = {"refined", "unparsed", "error"}
+TOKEN_KINDS = {"prompt", "completion"}
+
+_domains = {
+    "model": set(),
+    "task": set(),
+    "complexity": COMPLEXITIES,
+    "reason": ESCALATION_REASONS,
+    "outcome": JUDGE_OUTCOMES,
+    "tier": {"local", "mini", "standard", "reasoning", "elite"},
+    "provider": {"ollama", "openai"},
+    "kind": TOKEN_KINDS,
+    "summary_cache": {"hit", "partial", "miss", "none"},
+    "local_model": set(),
+}
+
+# ---------- Collectors ----------
+DECISIONS = Counter(
+    "ai_router_decisions_total",
+    "Routing decisions by inferred task, complexity and selected model.",
+    ["task", "complexity", "model"],
+)
+ESCALATIONS = Counter(
+    "ai_router_escalations_total",
+    "Quality-gate escalations by failure reason.",
+    ["reason"],
+)
+FALLBACKS = Counter(
+    "ai_router_fallbacks_total",
+    "Fallbacks from a failing model to another one.",
+    ["from_model", "to_model"],
+)
+JUDGE_CALLS = Counter(
+    "ai_router_judge_calls_total",
+    "LLM judge (classifier) calls by outcome.",
+    ["outcome"],
+)
+COST_USD = Counter(
+    "ai_router_cost_usd_total",
+    "Estimated spend in USD by pricing tier.",
+    ["tier"],
+)
+QUEUE_WAIT = Histogram(
+    "ai_router_gpu_queue_wait_seconds",
+    "Time spent waiting for a GPU queue slot.",
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PROVIDER_LATENCY = Histogram(
+    "ai_router_provider_latency_seconds",
+    "Provider call latency per attempt.",
+    ["provider", "model"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 6, 10, 20, 40, 80, 120),
+)
+TOKENS = Histogram(
+    "ai_router_tokens",
+    "Estimated tokens per request.",
+    ["kind"],
+    buckets=(16, 64, 256, 1024, 4096, 16384, 65536, 262144),
+)
+COMPACTIONS = Counter(
+    "ai_router_history_compactions_total",
+    "Requests whose older turns were summarized, by summary cache result.",
+    ["model", "summary_cache"],
+)
+TOKENS_SAVED = Counter(
+    "ai_router_history_tokens_saved_total",
+    "Prompt tokens removed by history compaction (less prefill on the model).",
+    ["model"],
+)
+MODEL_LOADS = Counter(
+    "ai_router_model_cold_loads_total",
+    "Local model loads into VRAM (requests or warm-ups that paid a cold start).",
+    ["model"],
+)
+MODEL_LOAD_SECONDS = Counter(
+    "ai_router_model_load_seconds_total",
+    "Time spent loading local models (rate() gives load time per second of traffic).",
+    ["model"],
+)
+GPU_MODEL_SWITCHES = Counter(
+    "ai_router_gpu_model_switches_total",
+    "GPU queue slots that started a different model than the previous one on the lane.",
+    ["lane"],
+)
+
+
+def set_label_domains(models: Iterable[str] = (), tasks: Iterable[str] = ()):
+    """Register the allowed model ids and task types (called by graph.router at import)."""
+    _domains["model"] = set(models)
+    _domains["task"] = set(tasks)
+
+
+def add_local_models(names: Iterable[str]):
+    """Register Ollama model names (called by providers.ollama_client.make_ollama)."""
+    _domains["local_model"] |= set(names)
+
+
+def _bound(dim: str, value) -> str:
+    value = str(value) if value is not None else "unknown"
+    return value if value in _domains[dim] else "other"
+
+
+# ---------- Helpers used by the router ----------
+def observe_decision(task: str, complexity: str, model: str):
+    DECISIONS.labels(_bound("task", task), _bound("complexity", complexity), _bound("model", model)).inc()
+
+
+def observe_escalation(reason: str):
+    ESCALATIONS.labels(_bound("reason", reason)).inc()
+
+
+def observe_fallback(from_model: str, to_model: str):
+    FALLBACKS.labels(_bound("model", from_model), _bound("model", to_model)).inc()
+
+
+def observe_judge_call(outcome: str):
+    JUDGE_CALLS.labels(_bound("outcome", outcome)).inc()
+
+
+def observe_attempt(provider: str, model: str, queue_wait_sec: float, provider_sec: float):
+    if provider == "ollama":
+        QUEUE_WAIT.observe(queue_wait_sec)
+    PROVIDER_LATENCY.labels(_bound("provider", provider), _bound("model", model)).observe(provider_sec)
+
+
+def observe_usage(tier: str, cost_usd: float, prompt_tokens: int, completion_tokens: int):
+    COST_USD.labels(_bound("tier", tier)).inc(max(0.0, cost_usd))
+    TOKENS.labels("prompt").observe(prompt_tokens)
+    TOKENS.labels("completion").observe(completion_tokens)
+
+
+def observe_compaction(model: str, tokens_saved: int, summary_cache: str):
+    COMPACTIONS.labels(_bound("model", model), _bound("summary_cache", summary_cache)).inc()
+    TOKENS_SAVED.labels(_bound("model", model)).inc(max(0, tokens_saved))
+
+
+def observe_model_load(model: str, load_sec: float):
+    label = _bound("local_model", model)
+    MODEL_LOADS.labels(label).inc()
+    MODEL_LOAD_SECONDS.labels(label).inc(max(0.0, load_sec))
+
+
+def observe_model_switch(lane: str = None):
+    GPU_MODEL_SWITCHES.labels(lane or "default").inc()
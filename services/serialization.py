@@ -0,0 +1,116 @@
+"""
+JSON serialization layer for responses, SSE/NDJSON streams and log lines.
+
+One place decides how JSON is encoded, backed by orjson when it is installed
+(stdlib json otherwise, same output modulo whitespace):
+- dumps() returns bytes that go straight into the ASGI response body, with no
+  str round trip; JSONBytesResponse is the app's default response class.
+- sse_event() pre-encodes the constant part of each SSE frame
+  ("event: <name>\\ndata: {"type":"<name>","sequence_number":") once per event
+  type and only serializes the per-event payload.
+- preencoded() encodes a large value (the completion text) once so it can be
+  embedded in several frames without being escaped again (orjson >= 3.10).
+- dumps_str() for log lines and JSONL files.
+
+Unknown objects (datetimes, dataclasses, numpy scalars, ...) are encoded
+instead of raising; anything else falls back to str().
+"""
+import dataclasses
+import json
+from typing import Any, Dict, Optional
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # Optional dependency: stdlib json fallback
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+_Fragment = getattr(orjson, "Fragment", None)
+_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
+
+
+def _default(obj: Any) -> Any:
+    if hasattr(obj, "model_dump"):  # pydantic models
+        return obj.model_dump()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, "tolist"):  # numpy arrays / scalars (stdlib fallback)
+        return obj.tolist()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_str(obj: Any) -> str:
+    """JSON text for log lines and JSONL files."""
+    return dumps(obj).decode("utf-8")
+
+
+def ndjson_line(obj: Any) -> bytes:
+    """One NDJSON record (newline-terminated)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+    return dumps(obj) + b"\n"
+
+
+def preencoded(value: Any) -> Any:
+    """
+    Encode `value` once for embedding in later dumps() calls.
+
+    Returns an orjson Fragment (copied verbatim into the output) when supported,
+    otherwise the value itself (encoded again each time).
+    """
+    if _Fragment is not None:
+        return _Fragment(dumps(value))
+    return value
+
+
+# ---------- SSE ----------
+_SSE_PREFIXES: Dict[tuple, bytes] = {}
+
+
+def _sse_prefix(event: str, sequenced: bool) -> bytes:
+    key = (event, sequenced)
+    prefix = _SSE_PREFIXES.get(key)
+    if prefix is None:
+        name = dumps(event)
+        prefix = b"event: " + event.encode("utf-8") + b"\ndata: {\"type\":" + name
+        if sequenced:
+            prefix += b",\"sequence_number\":"
+        _SSE_PREFIXES[key] = prefix
+    return prefix
+
+
+def sse_event(event: str, payload: Dict[str, Any], sequence_number: Optional[int] = None) -> bytes:
+    """
+    One SSE frame whose data is {"type": event, "sequence_number": n, **payload}.
+
+    Only `payload` is serialized per call; the envelope bytes are cached per event type.
+    """
+    body = dumps(payload)
+    if sequence_number is None:
+        parts = [_sse_prefix(event, False)]
+    else:
+        parts = [_sse_prefix(event, True), str(int(sequence_number)).encode("ascii")]
+    parts.append(b"," + body[1:] if len(body) > 2 else b"}")
+    parts.append(b"\n\n")
+    return b"".join(parts)
+
+
+class JSONBytesResponse(Response):
+    """JSON response rendered by dumps() (bytes straight to the ASGI body)."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
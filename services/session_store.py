@@ -0,0 +1,135 @@
+"""
+Per-conversation routing state (sticky routing).
+
+Re-classifying every turn from scratch lets a conversation flip between models
+mid-session (e.g. local-chat <-> local-code), which forces GPU model swaps and
+throws away Ollama's KV/prefix cache. This store remembers the last routing
+decision per conversation so the router can keep it until a new turn changes
+the classification meaningfully (see graph/router.py _node_classify).
+
+A conversation is identified by:
+- an explicit id (X-Conversation-Id header), scoped to the API key; or
+- a chained hash of its messages: after a turn the decision is stored under
+  hash(messages + assistant reply), which is exactly the prefix the client
+  sends back with its next user message. Edited or truncated histories simply
+  miss and are classified fresh.
+
+In-memory, bounded (LRU) and expiring (TTL); state is lost on restart.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("ai-router.sessions")
+
+# Config from Env
+ENABLED = str(os.getenv("STICKY_ROUTING_ENABLED", "1")) == "1"
+MAX_SESSIONS = int(os.getenv("STICKY_MAX_SESSIONS", "10000"))
+TTL_SEC = float(os.getenv("STICKY_TTL_SEC", "1800"))
+SWITCH_CONFIDENCE = float(os.getenv("STICKY_SWITCH_CONFIDENCE", "0.8"))  # Confidence needed to change task
+
+
+@dataclass
+class StickyRoute:
+    task: str
+    complexity: str
+    confidence: float
+    model_id: str
+    turns: int = 1
+    updated_at: float = 0.0
+
+
+def chain_key(previous: str, role: str, content: Any) -> str:
+    """Extend a conversation hash by one message."""
+    h = hashlib.sha256(previous.encode("utf-8"))
+    h.update(b"\x00" + str(role).encode("utf-8") + b"\x00")
+    h.update(str(content).strip().encode("utf-8", errors="replace"))
+    return h.hexdigest()
+
+
+def prefix_keys(messages: List[Dict[str, Any]], scope: str = "") -> tuple:
+    """
+    (lookup key, key of the whole conversation) for a request.
+
+    The lookup key covers the messages up to the last assistant reply, i.e. the
+    conversation as it stood after the previous turn (None on the first turn).
+    """
+    key = chain_key("", "scope", scope)
+    lookup = None
+    for m in messages:
+        role = m.get("role", "user")
+        key = chain_key(key, role, m.get("content", ""))
+        if role == "assistant":
+            lookup = key
+    return lookup, key
+
+
+class SessionStore:
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_sec: float = TTL_SEC):
+        self.max_sessions = max_sessions
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, StickyRoute]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Optional[str], now: float = None) -> Optional[StickyRoute]:
+        if not key:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            route = self._sessions.get(key)
+            if route is not None and now - route.updated_at > self.ttl_sec:
+                del self._sessions[key]
+                route = None
+            if route is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(key)
+            self.hits += 1
+            return route
+
+    def put(self, key: str, route: StickyRoute, now: float = None):
+        route.updated_at = time.time() if now is None else now
+        with self._lock:
+            self._sessions[key] = route
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": ENABLED,
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Singleton
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> SessionStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore()
+    return _store
@@ -0,0 +1,202 @@
+"""
+Token counting service.
+
+Counts tokens with the real tokenizer of each model family, preloaded in a
+thread at startup (preload()) and otherwise loaded the first time the family
+is needed:
+1. A HuggingFace tokenizer.json in TOKENIZER_DIR (<family>.json), via `tokenizers`
+   (fully offline; used for local Llama/Hermes/DeepSeek models).
+2. A tiktoken encoding (OpenAI models natively; local families use the closest
+   BPE as a proxy). Only used when TIKTOKEN_CACHE_DIR is set: without it tiktoken
+   would download its BPE files on first use.
+3. The cheap len/4 estimator when neither is available.
+
+Per-message counts are memoized by content hash, so a multi-turn history that
+is resent every turn only pays for the new messages.
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("ai-router.tokens")
+
+# Config from Env
+BACKEND = os.getenv("TOKENIZER_BACKEND", "auto").lower()  # auto | estimate
+TOKENIZER_DIR = os.getenv("TOKENIZER_DIR")
+DEFAULT_FAMILY = os.getenv("TOKENIZER_DEFAULT_FAMILY", "cl100k_base")
+CACHE_SIZE = int(os.getenv("TOKENIZER_CACHE_SIZE", "16384"))
+
+ESTIMATE = "estimate"
+
+# Local families fall back to the nearest tiktoken BPE when no tokenizer.json is shipped
+TIKTOKEN_PROXY = {
+    "o200k_base": "o200k_base",
+    "cl100k_base": "cl100k_base",
+    "llama3": "cl100k_base",
+    "deepseek": "cl100k_base",
+}
+
+# Chat framing overhead (OpenAI cookbook): per message + reply priming
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough heuristic: ~4 chars per token."""
+    return math.ceil(len(text) / 4)
+
+
+def family_for_model(model_name: Optional[str]) -> str:
+    """Map a provider model name (e.g. gpt-4o, hermes3:8b) to a tokenizer family."""
+    if not model_name:
+        return DEFAULT_FAMILY
+    n = model_name.lower()
+    if n.startswith(("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")):
+        return "o200k_base"
+    if n.startswith(("gpt-4", "gpt-3.5")):
+        return "cl100k_base"
+    if "deepseek" in n:
+        return "deepseek"
+    if "llama" in n or "hermes" in n:
+        return "llama3"
+    return DEFAULT_FAMILY
+
+
+class TokenCounter:
+    def __init__(self, backend: str = BACKEND, tokenizer_dir: Optional[str] = TOKENIZER_DIR,
+                 cache_size: int = CACHE_SIZE):
+        self.backend = backend
+        self.tokenizer_dir = tokenizer_dir
+        self.cache_size = cache_size
+        self._encoders: Dict[str, object] = {}
+        self._loading: set = set()  # Families being loaded by another thread
+        self._cache: "OrderedDict[tuple, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- Tokenizer loading ----------
+    def _encoder(self, family: str):
+        """
+        Lazily load the encoder for a family (None => estimator).
+
+        The load (tiktoken may download its BPE file) runs outside the lock;
+        other threads use the estimator until it finishes instead of waiting.
+        """
+        if self.backend == ESTIMATE or family == ESTIMATE:
+            return None
+        if family in self._encoders:
+            return self._encoders[family]
+
+        with self._lock:
+            if family in self._encoders:
+                return self._encoders[family]
+            if family in self._loading:
+                return None
+            self._loading.add(family)
+        try:
+            encoder = self._load(family)
+        finally:
+            with self._lock:
+                self._loading.discard(family)
+        with self._lock:
+            self._encoders[family] = encoder
+        return encoder
+
+    def _load(self, family: str):
+        if self.tokenizer_dir:
+            path = os.path.join(self.tokenizer_dir, f"{family}.json")
+            if os.path.exists(path):
+                try:
+                    from tokenizers import Tokenizer
+                    tok = Tokenizer.from_file(path)
+                    logger.info(f"Loaded tokenizer {family} from {path}")
+                    return lambda text: len(tok.encode(text, add_special_tokens=False).ids)
+                except Exception as e:
+                    logger.warning(f"Failed to load tokenizer {path}: {e}")
+
+        encoding = TIKTOKEN_PROXY.get(family)
+        if encoding and not os.getenv("TIKTOKEN_CACHE_DIR"):
+            logger.info(f"No tokenizer for {family} (TIKTOKEN_CACHE_DIR unset); using len/4 estimate")
+            return None
+        if encoding:
+            try:
+                import tiktoken
+                enc = tiktoken.get_encoding(encoding)
+                logger.info(f"Loaded tiktoken encoding {encoding} for {family}")
+                return lambda text: len(enc.encode(text, disallowed_special=()))
+            except Exception as e:
+                logger.warning(f"Tokenizer {family} unavailable ({type(e).__name__}); using len/4 estimate")
+        return None
+
+    def preload(self, models: List[str]) -> Dict[str, bool]:
+        """Load the tokenizer families of `models` now (blocking: call from a thread)."""
+        for family in sorted({family_for_model(m) for m in models}):
+            self._encoder(family)
+        return self.stats()["loaded"]
+
+    # ---------- Counting ----------
+    def count_text(self, text: str, model: Optional[str] = None) -> int:
+        family = family_for_model(model)
+        encoder = self._encoder(family)
+        if encoder is None:
+            return estimate_tokens(text)
+        return self._cached(family, text, encoder)
+
+    def count_messages(self, messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+        """Prompt tokens for a chat history, including per-message framing."""
+        family = family_for_model(model)
+        encoder = self._encoder(family)
+        total = TOKENS_PER_REPLY
+        for m in messages:
+            content = str(m.get("content", ""))
+            if encoder is None:
+                total += estimate_tokens(content) + TOKENS_PER_MESSAGE
+            else:
+                total += self._cached(family, content, encoder) + TOKENS_PER_MESSAGE
+        return total
+
+    def _cached(self, family: str, text: str, encoder) -> int:
+        key = (family, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+        with self._lock:
+            n = self._cache.get(key)
+            if n is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return n
+        n = encoder(text)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = n
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return n
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": self.backend,
+            "loaded": {f: enc is not None for f, enc in self._encoders.items()},
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Singleton
+_counter = TokenCounter()
+
+
+def get_counter() -> TokenCounter:
+    return _counter
+
+
+def count_text(text: str, model: Optional[str] = None) -> int:
+    return _counter.count_text(text, model)
+
+
+def count_messages(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    return _counter.count_messages(messages, model)
@@ -0,0 +1,287 @@
+"""
+Lightweight per-request tracing.
+
+A trace is opened per HTTP request (see app.main tracing middleware) and held in
+a ContextVar, so graph nodes, the LLM judge, the GPU queue and provider calls can
+open spans without passing anything around. Finished traces are exported as
+OpenTelemetry OTLP/JSON, either appended to a local file or POSTed to an OTLP
+HTTP collector, and summarized back to the client as a Server-Timing header.
+
+When no exporter is configured and Server-Timing is off, no trace is created
+and span() returns a shared no-op context manager.
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("ai-router.tracing")
+
+# Config from Env
+EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()  # none | file | otlp
+TRACE_FILE = os.getenv("TRACING_FILE", "logs/traces.jsonl")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+SERVER_TIMING = str(os.getenv("SERVER_TIMING_ENABLED", "1")) == "1"
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "ai-router")
+
+# Span names reported in Server-Timing (summed when a stage runs more than once)
+SERVER_TIMING_STAGES = ("classify", "judge", "route", "compact", "invoke", "gpu_queue", "provider")
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("ai_router_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("ai_router_span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "_t0", "_token")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+
+    def __enter__(self):
+        self._t0 = time.perf_counter_ns()
+        self.start_ns = self.trace.to_epoch_ns(self._t0)
+        self._token = _current_span.set(self.span_id)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._t0)
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.trace.spans.append(self)
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """Shared stand-in when tracing is off: enter/exit do nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+        self.trace_id = trace_id or _new_id(128)
+        self.root_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes: Dict[str, Any] = {}
+        self.spans: List[Span] = []
+        self._epoch0 = time.time_ns()
+        self._perf0 = time.perf_counter_ns()
+        self.end_ns = 0
+
+    def to_epoch_ns(self, perf_ns: int) -> int:
+        return self._epoch0 + (perf_ns - self._perf0)
+
+    def add_span(self, name: str, start_perf: float, end_perf: float, **attributes):
+        """Record an already-measured interval (perf_counter seconds) as a span."""
+        s = Span(self, name, _current_span.get() or self.root_id, attributes)
+        s.start_ns = self.to_epoch_ns(int(start_perf * 1e9))
+        s.end_ns = self.to_epoch_ns(int(end_perf * 1e9))
+        self.spans.append(s)
+
+    def server_timing(self) -> str:
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            if s.name in SERVER_TIMING_STAGES:
+                totals[s.name] = totals.get(s.name, 0.0) + s.duration_ms
+        parts = [f"{name};dur={totals[name]:.1f}" for name in SERVER_TIMING_STAGES if name in totals]
+        parts.append(f"total;dur={(time.perf_counter_ns() - self._perf0) / 1e6:.1f}")
+        return ", ".join(parts)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        root = {
+            "traceId": self.trace_id,
+            "spanId": self.root_id,
+            "name": self.name,
+            "kind": 2,  # SERVER
+            "startTimeUnixNano": str(self._epoch0),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _otlp_attributes(self.attributes),
+        }
+        if self.parent_id:
+            root["parentSpanId"] = self.parent_id
+        spans = [root] + [
+            {
+                "traceId": self.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id,
+                "name": s.name,
+                "kind": 1,  # INTERNAL
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": _otlp_attributes(s.attributes),
+            }
+            for s in self.spans
+        ]
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{"scope": {"name": "ai-router"}, "spans": spans}],
+            }]
+        }
+
+
+def _otlp_attributes(attrs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    out = []
+    for k, v in attrs.items():
+        if isinstance(v, bool):
+            value = {"boolValue": v}
+        elif isinstance(v, int):
+            value = {"intValue": str(v)}
+        elif isinstance(v, float):
+            value = {"doubleValue": v}
+        else:
+            value = {"stringValue": str(v)}
+        out.append({"key": k, "value": value})
+    return out
+
+
+# ---------- Exporters ----------
+class FileExporter:
+    """Appends one OTLP/JSON document per trace (OTel file exporter layout)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        line = json.dumps(trace.to_otlp())
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to write trace to {self.path}: {e}")
+
+
+class OtlpHttpExporter:
+    """Batches traces on a background thread and POSTs them to <endpoint>/v1/traces."""
+
+    def __init__(self, endpoint: str, batch_size: int = 64, flush_sec: float = 2.0):
+        self.url = f"{endpoint.rstrip('/')}/v1/traces"
+        self.batch_size = batch_size
+        self.flush_sec = flush_sec
+        self._queue: queue.Queue = queue.Queue(maxsize=2048)
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace.to_otlp())
+        except queue.Full:
+            logger.debug("OTLP export queue full, dropping trace")
+
+    def _run(self):
+        import httpx
+        with httpx.Client(timeout=5.0) as client:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.time() + self.flush_sec
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                    except queue.Empty:
+                        break
+                body = {"resourceSpans": [rs for doc in batch for rs in doc["resourceSpans"]]}
+                try:
+                    client.post(self.url, json=body)
+                except Exception as e:
+                    logger.warning(f"OTLP export to {self.url} failed: {e}")
+
+
+def _build_exporter():
+    if EXPORTER == "file":
+        return FileExporter(TRACE_FILE)
+    if EXPORTER == "otlp":
+        return OtlpHttpExporter(OTLP_ENDPOINT)
+    return None
+
+
+_exporter = _build_exporter()
+
+
+def is_enabled() -> bool:
+    return _exporter is not None or SERVER_TIMING
+
+
+# ---------- API ----------
+def _parse_traceparent(header: Optional[str]):
+    """W3C traceparent: 00-<trace_id>-<parent_id>-<flags>."""
+    if not header:
+        return None, None
+    parts = header.strip().split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+def start_trace(name: str, traceparent: Optional[str] = None) -> Optional[Trace]:
+    """Open a trace for the current context (None when tracing is off)."""
+    if not is_enabled():
+        return None
+    trace_id, parent_id = _parse_traceparent(traceparent)
+    trace = Trace(name, trace_id, parent_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace: Optional[Trace]):
+    if trace is None:
+        return
+    trace.end_ns = time.time_ns()
+    _current_trace.set(None)
+    if _exporter is not None:
+        _exporter.export(trace)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def span(name: str, **attributes):
+    """Context manager timing a stage; no-op outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        return NOOP_SPAN
+    return Span(trace, name, _current_span.get() or trace.root_id, attributes)
+
+
+def record_span(name: str, start_perf: float, end_perf: float, **attributes):
+    """Record an interval measured elsewhere (perf_counter seconds)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start_perf, end_perf, **attributes)
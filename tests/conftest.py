@@ -8,7 +8,7 @@ TEST_API_KEY = "test_secret_key_12345"
 
 
 @pytest.fixture(scope="session", autouse=True)
-def setup_global_env():
+def setup_global_env(tmp_path_factory):
     """
     Set baseline environment variables for the entire test session.
     Used to prevent accidental production connectivity.
@@ -17,6 +17,11 @@ def setup_global_env():
     os.environ["AI_ROUTER_ENV"] = "test"
     # Basic auth key
     os.environ["AI_ROUTER_API_KEY"] = TEST_API_KEY
+    # Keep metric events out of the real logs/metrics.jsonl
+    logs_dir = tmp_path_factory.mktemp("logs")
+    os.environ["METRICS_LOG_PATH"] = str(logs_dir / "metrics.jsonl")
+    os.environ["METRICS_DB_PATH"] = str(logs_dir / "metrics.db")
+    os.environ["JOBS_DB_PATH"] = str(logs_dir / "jobs.db")
 
 
 @pytest.fixture(autouse=True)
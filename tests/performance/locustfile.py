@@ -1,29 +1,110 @@
-from locust import HttpUser, between, task
+"""
+Locust load test covering every API surface (scenarios in tests/performance/scenarios.py).
+
+Streaming requests report two extra metric rows per scenario:
+  TTFT  <scenario>   time to first token (first delta / first batch result)
+  ITL   <scenario>   inter-token latency (gap between consecutive tokens)
+A background poller scrapes /health during the run and reports the GPU queue
+depth as "GPU queue_depth" (the response-time column holds the depth).
+
+Config (env):
+  LOCUST_MIX=production      production | streaming | long_context | auth | route_only
+  LOCUST_METRICS_LOG=logs/metrics.jsonl   task mix source (falls back to built-in shares)
+  LOCUST_HISTORY_TURNS=30    max turns for long_history
+  LOCUST_HEALTH_INTERVAL=2   seconds between /health scrapes (0 disables)
+  AI_ROUTER_API_KEY          sent as X-API-Key; unset = auth off, auth_reject is left out of the mix
+
+Example (offline, against tools/mock_llm_server.py):
+  locust -f tests/performance/locustfile.py --host http://localhost:8082 -u 50 -r 5 -t 5m --headless
+"""
+import os
+import time
+
+import gevent
+import requests
+from locust import HttpUser, between, events, task
+from scenarios import ScenarioLibrary, gpu_queue_depth, stream_timings  # Locust puts this directory on sys.path
+
+# Config from Env
+MIX = os.getenv("LOCUST_MIX", "production")
+METRICS_LOG = os.getenv("LOCUST_METRICS_LOG", "logs/metrics.jsonl")
+HISTORY_TURNS = int(os.getenv("LOCUST_HISTORY_TURNS", "30"))
+HEALTH_INTERVAL_SEC = float(os.getenv("LOCUST_HEALTH_INTERVAL", "2"))
+API_KEY = os.getenv("AI_ROUTER_API_KEY", "")
+
+_queue_samples = []
+
+
+def _fire(environment, request_type, name, ms):
+    environment.events.request.fire(
+        request_type=request_type, name=name, response_time=ms, response_length=0, exception=None, context={},
+    )
+
+
+def _scrape_health(environment):
+    headers = {"X-API-Key": API_KEY} if API_KEY else {}
+    while True:
+        try:
+            resp = requests.get(f"{environment.host}/health", headers=headers, timeout=5)
+            depth = gpu_queue_depth(resp.json())
+            if depth is not None:
+                _queue_samples.append((time.time(), depth))
+                _fire(environment, "GPU", "queue_depth", depth)
+        except Exception:
+            pass  # The service being slow to answer /health is itself under test
+        gevent.sleep(HEALTH_INTERVAL_SEC)
+
+
+@events.test_start.add_listener
+def _on_start(environment, **kwargs):
+    if HEALTH_INTERVAL_SEC > 0 and environment.host:
+        environment.health_scraper = gevent.spawn(_scrape_health, environment)
+
+
+@events.test_stop.add_listener
+def _on_stop(environment, **kwargs):
+    scraper = getattr(environment, "health_scraper", None)
+    if scraper:
+        scraper.kill()
+    if _queue_samples:
+        depths = sorted(d for _, d in _queue_samples)
+        print(f"GPU queue depth over {len(depths)} samples: max={depths[-1]} p50={depths[len(depths) // 2]} "
+              f"p95={depths[min(len(depths) - 1, int(len(depths) * 0.95))]}")
 
 
 class RouterUser(HttpUser):
     wait_time = between(1, 3)
 
-    @task(7)
-    def simple_query(self):
-        # Tier 1 (70%)
-        self.client.post("/route", json={
-            "messages": [{"role": "user", "content": "What is 2+2?"}],
-            "prefer_code": False
-        }, name="Tier1_Simple")
-
-    @task(2)
-    def code_query(self):
-        # Tier 2 (20%)
-        self.client.post("/route", json={
-            "messages": [{"role": "user", "content": "Write a Python function for sorting."}],
-            "prefer_code": True
-        }, name="Tier2_Code")
-
-    @task(1)
-    def complex_query(self):
-        # Tier 3 (10%)
-        self.client.post("/route", json={
-            "messages": [{"role": "user", "content": "Traceback most recent call last... Fix this error."}],
-            "prefer_code": True
-        }, name="Tier3_Complex")
+    def on_start(self):
+        self.library = ScenarioLibrary(
+            mix=MIX, metrics_log=METRICS_LOG, history_turns=HISTORY_TURNS, auth_enabled=bool(API_KEY)
+        )
+
+    @task
+    def scenario(self):
+        call = self.library.pick()
+        if not call.auth:
+            headers = {"X-API-Key": "wrong-key"}
+        else:
+            headers = {"X-API-Key": API_KEY} if API_KEY else {}
+        kwargs = {"json": call.body} if not isinstance(call.body, str) else {"data": call.body}
+        if call.stream:
+            headers["Accept"] = "text/event-stream" if call.stream == "sse" else "application/x-ndjson"
+
+        start = time.perf_counter()
+        with self.client.post(call.path, headers=headers, name=call.name, stream=bool(call.stream),
+                              catch_response=True, **kwargs) as resp:
+            if resp.status_code != call.expect_status:
+                resp.failure(f"HTTP {resp.status_code} (expected {call.expect_status})")
+                return
+            if not call.stream:
+                resp.success()
+                return
+            timing = stream_timings(resp.iter_lines(), call.stream, start=start)
+            if timing["ttft_ms"] is None:
+                resp.failure("stream ended without tokens")
+                return
+            resp.success()
+        _fire(self.environment, "TTFT", call.name, timing["ttft_ms"])
+        for gap in timing["itl_ms"]:
+            _fire(self.environment, "ITL", call.name, gap)
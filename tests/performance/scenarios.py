@@ -0,0 +1,202 @@
+"""
+Load-test scenario library (used by tests/performance/locustfile.py).
+
+Kept free of Locust imports so request builders and stream timing can be unit
+tested. A scenario builds one request for one API surface; a mix weights the
+scenarios. Prompts come from the labeled routing corpus, drawn with task
+weights taken from real traffic (logs/metrics.jsonl) when available.
+
+Scenarios:
+  route             POST /route, single prompt
+  chat_completions  POST /v1/chat/completions (OpenAI clients)
+  responses_stream  POST /v1/responses, stream=true (Codex CLI): TTFT + inter-token latency
+  long_history      POST /route with a long multi-turn history (compaction path)
+  batch_stream      POST /v1/batch, NDJSON results: time to first result + gaps
+  auth_reject       POST /route with a wrong key, 401 expected (only when the
+                    router has AI_ROUTER_API_KEY set; auth is off without it)
+"""
+import json
+import os
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CORPUS_PATH = os.path.join(ROOT, "tests", "routing", "data", "routing_corpus.jsonl")
+
+# Endpoint weights. "production" is an assumed client mix (direct /route callers first,
+# then OpenAI clients and Codex CLI); the metrics log records tasks, not endpoints.
+MIXES: Dict[str, Dict[str, int]] = {
+    "production": {
+        "route": 50, "chat_completions": 25, "responses_stream": 15, "long_history": 6, "batch_stream": 2, "auth_reject": 2,
+    },
+    "streaming": {"responses_stream": 70, "batch_stream": 10, "chat_completions": 20},
+    "long_context": {"long_history": 60, "route": 30, "responses_stream": 10},
+    "auth": {"route": 50, "auth_reject": 50},
+    "route_only": {"route": 1},
+}
+
+# Task share when no metrics log is available (chat and code dominate)
+DEFAULT_TASK_WEIGHTS: Dict[str, float] = {
+    "chitchat": 0.22, "simple_qa": 0.2, "code_gen": 0.2, "code_review": 0.08, "code_crit_debug": 0.1,
+    "system_design": 0.04, "summary": 0.04, "translation": 0.03, "creative_writing": 0.03,
+    "research": 0.02, "reasoning": 0.02, "data_analysis": 0.02,
+}
+
+
+@dataclass
+class Call:
+    """One HTTP request a scenario wants made; `stream` is None, "sse" or "ndjson"."""
+    name: str
+    path: str
+    body: Any  # JSON payload, or a str sent as-is (NDJSON batch)
+    stream: Optional[str] = None
+    expect_status: int = 200
+    auth: bool = True
+
+
+def load_prompts(path: str = CORPUS_PATH) -> Dict[str, List[List[Dict[str, str]]]]:
+    """task -> list of message lists from the labeled corpus."""
+    by_task: Dict[str, List[List[Dict[str, str]]]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            msgs = item.get("messages") or [{"role": "user", "content": item["prompt"]}]
+            by_task.setdefault(item["task"], []).append(msgs)
+    return by_task
+
+
+def task_weights_from_metrics(path: str, limit: int = 50_000) -> Dict[str, float]:
+    """Task share of the last `limit` routed requests in a metrics JSONL log ({} if unreadable)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()[-limit:]
+    except OSError:
+        return {}
+    counts = Counter()
+    for line in lines:
+        try:
+            counts[json.loads(line).get("task", "unknown")] += 1
+        except (ValueError, AttributeError):
+            continue
+    total = sum(counts.values())
+    return {task: n / total for task, n in counts.items()} if total else {}
+
+
+def make_history(rng: random.Random, prompts: Dict[str, List[List[Dict[str, str]]]], turns: int) -> List[Dict[str, str]]:
+    """A `turns`-long user/assistant conversation ending in a user turn."""
+    pool = [m for convs in prompts.values() for msgs in convs for m in msgs if m["role"] == "user"]
+    history = [{"role": "system", "content": "You are a helpful coding assistant."}]
+    for i in range(turns):
+        history.append({"role": "user", "content": rng.choice(pool)["content"]})
+        reply = " ".join(rng.choice(pool)["content"] for _ in range(rng.randint(2, 6)))
+        history.append({"role": "assistant", "content": f"Step {i + 1}: {reply}"})
+    history.append({"role": "user", "content": rng.choice(pool)["content"]})
+    return history
+
+
+class ScenarioLibrary:
+    """Builds weighted, reproducible requests for every API surface."""
+
+    def __init__(self, mix: str = "production", seed: int = None, metrics_log: str = None,
+                 history_turns: int = 30, batch_items: int = 5, prompts: Dict[str, List] = None,
+                 auth_enabled: bool = True):
+        if mix not in MIXES:
+            raise ValueError(f"Unknown mix {mix!r} (choose from {', '.join(MIXES)})")
+        # Without an API key the router accepts any request, so auth_reject would "fail" with 200
+        self.mix = {name: w for name, w in MIXES[mix].items() if auth_enabled or name != "auth_reject"}
+        self.rng = random.Random(seed)
+        self.prompts = prompts or load_prompts()
+        self.history_turns = history_turns
+        self.batch_items = batch_items
+        observed = task_weights_from_metrics(metrics_log) if metrics_log else {}
+        weights = {t: w for t, w in (observed or DEFAULT_TASK_WEIGHTS).items() if t in self.prompts}
+        self.tasks = list(weights) or list(self.prompts)
+        self.task_weights = [weights.get(t, 1.0) for t in self.tasks]
+        self.builders: Dict[str, Callable[[], Call]] = {
+            "route": self.route,
+            "chat_completions": self.chat_completions,
+            "responses_stream": self.responses_stream,
+            "long_history": self.long_history,
+            "batch_stream": self.batch_stream,
+            "auth_reject": self.auth_reject,
+        }
+
+    def messages(self) -> List[Dict[str, str]]:
+        task = self.rng.choices(self.tasks, self.task_weights)[0]
+        return self.rng.choice(self.prompts[task])
+
+    def pick(self) -> Call:
+        name = self.rng.choices(list(self.mix), list(self.mix.values()))[0]
+        return self.builders[name]()
+
+    def route(self) -> Call:
+        return Call("route", "/route", {"messages": self.messages(), "budget": self.rng.choice(["low", "balanced", "balanced", "high"])})
+
+    def chat_completions(self) -> Call:
+        return Call("chat_completions", "/v1/chat/completions", {"model": "router-auto", "messages": self.messages()})
+
+    def responses_stream(self) -> Call:
+        msgs = self.messages()
+        body = {"model": "router-auto", "stream": True,
+                "input": [{"role": m["role"], "content": [{"type": "input_text", "text": m["content"]}]} for m in msgs]}
+        return Call("responses_stream", "/v1/responses", body, stream="sse")
+
+    def long_history(self) -> Call:
+        turns = self.rng.randint(self.history_turns // 2, self.history_turns)
+        return Call("long_history", "/route", {"messages": make_history(self.rng, self.prompts, turns)})
+
+    def batch_stream(self) -> Call:
+        lines = "\n".join(json.dumps({"id": f"b{i}", "messages": self.messages()}) for i in range(self.batch_items))
+        return Call("batch_stream", "/v1/batch", lines, stream="ndjson")
+
+    def auth_reject(self) -> Call:
+        return Call("auth_reject", "/route", {"messages": self.messages()}, expect_status=401, auth=False)
+
+
+def stream_timings(lines: Iterable, kind: str, clock: Callable[[], float] = time.perf_counter,
+                   start: float = None) -> Dict[str, Any]:
+    """
+    Time to first token and inter-token gaps (ms) while consuming a stream.
+
+    `kind` "sse": tokens are `response.output_text.delta` events (or OpenAI
+    chat chunks with content). "ndjson": every non-empty line is one result.
+    """
+    start = clock() if start is None else start
+    marks: List[float] = []
+    event = None
+    for raw in lines:
+        line = raw.decode() if isinstance(raw, bytes) else raw
+        if not line.strip():
+            continue
+        if kind == "ndjson":
+            marks.append(clock())
+            continue
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                continue
+            if event == "response.output_text.delta":
+                marks.append(clock())
+            elif event is None:
+                choice = (json.loads(data).get("choices") or [{}])[0]
+                if (choice.get("delta") or {}).get("content"):
+                    marks.append(clock())
+    return {
+        "ttft_ms": (marks[0] - start) * 1000 if marks else None,
+        "itl_ms": [(b - a) * 1000 for a, b in zip(marks, marks[1:])],
+        "tokens": len(marks),
+        "total_ms": (clock() - start) * 1000,
+    }
+
+
+def gpu_queue_depth(health: Dict[str, Any]) -> Optional[int]:
+    """Queue depth from a /health payload (None when the GPU queue is disabled)."""
+    queue = health.get("gpu_queue") or {}
+    return queue.get("queue_depth") if queue.get("enabled") else None
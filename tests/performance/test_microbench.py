@@ -0,0 +1,37 @@
+"""
+Smoke test for the overhead microbenchmarks (scripts/bench_overhead.py).
+
+Verifies:
+- A tiny run covers every benchmark against the null provider and leaves the
+  real model chains and rate limiter in place.
+- Regressions are flagged only above both the relative threshold and the noise floor.
+"""
+
+
+def test_suite_runs_with_null_provider():
+    from graph import router
+    from scripts.bench_overhead import run_suite
+
+    chains = dict(router.CHAINS)
+    result = run_suite(sizes=[10], min_time=0.0001, rounds=1)
+
+    names = set(result["results"])
+    for bench in ("join_messages", "classify_prompt", "select_model_from_policy", "json_dumps_response",
+                  "json_loads_request", "graph_ainvoke_null", "asgi_route_null"):
+        assert f"{bench}[10]" in names
+    assert {"graph_compile", "middleware_overhead"} <= names
+    assert all(r["median_us"] > 0 for name, r in result["results"].items() if name != "middleware_overhead")
+    assert router.CHAINS == chains
+
+    from app import main
+    assert main.limiter.enabled
+
+
+def test_find_regressions():
+    from scripts.bench_overhead import find_regressions
+
+    baseline = {"results": {"a": {"median_us": 100.0}, "b": {"median_us": 1.0}, "c": {"median_us": 100.0}}}
+    current = {"results": {"a": {"median_us": 150.0}, "b": {"median_us": 3.0}, "c": {"median_us": 110.0}, "new": {"median_us": 9.0}}}
+    flagged = find_regressions(baseline, current, threshold=0.2)
+    # b tripled but only by 2 us (noise); c is within 20%; new has no baseline
+    assert [r["name"] for r in flagged] == ["a"]
@@ -0,0 +1,107 @@
+"""
+Tests for the load-test scenario library (tests/performance/scenarios.py).
+
+Verifies:
+- Every mix only uses known scenarios; a seeded library is reproducible.
+- auth_reject is left out when auth is off (no API key configured).
+- Requests built for each surface are accepted by the app (401 for auth_reject).
+- Stream timing finds TTFT and inter-token gaps in SSE and NDJSON streams.
+- Task weights are read from a metrics log; /health queue depth is extracted.
+"""
+import json
+
+import pytest
+
+from app import main as m
+from tests.performance.scenarios import (
+    MIXES,
+    ScenarioLibrary,
+    gpu_queue_depth,
+    make_history,
+    stream_timings,
+    task_weights_from_metrics,
+)
+
+
+class EchoRouter:
+    async def ainvoke(self, state, **kwargs):
+        return {"output": "ok " * 3, "usage": {"resolved_model_id": "local-chat", "prompt_tokens": 3}}
+
+
+@pytest.fixture
+def router():
+    original, m.router_app = m.router_app, EchoRouter()
+    yield
+    m.router_app = original
+
+
+def test_mixes_and_reproducibility():
+    lib = ScenarioLibrary(seed=1)
+    for mix in MIXES.values():
+        assert set(mix) <= set(lib.builders)
+    first = [ScenarioLibrary(seed=7).pick() for _ in range(20)]
+    assert first == [ScenarioLibrary(seed=7).pick() for _ in range(20)]
+
+
+def test_auth_reject_needs_an_api_key():
+    assert "auth_reject" in ScenarioLibrary(seed=1).mix
+    lib = ScenarioLibrary(seed=1, auth_enabled=False)
+    assert "auth_reject" not in lib.mix and lib.mix["route"] == MIXES["production"]["route"]
+    assert {lib.pick().name for _ in range(200)} <= set(MIXES["production"]) - {"auth_reject"}
+    assert ScenarioLibrary(mix="auth", auth_enabled=False).mix == {"route": 50}
+
+
+def test_long_history_shape():
+    lib = ScenarioLibrary(seed=3)
+    history = make_history(lib.rng, lib.prompts, 12)
+    assert len(history) == 1 + 12 * 2 + 1
+    assert history[0]["role"] == "system" and history[-1]["role"] == "user"
+
+
+def test_every_scenario_against_app(client, auth_headers, router):
+    lib = ScenarioLibrary(seed=5, batch_items=3)
+    for name, build in lib.builders.items():
+        call = build()
+        headers = auth_headers if call.auth else {"X-API-Key": "wrong-key"}
+        kwargs = {"content": call.body} if isinstance(call.body, str) else {"json": call.body}
+        resp = client.post(call.path, headers=headers, **kwargs)
+        assert resp.status_code == call.expect_status, name
+        if call.stream:
+            timing = stream_timings(resp.text.splitlines(), call.stream)
+            assert timing["tokens"] == (3 if call.stream == "ndjson" else 1), name
+
+
+def test_stream_timings_with_fake_clock():
+    ticks = iter([0.0, 0.5, 0.6, 0.8, 1.0])
+    sse = [
+        "event: response.created", "data: {}", "",
+        "event: response.output_text.delta", 'data: {"delta": "a"}', "",
+        "event: response.output_text.delta", 'data: {"delta": "b"}', "",
+        "data: " + json.dumps({"choices": [{"delta": {"content": "c"}}]}),
+        "data: [DONE]",
+    ]
+    # Responses API events first, then OpenAI chat chunks (no "event:" lines)
+    timing = stream_timings(sse[:8], "sse", clock=lambda: next(ticks))
+    assert timing["ttft_ms"] == pytest.approx(500) and timing["itl_ms"] == [pytest.approx(100)]
+
+    ticks = iter([0.0, 0.2, 0.5, 0.6])
+    timing = stream_timings(sse[9:], "sse", clock=lambda: next(ticks))
+    assert timing["tokens"] == 1 and timing["ttft_ms"] == pytest.approx(200)
+
+    ticks = iter([0.0, 1.0, 1.5, 2.5, 3.0])
+    timing = stream_timings(['{"id": 1}', "", '{"id": 2}', '{"id": 3}'], "ndjson", clock=lambda: next(ticks))
+    assert timing["ttft_ms"] == pytest.approx(1000)
+    assert timing["itl_ms"] == [pytest.approx(500), pytest.approx(1000)]
+
+
+def test_task_weights_and_queue_depth(tmp_path):
+    log = tmp_path / "metrics.jsonl"
+    log.write_text("\n".join(json.dumps({"task": t}) for t in ["code_gen"] * 3 + ["chitchat"]) + "\nnot json\n")
+    assert task_weights_from_metrics(str(log)) == {"code_gen": 0.75, "chitchat": 0.25}
+    assert task_weights_from_metrics(str(tmp_path / "missing.jsonl")) == {}
+
+    lib = ScenarioLibrary(seed=1, metrics_log=str(log))
+    assert lib.tasks == ["code_gen", "chitchat"]
+
+    assert gpu_queue_depth({"gpu_queue": {"enabled": True, "queue_depth": 4}}) == 4
+    assert gpu_queue_depth({"gpu_queue": {"enabled": False}}) is None
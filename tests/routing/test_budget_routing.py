@@ -0,0 +1,68 @@
+"""
+Test cost-estimate-driven model selection.
+
+Verifies:
+- Candidates whose estimated cost exceeds budget.<name>.max_cost_usd are skipped.
+- Local models are always within budget.
+- With no usable policy candidate the fallback is a registry model (local when cloud is off).
+- No budget means no cost cap (legacy callers).
+"""
+from graph.cost_guard import estimate_cost, pricing_tier
+from graph.router import (
+    BUD,
+    REG,
+    RoutingMeta,
+    estimate_model_cost,
+    expected_completion_tokens,
+    select_model_from_policy,
+)
+
+
+def _meta(prompt_tokens, task="system_design", complexity="high"):
+    return RoutingMeta(task=task, complexity=complexity, prompt_tokens=prompt_tokens)
+
+
+class TestCostEstimates:
+    def test_local_models_are_free(self):
+        assert pricing_tier("deepseek-coder-v2:16b", "ollama") == "local"
+        assert estimate_model_cost("local-code", _meta(100_000)) == 0.0
+
+    def test_reasoning_tiers_bill_hidden_tokens(self):
+        assert pricing_tier("o1-mini") == "reasoning"
+        assert pricing_tier("o1-preview") == "elite"
+        assert estimate_cost("o1-preview", 1000, 1000) == 3000 / 1_000_000 * 30.0
+
+    def test_expected_completion_follows_complexity(self):
+        assert expected_completion_tokens("low") == 200
+        assert expected_completion_tokens("high") == 5000
+        assert expected_completion_tokens("critical") == 5000
+
+
+class TestBudgetSelection:
+    def test_budget_skips_expensive_candidates(self):
+        meta = _meta(20_000)
+        # gpt-5.2-codex-high (~$0.125) fits 'balanced'; o3 (~$0.90) only fits 'high'
+        assert select_model_from_policy(meta, "balanced", cloud_available=True) == "gpt-5.2-codex-high"
+
+        meta = _meta(20_000, complexity="critical")
+        assert select_model_from_policy(meta, "high", cloud_available=True) == "o3"
+        assert select_model_from_policy(meta, "balanced", cloud_available=True) != "o3"
+
+    def test_over_budget_falls_back_to_registry_model(self):
+        # Policy candidates are over the 'low' cap and the prompt is too long for local models
+        model = select_model_from_policy(_meta(20_000), "low", cloud_available=True)
+        assert model in REG
+        assert estimate_model_cost(model, _meta(20_000)) <= BUD["low"]["max_cost_usd"]
+
+    def test_over_budget_without_cloud_falls_back_to_local(self):
+        assert select_model_from_policy(_meta(20_000), "low", cloud_available=False) == "local-chat"
+        meta = _meta(20_000, task="code_review", complexity="critical")
+        assert select_model_from_policy(meta, "low", cloud_available=False) == "local-code"
+
+    def test_local_candidate_kept_under_low_budget(self):
+        meta = _meta(10_000, complexity="medium")
+        assert select_model_from_policy(meta, "low", cloud_available=True) == "local-code"
+
+    def test_no_budget_no_cap(self):
+        meta = _meta(100_000, complexity="critical")
+        assert select_model_from_policy(meta, cloud_available=True) == "o3"
@@ -0,0 +1,98 @@
+"""
+Bounded-window classification (graph/router.py classification_window).
+
+Verifies:
+- Conversations that fit in the window are scanned exactly as before.
+- Corpus prompts buried under long system prompts and history route the same
+  with the window as with an unbounded scan.
+- The window keeps the last user message, the system prompt and samples of
+  every other turn, and stays within its budget.
+- Classification time stops growing with conversation size, measured on the
+  first (cold) call; prompt_tokens is estimated from the character count
+  rather than by tokenizing the whole conversation.
+"""
+import math
+import time
+
+from graph import router
+from graph.router import classification_window, classify_prompt, conversation_chars, join_messages
+from graph.routing_eval import load_corpus
+
+FILLER = "The quarterly figures were archived in the shared folder last spring. "
+
+
+def filler(size):
+    return (FILLER * (size // len(FILLER) + 1))[:size]
+
+
+def padded(prompt, size=40_000):
+    """Prompt (text or corpus messages) as the last turns of a long conversation."""
+    last = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+    return [
+        {"role": "system", "content": filler(size // 2)},
+        {"role": "user", "content": filler(size // 8)},
+        {"role": "assistant", "content": filler(size // 8)},
+        {"role": "user", "content": filler(size // 8)},
+        {"role": "assistant", "content": filler(size // 8)},
+        *last,
+    ]
+
+
+def _labels(msgs):
+    meta = classify_prompt(msgs)
+    return meta.task, meta.complexity, meta.confidence
+
+
+def test_small_conversations_are_unchanged():
+    for item in load_corpus():
+        msgs = [{"role": "system", "content": "You are helpful."}, *item["messages"]]
+        assert classification_window(msgs) == join_messages(msgs)
+        assert conversation_chars(msgs) == len(join_messages(msgs))
+
+
+def test_padded_corpus_routes_the_same(monkeypatch):
+    corpus = load_corpus()
+    windowed = [_labels(padded(item["messages"])) for item in corpus]
+    monkeypatch.setitem(router.CLASSIFIER_CFG, "window", {"max_chars": 0})
+    full = [_labels(padded(item["messages"])) for item in corpus]
+    assert windowed == full
+
+
+def test_window_keeps_roles_within_budget():
+    msgs = padded("Traceback (most recent call last): KeyError 'id'", 400_000)
+    msgs[0]["content"] = "SYSTEM-START " + msgs[0]["content"] + " SYSTEM-END"
+    msgs[2]["content"] = "OLD-TURN " + msgs[2]["content"]
+    window = classification_window(msgs, 16_000)
+
+    assert len(window) < 16_000 + 200  # Role prefixes and clip markers only
+    assert window.endswith("user: Traceback (most recent call last): KeyError 'id'")
+    assert "SYSTEM-START" in window and "SYSTEM-END" in window and "OLD-TURN" in window
+
+    # A huge last user message keeps its head and tail
+    huge = [{"role": "user", "content": "Translate to French: " + filler(300_000) + " END-OF-ASK"}]
+    window = classification_window(huge, 16_000)
+    assert window.startswith("user: Translate to French") and window.endswith("END-OF-ASK")
+
+
+def test_size_heuristic_still_sees_the_whole_conversation():
+    msgs = padded("Write a Python function to parse CSV files", 200_000)
+    assert classify_prompt(msgs).complexity in ("high", "critical")
+
+
+def test_classification_time_is_bounded(monkeypatch):
+    def cold(size):
+        """First classification of a conversation nothing has seen yet (no warm caches)."""
+        msgs = padded(f"Explain how a hash map works (request {time.perf_counter_ns()})", size)
+        t0 = time.perf_counter()
+        meta = classify_prompt(msgs)
+        elapsed = time.perf_counter() - t0
+        assert meta.prompt_tokens == math.ceil(conversation_chars(msgs) / 4)
+        return elapsed
+
+    windowed_big, windowed_huge = cold(200_000), cold(2_000_000)
+
+    monkeypatch.setitem(router.CLASSIFIER_CFG, "window", {"max_chars": 0})
+    full_big = cold(200_000)
+
+    assert windowed_huge < full_big / 2
+    assert windowed_huge < windowed_big * 3 + 0.005
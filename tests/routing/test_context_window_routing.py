@@ -0,0 +1,46 @@
+"""
+Test context-window-aware routing.
+
+Verifies:
+- Ollama num_ctx follows env override > registry context_window > default.
+- Models that cannot hold prompt + expected output are skipped.
+- Long prompts go to a model that fits (local first) instead of being truncated.
+"""
+from graph.router import RoutingMeta, context_window, select_model_from_policy
+from providers.ollama_client import resolve_num_ctx
+
+
+def _meta(prompt_tokens, task="chitchat", complexity="low"):
+    return RoutingMeta(task=task, complexity=complexity, prompt_tokens=prompt_tokens)
+
+
+class TestNumCtx:
+    def test_precedence(self, monkeypatch):
+        monkeypatch.delenv("OLLAMA_INSTRUCT_NUM_CTX", raising=False)
+        monkeypatch.delenv("OLLAMA_NUM_CTX", raising=False)
+        assert resolve_num_ctx("hermes3:8b") == 4096
+        assert resolve_num_ctx("hermes3:8b", 8192) == 8192
+
+        monkeypatch.setenv("OLLAMA_INSTRUCT_NUM_CTX", "2048")
+        assert resolve_num_ctx("hermes3:8b", 8192) == 2048
+
+    def test_registry_windows(self, monkeypatch):
+        monkeypatch.delenv("OLLAMA_INSTRUCT_NUM_CTX", raising=False)
+        assert context_window("local-chat") == 8192
+        assert context_window("gpt-4o-mini") == 128000
+
+
+class TestContextSelection:
+    def test_short_prompt_uses_policy(self):
+        assert select_model_from_policy(_meta(500), cloud_available=False) == "local-chat"
+
+    def test_long_prompt_moves_to_larger_local_model(self, monkeypatch):
+        monkeypatch.delenv("OLLAMA_INSTRUCT_NUM_CTX", raising=False)
+        monkeypatch.delenv("OLLAMA_CODER_NUM_CTX", raising=False)
+        # 12k tokens overflow local-chat (8k) but fit local-code (16k)
+        assert select_model_from_policy(_meta(12_000), cloud_available=False) == "local-code"
+
+    def test_very_long_prompt_goes_to_cloud_when_allowed(self, monkeypatch):
+        monkeypatch.delenv("OLLAMA_CODER_NUM_CTX", raising=False)
+        model = select_model_from_policy(_meta(30_000), cloud_available=True)
+        assert model == "gpt-4o-mini"
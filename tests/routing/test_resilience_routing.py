@@ -72,8 +72,8 @@ def test_policy_selection_with_unavailable_models():
     with patch("graph.router._is_cloud_available", return_value=False):
         meta = RoutingMeta(task="code_crit_debug", complexity="critical")
         model = select_model_from_policy(meta)
-        # Should fall back to local model
-        assert model in ["deepseek-coder-v2-16b", "llama-3.1-8b-instruct"]
+        # Should fall back to the local code model
+        assert model == "local-code"
 
 
 def test_sla_config_loaded():
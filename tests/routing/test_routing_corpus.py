@@ -0,0 +1,58 @@
+"""
+Routing accuracy on the labeled corpus (tests/routing/data/routing_corpus.jsonl).
+
+Verifies:
+- Every corpus line has a known task / complexity label.
+- evaluate() scores the local pipeline the graph runs (heuristic, learned,
+  semantic) unless asked for the heuristic alone.
+- evaluate() reports accuracy, confusion matrices, judge rate and stage timings.
+- Accuracy does not drop below the current floor (raise the floors when the
+  classifier improves; run scripts/bench_routing.py --misses for details).
+"""
+from graph.routing_eval import compare, confusion_matrix, evaluate, load_corpus
+
+TASK_FLOOR = 0.85
+ROUTING_FLOOR = 0.80
+
+
+def test_corpus_is_valid_and_unique():
+    corpus = load_corpus()
+    assert len(corpus) >= 50
+    ids = [item["id"] for item in corpus]
+    assert len(ids) == len(set(ids))
+
+
+def test_confusion_matrix():
+    matrix = confusion_matrix([("a", "a"), ("a", "b"), ("b", "c")], ["a", "b"])
+    assert matrix["a"] == {"a": 1, "b": 1, "c": 0}
+    assert matrix["b"]["c"] == 1 and sum(matrix["c"].values()) == 0
+
+
+def test_accuracy_floor():
+    result = evaluate(load_corpus(), repeat=1)
+    n = result["meta"]["items"]
+
+    assert sum(sum(row.values()) for row in result["confusion"]["task"].values()) == n
+    assert set(result["stages"]) == {"join", "tokenize", "classify", "policy"}
+    assert result["throughput"]["prompts_per_sec"] > 0
+    assert 0 <= result["judge"]["trigger_rate"] <= 1
+
+    assert result["accuracy"]["task"] >= TASK_FLOOR, result["misses"]
+    assert result["accuracy"]["routing"] >= ROUTING_FLOOR, result["misses"]
+
+
+def test_compare_flags_incomparable_runs():
+    corpus = load_corpus()[:5]
+    old = evaluate(corpus, repeat=1)
+    new = evaluate(corpus, repeat=1, cloud_available=False)
+    lines = compare(old, new)
+    assert any("cloud_available differs" in line for line in lines)
+    assert any(line.startswith("accuracy.task") for line in lines)
+
+
+def test_heuristic_only_is_recorded():
+    corpus = load_corpus()[:5]
+    local = evaluate(corpus, repeat=1)
+    heuristic = evaluate(corpus, repeat=1, heuristic_only=True)
+    assert local["meta"]["classifier"] == "local"
+    assert any("classifier differs" in line for line in compare(local, heuristic))
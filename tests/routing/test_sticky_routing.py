@@ -0,0 +1,143 @@
+"""
+Sticky per-conversation routing (services/session_store.py + graph/router.py).
+
+Verifies:
+- The store is bounded (LRU) and expires entries (TTL).
+- The key stored after a turn is the lookup key of the conversation's next
+  turn (message prefix hash), scoped per API key.
+- A follow-up turn that classifies differently with low confidence keeps the
+  previous task/complexity and model; a confident new task or a complexity
+  escalation re-routes.
+- X-Conversation-Id identifies conversations without relying on history.
+"""
+import pytest
+
+from graph import router
+from graph.router import RoutingMeta
+from services import session_store as sessions
+
+
+@pytest.fixture
+def store(monkeypatch):
+    fresh = sessions.SessionStore(max_sessions=100, ttl_sec=60)
+    monkeypatch.setattr(sessions, "_store", fresh)
+    monkeypatch.setattr(sessions, "ENABLED", True)
+    monkeypatch.setattr(router, "_is_cloud_available", lambda: False)
+    return fresh
+
+
+@pytest.fixture
+def classify(monkeypatch):
+    """Queue the local classification result of each turn."""
+    queue = []
+    monkeypatch.setattr(router, "classify_prompt_local", lambda msgs: queue.pop(0))
+    return queue
+
+
+def _turn(messages, reply="ok", **extra):
+    state = {"messages": messages, "api_key_id": "key-a", "budget": "balanced", **extra}
+    state.update(router._node_classify(state))
+    state.update(router._node_route(state))
+    router._remember_route(state, state["model_id"], reply)
+    return RoutingMeta(**state["routing_meta"]), state["model_id"]
+
+
+def test_store_is_bounded_and_expires():
+    store = sessions.SessionStore(max_sessions=2, ttl_sec=10)
+    for i in range(3):
+        store.put(f"k{i}", sessions.StickyRoute("code_gen", "medium", 0.9, "local-code"), now=100)
+    assert store.get("k0", now=101) is None
+    assert store.get("k2", now=105).model_id == "local-code"
+    assert store.get("k2", now=200) is None
+    assert store.stats()["evictions"] == 1 and store.stats()["sessions"] == 1
+
+
+def test_prefix_keys_chain_across_turns():
+    turn1 = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Write a CSV parser"}]
+    lookup, key = sessions.prefix_keys(turn1, "key-a")
+    assert lookup is None
+
+    turn2 = turn1 + [{"role": "assistant", "content": "def parse(): ...\n"}, {"role": "user", "content": "Skip blanks"}]
+    assert sessions.prefix_keys(turn2, "key-a")[0] == sessions.chain_key(key, "assistant", "def parse(): ...")
+    assert sessions.prefix_keys(turn2, "key-b")[0] != sessions.prefix_keys(turn2, "key-a")[0]
+
+
+def test_follow_up_keeps_route(store, classify):
+    turn1 = [{"role": "user", "content": "Write a Python function to parse CSV files"}]
+    classify.append(RoutingMeta(task="code_gen", complexity="medium", confidence=0.8))
+    meta1, model1 = _turn(turn1, reply="def parse(path): ...")
+    assert not meta1.sticky
+
+    # Low-confidence chitchat follow-up: same task, complexity and model
+    turn2 = turn1 + [{"role": "assistant", "content": "def parse(path): ..."}, {"role": "user", "content": "Thanks! Skip empty lines too?"}]
+    classify.append(RoutingMeta(task="chitchat", complexity="low", confidence=0.7))
+    meta2, model2 = _turn(turn2, reply="Sure: ...")
+    assert (meta2.task, meta2.complexity, meta2.sticky, model2) == ("code_gen", "medium", True, model1)
+    assert store.stats()["hits"] == 1
+
+    # Confident new task: re-routed
+    turn3 = turn2 + [{"role": "assistant", "content": "Sure: ..."}, {"role": "user", "content": "Translate the docstring into French"}]
+    classify.append(RoutingMeta(task="translation", complexity="low", confidence=0.96))
+    meta3, _ = _turn(turn3)
+    assert (meta3.task, meta3.sticky) == ("translation", False)
+
+
+def test_complexity_escalation_reroutes(store, classify):
+    turn1 = [{"role": "user", "content": "Review this function"}]
+    classify.append(RoutingMeta(task="code_review", complexity="medium", confidence=0.6))
+    _turn(turn1, reply="Looks fine.")
+
+    turn2 = turn1 + [{"role": "assistant", "content": "Looks fine."}, {"role": "user", "content": "It deadlocks in production"}]
+    classify.append(RoutingMeta(task="code_review", complexity="critical", confidence=0.6))
+    meta2, model2 = _turn(turn2)
+    assert (meta2.complexity, meta2.sticky) == ("critical", False)
+    assert model2 == router.select_model_from_policy(meta2, "balanced", False)
+
+
+def test_edited_history_is_classified_fresh(store, classify):
+    turn1 = [{"role": "user", "content": "Write a Python function"}]
+    classify.append(RoutingMeta(task="code_gen", complexity="medium", confidence=0.8))
+    _turn(turn1, reply="def f(): ...")
+
+    edited = turn1 + [{"role": "assistant", "content": "something else"}, {"role": "user", "content": "hi"}]
+    classify.append(RoutingMeta(task="chitchat", complexity="low", confidence=0.5))
+    meta, _ = _turn(edited)
+    assert (meta.task, meta.sticky) == ("chitchat", False)
+
+
+def test_explicit_conversation_id(store, classify):
+    classify.append(RoutingMeta(task="code_gen", complexity="medium", confidence=0.8))
+    _turn([{"role": "user", "content": "Write a Go HTTP server"}], conversation_id="c-1")
+
+    # Client sends only the new message: matched by id, not by history
+    classify.append(RoutingMeta(task="simple_qa", complexity="low", confidence=0.5))
+    meta, _ = _turn([{"role": "user", "content": "and the port?"}], conversation_id="c-1")
+    assert (meta.task, meta.sticky) == ("code_gen", True)
+
+    classify.append(RoutingMeta(task="simple_qa", complexity="low", confidence=0.5))
+    meta, _ = _turn([{"role": "user", "content": "and the port?"}], conversation_id="c-2")
+    assert not meta.sticky
+
+
+def test_header_reaches_router_state(client, auth_headers):
+    from app import main as m
+
+    seen = {}
+
+    class CapturingRouter:
+        async def ainvoke(self, state, **kwargs):
+            seen.update(state)
+            return {"output": "ok", "usage": {"resolved_model_id": "local-chat"}}
+
+    original = m.router_app
+    m.router_app = CapturingRouter()
+    try:
+        r = client.post(
+            "/route",
+            json={"messages": [{"role": "user", "content": "hi"}]},
+            headers={**auth_headers, "X-Conversation-Id": "conv-42"},
+        )
+        assert r.status_code == 200
+        assert seen["conversation_id"] == "conv-42"
+    finally:
+        m.router_app = original
@@ -145,3 +145,21 @@ async def test_timeout_logic(mock_redis, clean_singleton):
             
             # Should clean up queue
             mock_redis.lrem.assert_awaited()
+
+@pytest.mark.asyncio
+async def test_lane_uses_own_keys(mock_redis, clean_singleton):
+    # Each Ollama endpoint gets its own FIFO and active set
+    with patch("redis.asyncio.from_url", return_value=mock_redis):
+        q = GpuQueue()
+        q._enabled = True
+        await q.connect()
+
+        mock_redis.scard.return_value = 0
+        with patch("uuid.uuid4", return_value="MATCH"):
+            mock_redis.lindex.return_value = "MATCH"
+
+            async def real_task(): return "processed"
+
+            assert await q.execute_limited(real_task, lane="gpu-b:11434") == "processed"
+            mock_redis.rpush.assert_awaited_with("gpu:queue:gpu-b:11434", "MATCH")
+            mock_redis.srem.assert_awaited_with("gpu:active:gpu-b:11434", "MATCH")
@@ -0,0 +1,90 @@
+"""
+Test the /v1/batch endpoint.
+
+Verifies:
+- JSONL items are routed and streamed back as NDJSON with per-item usage.
+- Results arrive in completion order, not submission order.
+- Concurrency never exceeds the requested bound.
+- Invalid lines and failing items are reported per item without failing the batch.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app import main as m
+
+
+class SlowRouter:
+    """Sleeps for the number of seconds in the prompt, tracking concurrency."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def ainvoke(self, state, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            content = state["messages"][-1]["content"]
+            if content == "boom":
+                raise RuntimeError("provider down")
+            await asyncio.sleep(float(content))
+            return {"output": f"slept {content}", "usage": {"resolved_model_id": "local-chat", "prompt_tokens": 3}}
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def router():
+    original = m.router_app
+    m.router_app = SlowRouter()
+    yield m.router_app
+    m.router_app = original
+
+
+def _jsonl(*items):
+    return "\n".join(json.dumps(i) if isinstance(i, dict) else i for i in items)
+
+
+def _post(client, headers, body, **params):
+    resp = client.post("/v1/batch", content=body, headers=headers, params=params)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in resp.text.splitlines()]
+
+
+def test_requires_api_key(client):
+    resp = client.post("/v1/batch", content=_jsonl({"messages": [{"content": "0"}]}))
+    assert resp.status_code == 401
+
+
+def test_streams_in_completion_order(client, auth_headers, router):
+    body = _jsonl(
+        {"id": "slow", "messages": [{"content": "0.2"}]},
+        {"id": "fast", "messages": [{"content": "0.01"}]},
+    )
+    results = _post(client, auth_headers, body, concurrency=2)
+    assert [r["id"] for r in results] == ["fast", "slow"]
+    assert results[0]["status"] == 200 and results[0]["output"] == "slept 0.01"
+    assert results[0]["usage"]["prompt_tokens"] == 3
+    assert "latency_ms_router" in results[0]["usage"]
+
+
+def test_bounded_concurrency(client, auth_headers, router):
+    body = _jsonl(*[{"messages": [{"content": "0.02"}]} for _ in range(6)])
+    results = _post(client, auth_headers, body, concurrency=2)
+    assert sorted(r["index"] for r in results) == list(range(6))
+    assert router.max_in_flight == 2
+
+
+def test_per_item_errors(client, auth_headers, router):
+    body = _jsonl({"messages": [{"content": "0"}]}, "{not json", "", {"messages": [{"content": "boom"}]})
+    results = {r["index"]: r for r in _post(client, auth_headers, body)}
+    assert results[0]["status"] == 200
+    assert results[1]["status"] == 400
+    assert results[2]["status"] == 500 and "provider down" in results[2]["error"]
+
+
+def test_empty_batch_rejected(client, auth_headers):
+    assert client.post("/v1/batch", content="\n", headers=auth_headers).status_code == 400
@@ -0,0 +1,136 @@
+"""
+Test model-swap-aware scheduling in the GPU queue.
+
+Verifies:
+- choose_next prefers the loaded model within the batch and wait bounds.
+- Under mixed traffic, model_affinity starts far fewer model switches than FIFO.
+"""
+import asyncio
+from unittest.mock import patch
+
+from services import gpu_queue
+from services.gpu_queue import GpuQueue, choose_next
+
+
+class FakeRedis:
+    """Minimal in-memory async Redis covering the commands the queue uses."""
+
+    def __init__(self):
+        self.lists, self.sets, self.hashes, self.kv = {}, {}, {}, {}
+
+    async def rpush(self, k, v):
+        self.lists.setdefault(k, []).append(v)
+
+    async def lindex(self, k, i):
+        lst = self.lists.get(k, [])
+        return lst[i] if len(lst) > i else None
+
+    async def lpop(self, k):
+        lst = self.lists.get(k, [])
+        return lst.pop(0) if lst else None
+
+    async def lrange(self, k, a, b):
+        return list(self.lists.get(k, []))
+
+    async def llen(self, k):
+        return len(self.lists.get(k, []))
+
+    async def lrem(self, k, count, v):
+        lst = self.lists.get(k, [])
+        if v in lst:
+            lst.remove(v)
+            return 1
+        return 0
+
+    async def scard(self, k):
+        return len(self.sets.get(k, set()))
+
+    async def sadd(self, k, v):
+        self.sets.setdefault(k, set()).add(v)
+
+    async def srem(self, k, v):
+        self.sets.get(k, set()).discard(v)
+
+    async def hset(self, k, f, v):
+        self.hashes.setdefault(k, {})[f] = v
+
+    async def hmget(self, k, fields):
+        h = self.hashes.get(k, {})
+        return [h.get(f) for f in fields]
+
+    async def hdel(self, k, f):
+        self.hashes.get(k, {}).pop(f, None)
+
+    async def get(self, k):
+        return self.kv.get(k)
+
+    async def set(self, k, v):
+        self.kv[k] = str(v)
+
+    async def incr(self, k):
+        self.kv[k] = str(int(self.kv.get(k, 0)) + 1)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis, self.ops = redis, []
+
+    def __getattr__(self, name):
+        return lambda *a: self.ops.append((name, a))
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*a) for name, a in self.ops]
+
+
+class TestChooseNext:
+    def test_prefers_loaded_model(self):
+        entries = [("r1", "hermes", 100.0), ("r2", "deepseek", 101.0)]
+        assert choose_next(entries, "deepseek", 1, now=102.0, max_batch=8, max_wait=10) == "r2"
+
+    def test_head_when_nothing_loaded_or_no_match(self):
+        entries = [("r1", "hermes", 100.0), ("r2", "hermes", 101.0)]
+        assert choose_next(entries, None, 0, now=102.0, max_batch=8, max_wait=10) == "r1"
+        assert choose_next(entries, "deepseek", 3, now=102.0, max_batch=8, max_wait=10) == "r1"
+
+    def test_fairness_bounds(self):
+        entries = [("r1", "hermes", 100.0), ("r2", "deepseek", 109.0)]
+        # Head waited too long
+        assert choose_next(entries, "deepseek", 1, now=110.0, max_batch=8, max_wait=10) == "r1"
+        # Current model already ran max_batch times in a row
+        assert choose_next(entries, "deepseek", 8, now=101.0, max_batch=8, max_wait=10) == "r1"
+
+    def test_empty(self):
+        assert choose_next([], "hermes", 0, now=0.0) is None
+
+
+def _switches(scheduler: str) -> int:
+    order = []
+
+    async def scenario():
+        q = GpuQueue()
+        q._enabled = True
+        q._redis = FakeRedis()
+
+        async def work(model):
+            order.append(model)
+            await asyncio.sleep(0.005)
+
+        models = ["hermes", "deepseek"] * 4
+        await asyncio.gather(*[q.execute_limited(work, m, model=m) for m in models])
+
+    with patch.object(gpu_queue, "SCHEDULER", scheduler), \
+         patch.object(gpu_queue, "POLL_SEC", 0.001), \
+         patch.object(gpu_queue, "MAX_WORKERS", 1):
+        asyncio.run(scenario())
+
+    assert len(order) == 8
+    return sum(1 for a, b in zip(order, order[1:]) if a != b)
+
+
+class TestAffinityScheduling:
+    def test_fewer_switches_than_fifo(self):
+        assert _switches("fifo") == 7
+        assert _switches("model_affinity") == 1
@@ -0,0 +1,128 @@
+"""
+Test history compaction for long conversations.
+
+Verifies:
+- Histories under the target are left untouched.
+- System prompt and recent turns are kept verbatim; older turns are summarized.
+- Summaries are cached per conversation prefix (only new turns are summarized).
+- The graph node reports tokens saved for local models.
+- Routing checks the context window against the compacted size, so long histories stay local.
+"""
+import asyncio
+from unittest.mock import patch
+
+from graph.compaction import SUMMARY_PREFIX, HistoryCompactor
+
+
+def _conversation(turns, size=400):
+    msgs = [{"role": "system", "content": "You are a coding assistant."}]
+    for i in range(turns):
+        msgs.append({"role": "user", "content": f"question {i} " + "x " * size})
+        msgs.append({"role": "assistant", "content": f"answer {i} " + "y " * size})
+    return msgs
+
+
+def _recording_summarizer():
+    calls = []
+
+    async def summarize(previous, messages, max_tokens):
+        calls.append((previous, len(messages)))
+        return (previous or "") + f"[{len(messages)} msgs]"
+
+    return summarize, calls
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class TestHistoryCompactor:
+    def test_under_target_is_untouched(self):
+        compactor = HistoryCompactor()
+        msgs = _conversation(2, size=10)
+        out, stats = _run(compactor.compact(msgs, target=10_000))
+        assert out is msgs
+        assert stats.tokens_saved == 0
+
+    def test_keeps_system_and_recent_turns(self):
+        summarize, calls = _recording_summarizer()
+        compactor = HistoryCompactor(summarizer=summarize, keep_messages=4, summary_max_tokens=100)
+        msgs = _conversation(10)
+
+        out, stats = _run(compactor.compact(msgs, target=2_000))
+
+        assert out[0] == msgs[0]
+        assert out[1]["role"] == "system" and out[1]["content"].startswith(SUMMARY_PREFIX)
+        assert out[2:] == msgs[-4:]
+        assert stats.summarized_messages == 16
+        assert stats.tokens_after < stats.tokens_before
+        assert calls == [(None, 16)]
+
+    def test_summary_cache_by_prefix(self):
+        summarize, calls = _recording_summarizer()
+        compactor = HistoryCompactor(summarizer=summarize, keep_messages=4, summary_max_tokens=100)
+        msgs = _conversation(10)
+
+        _run(compactor.compact(msgs, target=2_000))
+        # Same history again: cached summary, no model call
+        _, stats = _run(compactor.compact(msgs, target=2_000))
+        assert stats.summary_cache == "hit"
+        assert len(calls) == 1
+
+        # Next turn: only the turn that slid out of the window is summarized
+        msgs = msgs + [
+            {"role": "user", "content": "question 10 " + "x " * 400},
+            {"role": "assistant", "content": "answer 10 " + "y " * 400},
+        ]
+        _, stats = _run(compactor.compact(msgs, target=2_000))
+        assert stats.summary_cache == "partial"
+        assert calls[-1] == ("[16 msgs]", 2)
+
+    def test_extractive_summary_is_default(self):
+        compactor = HistoryCompactor(keep_messages=2, summary_max_tokens=200)
+        out, stats = _run(compactor.compact(_conversation(8), target=1_500))
+        assert "- user: question 0" in out[1]["content"] or "- assistant:" in out[1]["content"]
+        assert stats.tokens_saved > 0
+
+
+class TestCompactNode:
+    def test_node_compacts_local_model(self):
+        from graph import compaction, router
+
+        with patch.object(compaction, "ENABLED", True), \
+             patch.object(compaction, "TARGET_TOKENS", 1_500):
+            result = _run(router._node_compact({"messages": _conversation(10), "model_id": "local-chat"}))
+            assert result["compaction"]["tokens_saved"] > 0
+            assert len(result["messages"]) < 21
+
+            # Cloud models are not compacted by default
+            assert _run(router._node_compact({"messages": _conversation(10), "model_id": "gpt-4o-mini"})) == {}
+
+    def test_long_history_is_routed_to_local_when_compaction_fits(self):
+        from graph import compaction, router
+        from graph.router import RoutingMeta
+
+        msgs = _conversation(60)
+        prompt_tokens = router.count_messages(msgs)
+        assert prompt_tokens > router.context_window("local-code")
+
+        def classify(messages):
+            return RoutingMeta(task="code_gen", complexity="medium", confidence=0.9, prompt_tokens=prompt_tokens)
+
+        def route():
+            state = {"messages": msgs, "api_key_id": "key-a"}
+            state.update(router._node_classify(state))
+            return router._node_route(state)["model_id"], state["routing_meta"]["compacted_tokens"]
+
+        with patch.object(router, "classify_prompt_local", classify), \
+             patch.object(router, "_is_cloud_available", return_value=True), \
+             patch.object(router, "is_cloud_enabled", return_value=True), \
+             patch.object(router, "classify_prompt_with_llm", side_effect=lambda m, meta: meta), \
+             patch.object(router.sessions, "ENABLED", False):
+            # Without compaction the uncompacted history only fits cloud models
+            model, floor = route()
+            assert router.REG[model]["provider"] == "openai" and floor == 0
+
+            with patch.object(compaction, "ENABLED", True):
+                model, floor = route()
+                assert model == "local-code" and 0 < floor < prompt_tokens
@@ -0,0 +1,144 @@
+"""
+Test the deferred job API.
+
+Verifies:
+- Jobs persist in SQLite and survive a restart (running jobs are re-queued).
+- The runner only starts jobs while interactive load is at or below the threshold,
+  and stops at the next job boundary when load returns.
+- Submit / poll / result / cancel over HTTP, scoped to the submitting API key.
+"""
+import asyncio
+
+import pytest
+
+from services import job_queue
+from services.job_queue import JobRunner, JobStore
+
+REQUEST = {"messages": [{"role": "user", "content": "classify this ticket"}]}
+
+
+class FakeLoad:
+    def __init__(self, value=0):
+        self.value = value
+
+    async def __call__(self):
+        return self.value
+
+
+async def _echo(request, api_key_id):
+    await asyncio.sleep(0)
+    return {"output": request["messages"][0]["content"], "usage": {"resolved_model_id": "local-chat"}}
+
+
+class TestJobStore:
+    def test_restart_requeues_running(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        store = JobStore(path)
+        first = store.submit(REQUEST, "key-a")
+        second = store.submit(REQUEST, "key-a")
+        assert store.claim_next()["id"] == first  # Oldest first
+        store.close()
+
+        store = JobStore(path)
+        assert store.get(first)["status"] == "queued"
+        assert store.counts()["queued"] == 2
+        assert store.cancel(second) and not store.cancel(second)
+
+
+class TestJobRunner:
+    def test_runs_only_when_idle(self, tmp_path):
+        store = JobStore(str(tmp_path / "jobs.db"))
+        load = FakeLoad(value=3)
+        runner = JobRunner(store, _echo, load=load)
+        job_id = store.submit(REQUEST)
+
+        async def scenario():
+            assert await runner.tick() == 0  # Interactive traffic is queued
+            assert runner.preempted == 1
+            load.value = 0
+            assert await runner.tick() == 1
+            await asyncio.gather(*runner.running.values())
+
+        asyncio.run(scenario())
+        job = store.get(job_id)
+        assert job["status"] == "done"
+        assert job["result"]["output"] == "classify this ticket"
+
+    def test_preempts_at_job_boundary(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(job_queue, "MAX_CONCURRENCY", 1)
+        store = JobStore(str(tmp_path / "jobs.db"))
+        load = FakeLoad()
+
+        async def scenario():
+            release = asyncio.Event()
+
+            async def slow(request, api_key_id):
+                await release.wait()
+                return {"output": "ok"}
+
+            runner = JobRunner(store, slow, load=load)
+            first, second = store.submit(REQUEST), store.submit(REQUEST)
+            assert await runner.tick() == 1
+            # Interactive request arrives while the first job runs: it is not interrupted...
+            load.value = 2
+            release.set()
+            await asyncio.gather(*runner.running.values())
+            # ...but the next job does not start
+            assert await runner.tick() == 0
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert store.get(first)["status"] == "done"
+        assert store.get(second)["status"] == "queued"
+
+    def test_failure_recorded(self, tmp_path):
+        store = JobStore(str(tmp_path / "jobs.db"))
+
+        async def boom(request, api_key_id):
+            raise RuntimeError("provider down")
+
+        runner = JobRunner(store, boom, load=FakeLoad())
+        job_id = store.submit(REQUEST)
+
+        async def scenario():
+            await runner.tick()
+            await asyncio.gather(*runner.running.values())
+
+        asyncio.run(scenario())
+        assert store.get(job_id)["status"] == "failed"
+        assert "provider down" in store.get(job_id)["error"]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(job_queue, "_store", store)
+    return store
+
+
+class TestJobsAPI:
+    def test_submit_poll_result(self, client, auth_headers, store):
+        resp = client.post("/v1/jobs", json=REQUEST, headers=auth_headers)
+        assert resp.status_code == 202
+        job_id = resp.json()["id"]
+
+        assert client.get(f"/v1/jobs/{job_id}", headers=auth_headers).json()["status"] == "queued"
+        assert client.get(f"/v1/jobs/{job_id}/result", headers=auth_headers).status_code == 409
+
+        assert store.claim_next()["id"] == job_id
+        store.finish(job_id, result={"output": "done", "usage": {}})
+        body = client.get(f"/v1/jobs/{job_id}/result", headers=auth_headers).json()
+        assert body["status"] == "done" and body["output"] == "done"
+
+    def test_cancel_and_unknown(self, client, auth_headers, store):
+        job_id = client.post("/v1/jobs", json=REQUEST, headers=auth_headers).json()["id"]
+        assert client.delete(f"/v1/jobs/{job_id}", headers=auth_headers).json()["status"] == "cancelled"
+        assert client.delete(f"/v1/jobs/{job_id}", headers=auth_headers).status_code == 409
+        assert client.get("/v1/jobs/job-missing", headers=auth_headers).status_code == 404
+
+
+def test_store_path_is_read_at_first_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "_store", None)
+    monkeypatch.setenv("JOBS_DB_PATH", str(tmp_path / "env-jobs.db"))
+    assert job_queue.get_store().submit(REQUEST)
+    assert (tmp_path / "env-jobs.db").exists()
@@ -0,0 +1,115 @@
+"""
+Test the mergeable latency sketches.
+
+Verifies:
+- Quantiles stay within the configured relative error.
+- Merging two sketches equals sketching the combined stream.
+- Memory stays bounded (buckets and label values).
+- Sketches published by other workers are merged in; those of exited workers are dropped.
+"""
+import os
+import random
+
+from services import latency_sketch
+from services.latency_sketch import MAX_KEYS_PER_DIMENSION, LatencySketches, QuantileSketch
+
+
+def _exact(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+class TestQuantileSketch:
+    def test_quantiles_within_relative_error(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(4, 1.2) for _ in range(20000)]
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for v in values:
+            sketch.add(v)
+
+        for q in (0.5, 0.9, 0.99):
+            exact = _exact(values, q)
+            assert abs(sketch.quantile(q) - exact) / exact < 0.02
+
+    def test_merge_matches_single_stream(self):
+        rng = random.Random(1)
+        a, b, both = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for i in range(5000):
+            v = rng.uniform(1, 5000)
+            (a if i % 2 else b).add(v)
+            both.add(v)
+        a.merge(b)
+
+        assert a.count == both.count
+        assert a.buckets == both.buckets
+        assert a.quantile(0.99) == both.quantile(0.99)
+
+    def test_bucket_count_is_bounded(self):
+        sketch = QuantileSketch(relative_accuracy=0.01, max_buckets=32)
+        for exp in range(-2, 9):
+            sketch.add(10.0 ** exp)
+            sketch.add(3 * 10.0 ** exp)
+        for v in range(1, 5000, 7):
+            sketch.add(float(v))
+
+        assert len(sketch.buckets) <= 32
+        # Tail is preserved when collapsing
+        assert abs(sketch.quantile(1.0) - sketch.max) / sketch.max <= 0.01
+
+    def test_zero_values_and_roundtrip(self):
+        sketch = QuantileSketch()
+        for v in (0.0, 0.0, 12.5, 250.0):
+            sketch.add(v)
+        restored = QuantileSketch.from_dict(sketch.to_dict())
+
+        assert restored.quantile(0.0) == 0.0
+        assert restored.summary() == sketch.summary()
+
+
+class TestLatencySketches:
+    def test_observe_by_dimension(self):
+        sketches = LatencySketches()
+        labels = {"model": "local-code", "task": "code_gen", "complexity": "medium", "tier": "local"}
+        for v in (10, 20, 30):
+            sketches.observe("provider", v, labels)
+        sketches.observe("provider", 500, {**labels, "model": "gpt-4o-mini", "tier": "mini"})
+
+        summary = sketches.summary()["provider"]
+        assert summary["all"]["all"]["count"] == 4
+        assert summary["model"]["local-code"]["count"] == 3
+        assert summary["task"]["code_gen"]["count"] == 4
+        assert summary["tier"]["mini"]["p99"] >= 495
+
+    def test_label_cardinality_is_capped(self):
+        sketches = LatencySketches()
+        for i in range(MAX_KEYS_PER_DIMENSION + 10):
+            sketches.observe("queue_wait", 5, {"model": f"m{i}"})
+
+        models = sketches.summary()["queue_wait"]["model"]
+        assert len(models) <= MAX_KEYS_PER_DIMENSION + 1
+        assert models["other"]["count"] == 10
+
+    def test_merge_with_peer_snapshots(self, tmp_path):
+        peer = LatencySketches()
+        peer.observe("routing_overhead", 4.0, {"model": "local-chat"})
+        (tmp_path / f"latency-{os.getppid()}.json").write_text(__import__("json").dumps(peer.to_dict()))
+
+        local = LatencySketches(str(tmp_path))
+        local.observe("routing_overhead", 2.0, {"model": "local-chat"})
+
+        merged = local.merged_with_peers().summary()["routing_overhead"]
+        assert merged["model"]["local-chat"]["count"] == 2
+        # Local state is untouched by the merge
+        assert local.summary()["routing_overhead"]["all"]["all"]["count"] == 1
+
+    def test_snapshots_of_exited_workers_are_dropped(self, tmp_path, monkeypatch):
+        peer = LatencySketches()
+        peer.observe("routing_overhead", 4.0, {"model": "local-chat"})
+        stale = tmp_path / "latency-999999.json"
+        stale.write_text(__import__("json").dumps(peer.to_dict()))
+        monkeypatch.setattr(latency_sketch, "_pid_alive", lambda pid: False)
+
+        local = LatencySketches(str(tmp_path))
+        local.observe("routing_overhead", 2.0, {"model": "local-chat"})
+        assert local.merged_with_peers().summary()["routing_overhead"]["model"]["local-chat"]["count"] == 1
+        assert not stale.exists()
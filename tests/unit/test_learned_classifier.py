@@ -0,0 +1,116 @@
+"""
+Tests for the learned classifier stage (graph/learned_classifier.py).
+
+Verifies:
+- Hashed features are deterministic, L2-normalized and bounded for long prompts.
+- A model trained on a toy set separates its classes; batched scoring equals
+  one-by-one scoring; the .npz artifact round-trips.
+- Temperature scaling finds the NLL optimum below 0.5 as well as above 1.
+- The shipped artifact covers the configured task labels.
+- The router only consults it when the heuristic is unsure, and only takes
+  confident predictions (otherwise the judge path is unchanged).
+"""
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from graph import learned_classifier as lc  # noqa: E402
+from graph import router  # noqa: E402
+from graph.router import RoutingMeta, classify_prompt_learned  # noqa: E402
+
+TOY = [
+    ("write a python function to parse csv", "code_gen", "medium"),
+    ("implement a class for a linked list", "code_gen", "medium"),
+    ("write code that sorts numbers", "code_gen", "medium"),
+    ("hello how are you", "chitchat", "low"),
+    ("good morning thanks", "chitchat", "low"),
+    ("hi there, nice day", "chitchat", "low"),
+    ("translate this to english", "translation", "low"),
+    ("traduzir para português por favor", "translation", "low"),
+    ("translate the sentence into spanish", "translation", "low"),
+]
+TASKS = ["code_gen", "chitchat", "translation"]
+CX = ["low", "medium", "high", "critical"]
+
+
+@pytest.fixture(scope="module")
+def toy_model():
+    texts, tasks, cx = zip(*TOY)
+    clf, report = lc.train(list(texts), list(tasks), list(cx), TASKS, CX, folds=3, epochs=150, n_features=2 ** 10)
+    return clf, report
+
+
+def test_features_are_deterministic_and_normalized():
+    idx, val = lc.featurize("Write a function, please")
+    assert (idx, val) == lc.featurize("Write a function, please")
+    assert math.isclose(sum(v * v for v in val), 1.0, rel_tol=1e-6)
+    assert all(0 <= i < lc.N_FEATURES for i in idx)
+
+    text = lc.prompt_text([{"role": "user", "content": "x" * 50_000 + "tail"}])
+    assert len(text) <= lc.MAX_CHARS + 1 and text.endswith("tail")
+
+
+def test_toy_model_batch_and_roundtrip(toy_model, tmp_path):
+    clf, report = toy_model
+    assert report["items"] == len(TOY) and 0 <= report["ece"] <= 1
+
+    texts = [t for t, _, _ in TOY]
+    batched = clf.predict(texts)
+    assert [p.task for p in batched] == [t for _, t, _ in TOY]
+    assert [p.task for p in batched] == [clf.predict([t])[0].task for t in texts]
+
+    path = tmp_path / "clf.npz"
+    clf.save(str(path))
+    loaded = lc.LearnedClassifier.load(str(path))
+    assert loaded.tasks == TASKS and loaded.temperature == clf.temperature
+    for a, b in zip(batched, loaded.predict(texts)):
+        assert a.task == b.task and abs(a.confidence - b.confidence) < 1e-2
+
+
+@pytest.mark.parametrize("temperature", [0.2, 2.5])
+def test_temperature_fit_is_not_clamped(temperature):
+    rng = np.random.default_rng(0)
+    logits = rng.normal(0, 3, size=(4000, 4))
+    p = lc._softmax(logits / temperature)
+    y = np.array([rng.choice(4, p=row) for row in p])
+    assert lc._best_temperature(logits, y) == pytest.approx(temperature, rel=0.15)
+
+
+def test_shipped_artifact_matches_config():
+    cfg = router.CLASSIFIER_CFG["learned"]
+    clf = lc.get_classifier(str(router.ROOT / cfg["path"]))
+    assert clf is not None
+    assert set(clf.tasks) == set(router.TASK_TYPES)
+    assert clf.predict([]) == []
+
+
+class StubClassifier:
+    def __init__(self, confidence):
+        self.confidence = confidence
+
+    def predict_messages(self, messages):
+        return lc.Prediction("translation", "low", self.confidence, 0.9)
+
+
+def test_router_stage(monkeypatch):
+    msgs = [{"role": "user", "content": "translate this to english"}]
+    monkeypatch.setitem(router.CLASSIFIER_CFG, "learned", {**router.CLASSIFIER_CFG["learned"], "enabled": True})
+
+    monkeypatch.setattr(lc, "get_classifier", lambda path: StubClassifier(0.95))
+    out = classify_prompt_learned(msgs, RoutingMeta(task="simple_qa", complexity="medium", confidence=0.3))
+    assert (out.task, out.complexity, out.classifier_used) == ("translation", "low", "learned")
+
+    sure = RoutingMeta(task="code_gen", complexity="medium", confidence=0.9)
+    assert classify_prompt_learned(msgs, sure).classifier_used == "heuristic"
+
+    # Unsure model: leave the heuristic labels for the judge
+    monkeypatch.setattr(lc, "get_classifier", lambda path: StubClassifier(0.5))
+    out = classify_prompt_learned(msgs, RoutingMeta(task="simple_qa", complexity="low", confidence=0.3))
+    assert (out.task, out.classifier_used) == ("simple_qa", "heuristic")
+
+
+def test_disabled_without_numpy(monkeypatch):
+    monkeypatch.setattr(lc, "np", None)
+    assert lc.get_classifier("config/learned_classifier.npz") is None
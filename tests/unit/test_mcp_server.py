@@ -0,0 +1,128 @@
+"""
+Tests for the asyncio MCP server (tools/ai_router_mcp.py).
+
+Verifies:
+- Tool calls run concurrently: a fast call answers before an earlier slow one.
+- notifications/cancelled cancels the call and suppresses its reply.
+- initialize / tools/list and the legacy tool/list / tool/call shapes.
+- The HTTP backend sends the API key to /route over a shared client.
+- The in-process backend streams model tokens as progress notifications.
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from tools.ai_router_mcp import HttpBackend, InProcessBackend, McpServer
+
+
+class SleepBackend:
+    """Sleeps for arguments["sleep"] seconds, echoing the last message."""
+
+    def __init__(self):
+        self.cancelled = []
+
+    async def route(self, args, on_partial=None):
+        try:
+            await asyncio.sleep(args.get("sleep", 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(args["messages"][-1]["content"])
+            raise
+        return {"output": args["messages"][-1]["content"], "usage": {"resolved_model_id": "local-chat"}}
+
+    async def aclose(self):
+        pass
+
+
+def _call(id, content, sleep=0, method="tools/call", **params):
+    args = {"messages": [{"role": "user", "content": content}], "sleep": sleep}
+    return {"jsonrpc": "2.0", "id": id, "method": method, "params": {"name": "ai_router.route", "arguments": args, **params}}
+
+
+async def _serve(server, *msgs):
+    reader = asyncio.StreamReader()
+    for msg in msgs:
+        reader.feed_data((json.dumps(msg) + "\n").encode())
+    reader.feed_eof()
+    await server.serve(reader)
+
+
+@pytest.mark.asyncio
+async def test_calls_run_concurrently():
+    out = []
+    await _serve(McpServer(SleepBackend(), out.append), _call(1, "slow", sleep=0.3), _call(2, "fast"))
+    assert [m["id"] for m in out] == [2, 1]
+    assert out[1]["result"]["content"][0]["text"] == "slow"
+
+
+@pytest.mark.asyncio
+async def test_cancellation():
+    backend, out = SleepBackend(), []
+    server = McpServer(backend, out.append)
+    server.dispatch(_call(1, "long", sleep=5))
+    await asyncio.sleep(0.01)
+    server.dispatch({"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": 1}})
+    await asyncio.sleep(0.01)
+    assert backend.cancelled == ["long"]
+    assert out == [] and server.tasks == {}
+
+
+@pytest.mark.asyncio
+async def test_protocol_and_legacy_shapes():
+    out = []
+    await _serve(
+        McpServer(SleepBackend(), out.append),
+        {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+        {"id": 3, "method": "tool/list"},
+        _call(4, "hi", method="tool/call"),
+        {"jsonrpc": "2.0", "id": 5, "method": "tools/call", "params": {"name": "nope"}},
+        {"jsonrpc": "2.0", "id": 6, "method": "bogus"},
+    )
+    by_id = {m["id"]: m for m in out}
+    assert by_id[1]["result"]["capabilities"] == {"tools": {}}
+    assert by_id[2]["result"]["tools"][0]["inputSchema"]["required"] == ["messages"]
+    assert by_id[3]["result"][0]["name"] == "ai_router.route"
+    assert by_id[4]["result"] == {"content": "hi", "usage": {"resolved_model_id": "local-chat"}}
+    assert by_id[5]["error"]["message"] == "unknown tool"
+    assert by_id[6]["error"]["code"] == -32601
+
+
+@pytest.mark.asyncio
+async def test_http_backend_uses_api_key():
+    seen = []
+
+    def handler(request):
+        seen.append((request.headers.get("x-api-key"), json.loads(request.content)))
+        return httpx.Response(200, json={"output": "routed", "usage": {}})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://router", headers={"X-API-Key": "k1"})
+    backend = HttpBackend(client=client)
+    out = await backend.route({"messages": [{"role": "user", "content": "hi"}], "prefer_code": True})
+    await backend.aclose()
+    assert out["output"] == "routed"
+    assert seen == [("k1", {"messages": [{"role": "user", "content": "hi"}], "budget": "balanced", "prefer_code": True})]
+
+
+@pytest.mark.asyncio
+async def test_in_process_streams_progress(monkeypatch):
+    from langchain_core.language_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+
+    from graph import router
+
+    reply = "- issue: none, fix: ok"
+    model = GenericFakeChatModel(messages=iter([AIMessage(content=reply)] * 10))
+    chain = RunnableLambda(lambda x: x["messages"]) | model | RunnableLambda(lambda m: m.content)
+    monkeypatch.setattr(router, "CHAINS", {model_id: chain for model_id in router.REG})
+
+    out = []
+    server = McpServer(InProcessBackend(router.build_compiled_router()), out.append)
+    await _serve(server, _call(1, "hello there", _meta={"progressToken": "p1"}))
+
+    progress = [m["params"] for m in out if m.get("method") == "notifications/progress"]
+    assert "".join(p["message"] for p in progress) == reply
+    assert [p["progress"] for p in progress] == list(range(1, len(progress) + 1))
+    assert out[-1]["result"]["content"][0]["text"] == reply
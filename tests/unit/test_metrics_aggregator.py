@@ -0,0 +1,120 @@
+"""
+Test the rolling metrics aggregator behind /debug/metrics.
+
+Verifies:
+- Events are folded into totals and per-model/per-tier breakdowns.
+- Time windows only count recent events.
+- Aggregates are restored from the tail of the JSONL log.
+- The log is UTF-8 regardless of the locale (non-ASCII is written raw).
+- Log lines are written by a background thread, not the caller.
+"""
+import datetime
+import json
+
+from services.metrics import MetricsAggregator, _tail_lines
+
+
+def _event(model="local-code", tier="local", cost=0.0, tokens=100, latency=50, ts=None, **extra):
+    ev = {
+        "ts": ts or datetime.datetime.now().isoformat(),
+        "task": "code_gen",
+        "complexity": "medium",
+        "model_id": model,
+        "tier": tier,
+        "tokens_total": tokens,
+        "latency_ms": latency,
+        "cost_est_usd": cost,
+        "status": "success",
+        "escalated": False,
+    }
+    ev.update(extra)
+    return ev
+
+
+class TestMetricsAggregator:
+    def test_record_updates_totals_and_breakdowns(self, tmp_path):
+        agg = MetricsAggregator(str(tmp_path / "metrics.jsonl"))
+        agg.record(_event(latency=100))
+        agg.record(_event(model="gpt-4o-mini", tier="mini", cost=0.25, tokens=300, latency=300, escalated=True))
+
+        snap = agg.snapshot()
+        assert snap["total_requests"] == 2
+        assert snap["total_tokens"] == 400
+        assert snap["total_cost_usd"] == 0.25
+        assert snap["avg_latency_ms"] == 200
+        assert snap["escalations"] == 1
+        assert snap["models"] == {"local-code": 1, "gpt-4o-mini": 1}
+        assert snap["by_tier"]["mini"] == {"requests": 1, "cost_usd": 0.25, "tokens": 300}
+
+    def test_windows_exclude_old_events(self, tmp_path):
+        agg = MetricsAggregator(str(tmp_path / "metrics.jsonl"))
+        old = (datetime.datetime.now() - datetime.timedelta(hours=2)).isoformat()
+        ancient = (datetime.datetime.now() - datetime.timedelta(days=3)).isoformat()
+        agg.record(_event(ts=old))
+        agg.record(_event(ts=ancient))
+        agg.record(_event())
+
+        windows = agg.snapshot()["windows"]
+        assert windows["last_5m"]["requests"] == 1
+        assert windows["last_1h"]["requests"] == 1
+        assert windows["last_24h"]["requests"] == 2
+        assert agg.snapshot()["total_requests"] == 3
+
+    def test_restore_from_log_tail(self, tmp_path):
+        log = tmp_path / "metrics.jsonl"
+        writer = MetricsAggregator(str(log))
+        for i in range(20):
+            writer.record(_event(tokens=i))
+        writer.flush()
+        with open(log, "a") as f:
+            f.write("not json\n")
+
+        agg = MetricsAggregator(str(log))
+        restored = agg.restore(max_lines=5)
+        # The malformed line counts against the tail but is skipped
+        assert restored == 4
+        assert agg.snapshot()["total_tokens"] == 16 + 17 + 18 + 19
+        assert agg.snapshot()["restored_events"] == 4
+
+    def test_log_is_utf8(self, tmp_path):
+        log = tmp_path / "metrics.jsonl"
+        writer = MetricsAggregator(str(log))
+        writer.record(_event(model="modèle-ç", api_key_id="clé"))
+        writer.flush()
+        assert json.loads(log.read_bytes().decode("utf-8"))["model_id"] == "modèle-ç"
+
+        agg = MetricsAggregator(str(log))
+        assert agg.restore() == 1
+        assert "modèle-ç" in agg.snapshot()["by_model"]
+
+    def test_log_is_written_off_the_request_thread(self, tmp_path, monkeypatch):
+        import builtins
+        import threading
+
+        from services import metrics
+
+        writers = []
+
+        def tracking_open(*args, **kwargs):
+            writers.append(threading.current_thread().name)
+            return builtins.open(*args, **kwargs)
+
+        monkeypatch.setattr(metrics, "open", tracking_open, raising=False)
+        agg = MetricsAggregator(str(tmp_path / "metrics.jsonl"))
+        for i in range(5):
+            agg.record(_event(tokens=i))
+        agg.flush()
+        assert writers and set(writers) == {"metrics-log-writer"}
+        assert len((tmp_path / "metrics.jsonl").read_text().splitlines()) == 5
+
+    def test_restore_missing_log(self, tmp_path):
+        agg = MetricsAggregator(str(tmp_path / "missing.jsonl"))
+        assert agg.restore() == 0
+        assert agg.snapshot()["total_requests"] == 0
+
+    def test_tail_lines_across_chunks(self, tmp_path):
+        log = tmp_path / "big.jsonl"
+        log.write_text("".join(json.dumps({"i": i}) + "\n" for i in range(500)))
+
+        lines = _tail_lines(str(log), 3, chunk_size=16)
+        assert [json.loads(x)["i"] for x in lines] == [497, 498, 499]
@@ -0,0 +1,105 @@
+"""
+Test the SQLite metrics store and the cost report queries.
+
+Verifies:
+- Batches are deduplicated by prompt_id and folded into hourly/daily rollups.
+- Range / per-model / per-key queries read the rollups.
+- JSONL backfill resumes from the last ingested offset.
+"""
+import datetime
+import json
+import time
+
+from scripts.cost_report import ingest_jsonl, parse_time
+from services.metrics_store import BatchWriter, MetricsStore
+
+DAY = 86400
+
+
+def _event(i, ts, model="local-code", key="k1", cost=0.001, tokens=100, latency=40):
+    return {
+        "ts": datetime.datetime.fromtimestamp(ts).isoformat(),
+        "prompt_id": f"p-{i}",
+        "task": "code_gen" if model == "local-code" else "simple_qa",
+        "complexity": "medium",
+        "model_id": model,
+        "tier": "local" if model.startswith("local") else "mini",
+        "api_key_id": key,
+        "tokens_total": tokens,
+        "latency_ms": latency,
+        "cost_est_usd": cost,
+        "status": "success",
+        "escalated": i % 10 == 0,
+    }
+
+
+class TestMetricsStore:
+    def test_batch_dedup_and_rollups(self, tmp_path):
+        store = MetricsStore(str(tmp_path / "m.db"))
+        now = time.time()
+        events = [_event(i, now - i * 60) for i in range(10)]
+
+        assert store.write_batch(events) == 10
+        # Replaying the same events is a no-op (rollups are not double counted)
+        assert store.write_batch(events) == 0
+
+        total = store.summary()[0]
+        assert total["requests"] == 10
+        assert total["tokens"] == 1000
+        assert total["escalations"] == 1
+        assert total["avg_latency_ms"] == 40
+
+    def test_range_group_and_filter_queries(self, tmp_path):
+        store = MetricsStore(str(tmp_path / "m.db"))
+        now = time.time()
+        events = []
+        for d in range(60):  # Two months, 3 requests/day
+            ts = now - d * DAY
+            events.append(_event(3 * d, ts, "local-code", "k1"))
+            events.append(_event(3 * d + 1, ts, "gpt-4o-mini", "k1", cost=0.01))
+            events.append(_event(3 * d + 2, ts, "gpt-4o-mini", "k2", cost=0.02))
+        store.write_batch(events)
+
+        by_model = {r["group"]: r for r in store.summary(since=now - 7 * DAY + 3600, group_by="model")}
+        assert by_model["local-code"]["requests"] == 7
+        assert by_model["gpt-4o-mini"]["cost_usd"] == round(7 * 0.03, 6)
+
+        by_key = {r["group"]: r["requests"] for r in store.summary(group_by="api_key", filters={"model": "gpt-4o-mini"})}
+        assert by_key == {"k1": 60, "k2": 60}
+
+        # Daily rollups have day precision: today + the two previous (UTC) days
+        days = store.timeline("day", since=(now // DAY) * DAY - 2 * DAY)
+        assert len(days) == 3
+        assert sum(r["requests"] for r in days) == 9
+        assert all("bucket" in r for r in days)
+
+        raw = store.events(filters={"api_key": "k2"}, limit=5)
+        assert len(raw) == 5 and all(r["api_key_id"] == "k2" for r in raw)
+
+    def test_batch_writer_flush(self, tmp_path):
+        store = MetricsStore(str(tmp_path / "m.db"))
+        writer = BatchWriter(store, batch_size=3, flush_sec=0.05)
+        now = time.time()
+        for i in range(7):
+            writer.submit(_event(i, now))
+        writer.flush()
+
+        assert store.summary()[0]["requests"] == 7
+
+    def test_ingest_jsonl_is_incremental(self, tmp_path):
+        store = MetricsStore(str(tmp_path / "m.db"))
+        log = tmp_path / "metrics.jsonl"
+        now = time.time()
+        log.write_text("".join(json.dumps(_event(i, now)) + "\n" for i in range(5)))
+
+        assert ingest_jsonl(store, str(log)) == 5
+        with open(log, "a") as f:
+            f.write(json.dumps(_event(5, now)) + "\n")
+            f.write('{"partial": ')  # Still being written: skipped until complete
+        assert ingest_jsonl(store, str(log)) == 1
+        assert store.summary()[0]["requests"] == 6
+
+    def test_parse_time(self):
+        assert abs(parse_time("24h") - (time.time() - DAY)) < 5
+        assert parse_time("2025-12-01") == datetime.datetime(2025, 12, 1).timestamp()
+        assert parse_time(None) is None
@@ -0,0 +1,173 @@
+"""
+Tests for the offline mock Ollama / OpenAI server (tools/mock_llm_server.py).
+
+Verifies:
+- The real LangChain clients (ChatOllama, ChatOpenAI) talk to it unchanged,
+  streaming and not, and replies are deterministic.
+- /api/tags, /api/ps and /v1/models list the configured models (by default
+  the provider names of the router registry).
+- A /route request goes through the real router and Ollama client to the mock.
+- Cold loads report load_duration; keep_alive=0 unloads.
+- Error injection is seeded and reproducible.
+- Requests beyond the concurrency + queue limits are refused (503 / 429).
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+
+from tools.mock_llm_server import MockSettings, create_app, registry_models
+
+FAST = dict(ttft_ms=0, tokens_per_sec=0, reply_tokens=20)
+MSGS = [{"role": "user", "content": "write a function"}]
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://mock")
+
+
+@pytest.mark.asyncio
+async def test_langchain_clients_against_mock():
+    from langchain_ollama import ChatOllama
+    from langchain_openai import ChatOpenAI
+
+    from graph.router import _evaluate_response
+
+    app = create_app(MockSettings(**FAST))
+    ollama = ChatOllama(model="hermes3:8b", base_url="http://mock",
+                        async_client_kwargs={"transport": httpx.ASGITransport(app=app)})
+    first = await ollama.ainvoke("write a function")
+    again = await ollama.ainvoke("write a function")
+    assert first.content and first.content == again.content
+    assert first.response_metadata.get("eval_count") == 20
+    assert _evaluate_response(first.content, "code_gen")
+
+    openai = ChatOpenAI(model="gpt-4o-mini", api_key="mock", base_url="http://mock/v1",
+                        http_async_client=_client(app))
+    reply = await openai.ainvoke("write a function")
+    assert reply.usage_metadata["output_tokens"] == 20
+    chunks = [c.content async for c in openai.astream("write a function")]
+    assert "".join(chunks) == reply.content
+
+
+@pytest.mark.asyncio
+async def test_listing_and_load_unload():
+    app = create_app(MockSettings(models=["m1", "m2"], load_ms=20, **FAST))
+    async with _client(app) as client:
+        assert [m["name"] for m in (await client.get("/api/tags")).json()["models"]] == ["m1", "m2"]
+        assert [m["id"] for m in (await client.get("/v1/models")).json()["data"]] == ["m1", "m2"]
+
+        resp = await client.post("/api/chat", json={"model": "m1", "messages": MSGS, "stream": False})
+        assert resp.json()["load_duration"] >= 20e6
+        resp = await client.post("/api/chat", json={"model": "m1", "messages": MSGS, "stream": False})
+        assert resp.json()["load_duration"] == 0  # Resident now
+        assert [m["name"] for m in (await client.get("/api/ps")).json()["models"]] == ["m1"]
+
+        await client.post("/api/generate", json={"model": "m1", "keep_alive": 0})
+        assert (await client.get("/api/ps")).json()["models"] == []
+        assert (await client.post("/api/chat", json={"model": "nope", "messages": MSGS})).status_code == 404
+
+
+def test_default_models_follow_the_registry():
+    from graph.router import REG
+
+    models = MockSettings().models
+    assert models == registry_models()
+    assert {meta["name"] for meta in REG.values() if meta.get("name")} <= set(models)
+    assert "hermes3:8b" in models and "deepseek-coder-v2:16b" in models
+
+
+@pytest.mark.asyncio
+async def test_streaming_shapes():
+    app = create_app(MockSettings(**FAST))
+    async with _client(app) as client:
+        resp = await client.post("/api/chat", json={"model": "hermes3:8b", "messages": MSGS, "options": {"num_predict": 5}})
+        lines = [json.loads(line) for line in resp.text.splitlines()]
+        assert [line["done"] for line in lines] == [False] * 5 + [True]
+        assert lines[-1]["eval_count"] == 5
+
+        resp = await client.post("/v1/chat/completions", json={
+            "model": "gpt-4o", "messages": MSGS, "stream": True, "max_tokens": 3, "stream_options": {"include_usage": True},
+        })
+        events = [line[len("data: "):] for line in resp.text.splitlines() if line.startswith("data: ")]
+        assert events[-1] == "[DONE]"
+        assert json.loads(events[-2])["usage"]["completion_tokens"] == 3
+        assert json.loads(events[-3])["choices"][0]["finish_reason"] == "stop"
+
+
+@pytest.mark.asyncio
+async def test_error_injection_is_reproducible():
+    async def statuses():
+        app = create_app(MockSettings(error_rate=0.5, error_status=502, seed=7, **FAST))
+        async with _client(app) as client:
+            return [(await client.post("/v1/chat/completions", json={"model": "gpt-4o", "messages": MSGS})).status_code
+                    for _ in range(20)]
+
+    first = await statuses()
+    assert set(first) == {200, 502}
+    assert first == await statuses()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_rejects_overflow():
+    app = create_app(MockSettings(max_concurrency=1, max_queue=1, ttft_ms=100, tokens_per_sec=0, reply_tokens=2))
+    async with _client(app) as client:
+        body = {"model": "hermes3:8b", "messages": MSGS, "stream": False}
+        results = await asyncio.gather(*(client.post("/api/chat", json=body) for _ in range(4)))
+        assert sorted(r.status_code for r in results) == [200, 200, 503, 503]
+
+        body = {"model": "gpt-4o", "messages": MSGS}
+        results = await asyncio.gather(*(client.post("/v1/chat/completions", json=body) for _ in range(3)))
+        assert sorted(r.status_code for r in results) == [200, 200, 429]
+        assert app.state.mock.stats["rejected"] == 3
+
+
+@pytest.fixture
+def mock_server():
+    """The mock on a real port (the router's Ollama clients open their own connections)."""
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    app = create_app(MockSettings(**FAST))
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}", app
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+def test_route_through_router_to_mock(client, auth_headers, mock_server, monkeypatch):
+    from app import main as m
+    from graph import router
+    from providers.ollama_client import make_ollama
+    from services import ollama_pool
+
+    url, app = mock_server
+    monkeypatch.setattr(m, "router_app", router.build_compiled_router())  # Other tests swap in fakes
+    monkeypatch.setattr(ollama_pool, "_pool", ollama_pool.OllamaPool())
+    monkeypatch.setattr(router, "_is_cloud_available", lambda: False)
+    for model_id, meta in router.REG.items():
+        if meta.get("provider") == "ollama":
+            monkeypatch.setitem(router.CHAINS, model_id, make_ollama(meta["name"], base_urls=[url]))
+
+    r = client.post(
+        "/route",
+        json={"messages": [{"role": "user", "content": "Write a Python function to parse CSV files"}]},
+        headers=auth_headers,
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["usage"]["resolved_model_id"] == "local-code"
+    assert "```python" in body["output"]
+    assert app.state.mock.stats["completed"] == 1
+    assert list(app.state.mock.resident) == [router.REG["local-code"]["name"]]
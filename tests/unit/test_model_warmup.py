@@ -0,0 +1,121 @@
+"""
+Test the model warm-up / keep-alive manager.
+
+Verifies:
+- Demand is counted over a sliding window.
+- Only loads above MODEL_COLD_LOAD_MS count as cold loads.
+- Maintenance keeps hot models resident, unloads idle ones, and never
+  evicts a hot model to load another.
+- Cold loads reported by Ollama responses are recorded.
+"""
+import asyncio
+from unittest.mock import patch
+
+from services import model_warmup
+from services.model_warmup import WarmupManager
+from services.ollama_pool import OllamaPool
+
+URL = "http://gpu:11434"
+
+
+def _manager(models=("hermes3:8b", "deepseek-coder-v2:16b")):
+    pool = OllamaPool()
+    for m in models:
+        pool.register(m, [URL])
+    return WarmupManager(pool)
+
+
+class FakeClient:
+    """Records /api/generate calls; /api/ps returns `resident`."""
+
+    def __init__(self, resident=()):
+        self.resident = list(resident)
+        self.generate = []
+
+    async def get(self, url, timeout=None):
+        return FakeResp({"models": [{"name": m} for m in self.resident]})
+
+    async def post(self, url, json=None, timeout=None):
+        self.generate.append((json["model"], json["keep_alive"]))
+        return FakeResp({"done": True, "load_duration": 2_000_000})  # 2 ms: already loaded
+
+
+class FakeResp:
+    def __init__(self, data):
+        self._data = data
+        self.content = b"x"
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+class TestTracking:
+    def test_demand_window(self):
+        mgr = _manager()
+        now = 10_000.0
+        mgr.record_demand("hermes3:8b", now=now - model_warmup.DEMAND_WINDOW_SEC - 1)
+        mgr.record_demand("hermes3:8b", now=now - 5)
+        assert mgr.demand("hermes3:8b", now=now) == 1
+        assert mgr.demand("deepseek-coder-v2:16b", now=now) == 0
+
+    def test_cold_loads(self):
+        mgr = _manager()
+        assert mgr.record_load("hermes3:8b", 0.010) is False
+        assert mgr.record_load("hermes3:8b", 4.2) is True
+        stats = mgr.stats()
+        assert stats["cold_loads_1h"] == 1
+        assert stats["models"]["hermes3:8b"]["load_seconds_1h"] == 4.2
+
+
+class TestMaintenance:
+    def test_hot_model_kept_alive_idle_unloaded(self):
+        mgr = _manager()
+        now = mgr._started + model_warmup.IDLE_UNLOAD_SEC + 10
+        mgr.record_demand("hermes3:8b", now=now)
+        client = FakeClient(resident=["hermes3:8b", "deepseek-coder-v2:16b"])
+
+        asyncio.run(mgr.tick(client, now=now))
+
+        assert ("hermes3:8b", model_warmup.HOT_KEEP_ALIVE) in client.generate
+        assert ("deepseek-coder-v2:16b", 0) in client.generate
+
+    def test_does_not_evict_hot_model(self):
+        mgr = _manager()
+        now = mgr._started + 10
+        mgr.record_demand("hermes3:8b", now=now)
+        mgr.record_demand("deepseek-coder-v2:16b", now=now)
+        client = FakeClient(resident=["hermes3:8b"])
+
+        asyncio.run(mgr.tick(client, now=now))
+
+        # deepseek is hot too, but loading it would evict hermes on the shared GPU
+        assert [m for m, _ in client.generate] == ["hermes3:8b"]
+
+    def test_preload(self):
+        mgr = _manager()
+        client = FakeClient()
+        asyncio.run(mgr.preload(client))
+        assert {m for m, _ in client.generate} == {"hermes3:8b", "deepseek-coder-v2:16b"}
+
+
+class TestColdLoadFromResponses:
+    def test_response_metadata_records_load(self):
+        from langchain_core.runnables import RunnableLambda
+
+        from providers import ollama_client
+
+        reply = type("Msg", (), {"content": "ok", "response_metadata": {"load_duration": 3_000_000_000}})()
+
+        def FakeChat(**kwargs):
+            return RunnableLambda(lambda msgs: reply)
+
+        mgr = _manager()
+        with patch.object(ollama_client, "ChatOllama", FakeChat), \
+             patch.object(ollama_client, "get_warmup_manager", return_value=mgr):
+            chain = ollama_client.make_ollama("hermes3:8b", base_urls=[URL])
+            assert asyncio.run(chain.ainvoke({"messages": []})) == "ok"
+
+        assert mgr.stats()["models"]["hermes3:8b"]["cold_loads_1h"] == 1
@@ -0,0 +1,123 @@
+"""
+Test the multi-endpoint Ollama pool.
+
+Verifies:
+- Endpoint precedence (registry base_urls > OLLAMA_ENDPOINTS > OLLAMA_BASE_URL).
+- Least-outstanding selection that skips unhealthy endpoints.
+- Leases set the current endpoint and connection errors mark it down.
+- Health checks restore endpoints; make_ollama calls the leased endpoint.
+"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from services.ollama_pool import OllamaPool, current_endpoint, resolve_base_urls
+
+A, B = "http://gpu-a:11434", "http://gpu-b:11434"
+
+
+def _pool():
+    pool = OllamaPool()
+    pool.register("hermes3:8b", [A, B])
+    return pool
+
+
+class TestResolve:
+    def test_precedence(self, monkeypatch):
+        monkeypatch.delenv("OLLAMA_ENDPOINTS", raising=False)
+        monkeypatch.setenv("OLLAMA_BASE_URL", "http://ollama:11434/")
+        assert resolve_base_urls(None, "http://localhost:11434") == ["http://ollama:11434"]
+
+        monkeypatch.setenv("OLLAMA_ENDPOINTS", f"{A}, {B},{A}")
+        assert resolve_base_urls() == [A, B]
+        assert resolve_base_urls([B]) == [B]
+
+
+class TestSelection:
+    def test_lanes(self):
+        single = OllamaPool()
+        single.register("hermes3:8b", [A])
+        assert single.lanes() == [None]  # Legacy gpu:queue keys
+        assert _pool().lanes() == ["gpu-a:11434", "gpu-b:11434"]
+
+    def test_least_outstanding(self):
+        pool = _pool()
+        pool.endpoints[A].outstanding = 3
+        assert pool.pick("hermes3:8b").url == B
+
+    def test_skips_unhealthy_unless_all_down(self):
+        pool = _pool()
+        pool.endpoints[B].healthy = False
+        assert {pool.pick("hermes3:8b").url for _ in range(4)} == {A}
+
+        pool.endpoints[A].healthy = False
+        assert pool.pick("hermes3:8b") is not None
+
+    def test_lease_tracks_outstanding_and_failures(self):
+        pool = _pool()
+
+        async def scenario():
+            async with pool.lease("hermes3:8b") as ep:
+                assert ep.outstanding == 1
+                assert current_endpoint() == ep.url
+                # A second concurrent request goes to the other host
+                async with pool.lease("hermes3:8b") as other:
+                    assert other.url != ep.url
+            assert current_endpoint() is None
+
+            with pytest.raises(ConnectionError):
+                async with pool.lease("hermes3:8b") as ep:
+                    raise ConnectionError("refused")
+            return ep
+
+        failed = asyncio.run(scenario())
+        assert not failed.healthy
+        assert all(e.outstanding == 0 for e in pool.endpoints.values())
+
+    def test_health_check_restores(self):
+        pool = _pool()
+        pool.endpoints[A].healthy = False
+
+        class Resp:
+            def __init__(self, url):
+                self.url = url
+
+            def raise_for_status(self):
+                if "gpu-b" in self.url:
+                    raise ConnectionError("down")
+
+            def json(self):
+                return {"models": [{"name": "hermes3:8b"}]}
+
+        class Client:
+            async def get(self, url, timeout=None):
+                return Resp(url)
+
+        asyncio.run(pool.check(Client()))
+        assert pool.endpoints[A].healthy and pool.endpoints[A].models == ["hermes3:8b"]
+        assert not pool.endpoints[B].healthy
+
+
+class TestMakeOllama:
+    def test_calls_leased_endpoint(self):
+        from providers import ollama_client
+
+        class FakeChat:
+            def __init__(self, base_url, **kwargs):
+                self.base_url = base_url
+
+            async def ainvoke(self, msgs):
+                return type("Msg", (), {"content": self.base_url})()
+
+        pool = _pool()
+        with patch.object(ollama_client, "ChatOllama", FakeChat), \
+             patch.object(ollama_client, "get_pool", return_value=pool):
+            chain = ollama_client.make_ollama("hermes3:8b", base_urls=[A, B])
+
+            async def call():
+                async with pool.lease("hermes3:8b") as ep:
+                    return ep.url, await chain.ainvoke({"messages": [{"role": "user", "content": "hi"}]})
+
+            leased, served = asyncio.run(call())
+            assert served == leased
@@ -0,0 +1,54 @@
+"""
+Test router-specific Prometheus collectors.
+
+Verifies:
+- Routing decisions and escalations are counted with bounded labels.
+- Collectors are served by the existing /metrics endpoint.
+"""
+from prometheus_client import REGISTRY
+
+from services import router_metrics as prom
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestRouterMetrics:
+    def test_route_node_counts_decision(self):
+        from graph import router
+
+        labels = {"task": "code_gen", "complexity": "medium", "model": "local-code"}
+        before = _sample("ai_router_decisions_total", labels)
+
+        state = {"routing_meta": {"task": "code_gen", "complexity": "medium"}, "messages": []}
+        result = router._node_route(state)
+
+        assert result["model_id"] == "local-code"
+        assert _sample("ai_router_decisions_total", labels) == before + 1
+
+    def test_unknown_label_values_are_bounded(self):
+        labels = {"task": "other", "complexity": "other", "model": "other"}
+        before = _sample("ai_router_decisions_total", labels)
+
+        prom.observe_decision("made-up-task", "extreme", "some-random-model-123")
+        prom.observe_escalation("quality_failed:anything")
+
+        assert _sample("ai_router_decisions_total", labels) == before + 1
+        assert _sample("ai_router_escalations_total", {"reason": "other"}) >= 1
+
+    def test_attempt_histograms(self):
+        before = _sample("ai_router_gpu_queue_wait_seconds_count", {})
+        prom.observe_attempt("ollama", "local-chat", 0.2, 1.5)
+        prom.observe_attempt("openai", "gpt-4o-mini", 0.0, 0.8)
+
+        assert _sample("ai_router_gpu_queue_wait_seconds_count", {}) == before + 1
+        assert _sample("ai_router_provider_latency_seconds_count", {"provider": "openai", "model": "gpt-4o-mini"}) >= 1
+
+    def test_collectors_on_metrics_endpoint(self, client, auth_headers):
+        prom.observe_judge_call("refined")
+        response = client.get("/metrics", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert "ai_router_decisions_total" in response.text
+        assert 'ai_router_judge_calls_total{outcome="refined"}' in response.text
@@ -0,0 +1,170 @@
+"""
+Tests for the semantic router stage (graph/semantic_router.py).
+
+A bag-of-words fake stands in for the Ollama embedding model.
+
+Verifies:
+- The index has one centroid per task/complexity pair and returns the nearest one.
+- reload() picks up an edited example file.
+- Lookups are cached; concurrent callers share one micro-batched embedding call.
+- Embedding failures skip the stage for the retry window instead of raising.
+- A failed startup build is retried in the background once the retry window passes.
+- The router only takes matches above min_similarity / min_margin.
+"""
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from graph import router  # noqa: E402
+from graph import semantic_router as sr  # noqa: E402
+from graph.router import RoutingMeta, classify_prompt_semantic  # noqa: E402
+
+VOCAB = ["python", "function", "code", "hello", "morning", "translate", "french", "deadlock", "production"]
+
+EXAMPLES = """
+code_gen:
+  medium:
+    - "write a python function"
+    - "python code please"
+chitchat:
+  low:
+    - "hello good morning"
+translation:
+  low:
+    - "translate this to french"
+"""
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        if self.fail:
+            raise ConnectionError("embedding model unreachable")
+        return [[float(w in t.lower()) + 1e-3 for w in VOCAB] for t in texts]
+
+
+@pytest.fixture
+def examples(tmp_path):
+    path = tmp_path / "examples.yaml"
+    path.write_text(EXAMPLES, encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def index(examples):
+    embed = FakeEmbedder()
+    idx = sr.SemanticRouter({"examples": str(examples)}, embed=embed)
+    idx.build()
+    return idx, embed
+
+
+def test_build_and_nearest_centroid(index):
+    idx, _ = index
+    status = idx.status()
+    assert status["ready"] and status["examples"] == 4 and status["centroids"] == 3
+
+    match = idx.classify("could you write some python code")
+    assert (match.task, match.complexity) == ("code_gen", "medium")
+    assert 0 < match.margin <= match.similarity <= 1.0001
+    assert [m.task for m in idx.classify_many(["hello!", "translate to french"])] == ["chitchat", "translation"]
+
+
+def test_reload_picks_up_new_examples(index, examples):
+    idx, _ = index
+    examples.write_text(EXAMPLES + """
+code_crit_debug:
+  critical:
+    - "deadlock in production"
+""", encoding="utf-8")
+    assert idx.reload()["centroids"] == 4
+    assert idx.classify("production deadlock again").task == "code_crit_debug"
+
+
+def test_cache_and_micro_batching(index, monkeypatch):
+    idx, embed = index
+    embed.calls.clear()
+    idx.classify("python function")
+    idx.classify("python function")
+    assert len(embed.calls) == 1
+
+    # Callers arriving within the window share one embedding call
+    embed.calls.clear()
+    idx.batcher.window = 0.05
+    texts = [f"hello morning {i}" for i in range(4)]
+    threads = [threading.Thread(target=idx.classify, args=(t,)) for t in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(t for call in embed.calls for t in call) == texts
+    assert len(embed.calls) < len(texts)
+
+
+def test_failure_skips_for_retry_window(index):
+    idx, embed = index
+    embed.fail = True
+    assert idx.classify("python code") is None
+    assert "unreachable" in idx.status()["last_error"]
+
+    embed.fail = False
+    embed.calls.clear()
+    assert idx.classify("python code") is None  # Still inside SEMANTIC_RETRY_SEC
+    assert embed.calls == []
+
+    idx._failed_at = 0.0
+    assert idx.classify("python code").task == "code_gen"
+
+
+def test_failed_build_is_retried(examples, monkeypatch):
+    embed = FakeEmbedder()
+    embed.fail = True
+    idx = sr.SemanticRouter({"examples": str(examples)}, embed=embed)
+    idx.start().join()
+    assert not idx.ready and "unreachable" in idx.status()["last_error"]
+
+    embed.fail = False
+    embed.calls.clear()
+    assert idx.classify("python code") is None  # Still inside SEMANTIC_RETRY_SEC
+    assert embed.calls == []
+
+    monkeypatch.setattr(sr, "RETRY_SEC", 0.0)
+    assert idx.classify("python code") is None  # Starts the rebuild without waiting for it
+    idx._build_thread.join()
+    assert idx.ready and idx.status()["last_error"] is None
+    assert idx.classify("python code").task == "code_gen"
+
+
+def test_router_stage(index, monkeypatch):
+    idx, _ = index
+    monkeypatch.setattr(router, "get_semantic_index", lambda: idx)
+    monkeypatch.setitem(router.CLASSIFIER_CFG, "semantic", {"enabled": True, "min_similarity": 0.6, "min_margin": 0.05})
+    msgs = [{"role": "user", "content": "python function code"}]
+
+    out = classify_prompt_semantic(msgs, RoutingMeta(task="simple_qa", complexity="low", confidence=0.3))
+    assert (out.task, out.complexity, out.classifier_used) == ("code_gen", "medium", "semantic")
+    assert out.confidence > 0.6
+
+    # Confident earlier stage: not consulted
+    sure = RoutingMeta(task="chitchat", complexity="low", confidence=0.9)
+    assert classify_prompt_semantic(msgs, sure).classifier_used == "heuristic"
+
+    # Weak match (shares words with two tasks): left for the judge
+    vague = [{"role": "user", "content": "translate this python function to french"}]
+    monkeypatch.setitem(router.CLASSIFIER_CFG, "semantic", {"enabled": True, "min_similarity": 0.95, "min_margin": 0.05})
+    out = classify_prompt_semantic(vague, RoutingMeta(task="simple_qa", complexity="low", confidence=0.3))
+    assert (out.task, out.classifier_used) == ("simple_qa", "heuristic")
+
+
+def test_not_ready_or_disabled(examples, monkeypatch):
+    idx = sr.SemanticRouter({"examples": str(examples)}, embed=FakeEmbedder())
+    assert idx.classify("python code") is None
+    assert sr.get_router({"enabled": False}) is sr._router
+    monkeypatch.setattr(sr, "_router", None)
+    monkeypatch.setattr(sr, "np", None)
+    assert sr.get_router({"enabled": True}) is None
@@ -0,0 +1,102 @@
+"""
+Tests for the JSON serialization layer (services/serialization.py).
+
+Verifies:
+- dumps() output decodes to the same data as stdlib json, including unicode,
+  non-string keys and objects stdlib cannot encode; the stdlib fallback agrees.
+- SSE frames carry {"type", "sequence_number", **payload} with the envelope
+  pre-encoded; pre-encoded values embed verbatim.
+- /v1/responses streams the same events as before, with the text in every
+  frame that carries it.
+"""
+import dataclasses
+import datetime
+import json
+
+import pytest
+
+from services import serialization as ser
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+def test_dumps_matches_stdlib():
+    data = {"text": "olá ✓ \"quoted\"\n", "n": 1.5, "items": [1, None, True], "nested": {"k": "v"}}
+    assert isinstance(ser.dumps(data), bytes)
+    assert json.loads(ser.dumps(data)) == data
+    assert json.loads(ser.dumps_str(data)) == data
+    assert ser.ndjson_line(data).endswith(b"\n") and json.loads(ser.ndjson_line(data)) == data
+
+    odd = {1: datetime.datetime(2026, 1, 2, 3, 4, 5), "p": Point(1, 2), "o": object}
+    decoded = json.loads(ser.dumps(odd))
+    assert decoded["1"] == "2026-01-02T03:04:05" and decoded["p"] == {"x": 1, "y": 2} and "object" in decoded["o"]
+
+
+def test_stdlib_fallback(monkeypatch):
+    data = {"text": "olá", "p": Point(3, 4), "when": datetime.date(2026, 5, 6)}
+    fast = json.loads(ser.dumps(data))
+    monkeypatch.setattr(ser, "orjson", None)
+    monkeypatch.setattr(ser, "_Fragment", None)
+    assert json.loads(ser.dumps(data)) == fast
+    assert ser.preencoded("x") == "x"
+    assert json.loads(ser.ndjson_line(data)) == fast
+
+
+def _parse_frame(frame: bytes):
+    text = frame.decode("utf-8")
+    assert text.endswith("\n\n")
+    event, data = text[:-2].split("\n")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+
+def test_sse_event_envelope():
+    event, data = _parse_frame(ser.sse_event("response.output_text.delta", {"item_id": "item_0", "delta": "hi"}, 3))
+    assert event == "response.output_text.delta"
+    assert data == {"type": "response.output_text.delta", "sequence_number": 3, "item_id": "item_0", "delta": "hi"}
+    assert list(data)[:2] == ["type", "sequence_number"]
+
+    assert _parse_frame(ser.sse_event("error", {"error": {"message": "x"}}))[1] == {"type": "error", "error": {"message": "x"}}
+    assert _parse_frame(ser.sse_event("ping", {}, 0))[1] == {"type": "ping", "sequence_number": 0}
+
+    text = "long completion " * 1000
+    assert json.loads(ser.dumps({"a": ser.preencoded(text), "b": [ser.preencoded(text)]})) == {"a": text, "b": [text]}
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_responses_api_output(client, auth_headers, stream):
+    from app import main as m
+
+    content = 'Here is the fix:\n```python\nprint("olá")\n```'
+
+    class FakeRouter:
+        async def ainvoke(self, state, **kwargs):
+            return {"output": content, "usage": {"resolved_model_id": "local-code", "prompt_tokens_est": 5}}
+
+    original = m.router_app
+    m.router_app = FakeRouter()
+    try:
+        r = client.post("/v1/responses", json={"model": "router-auto", "input": "fix it", "stream": stream}, headers=auth_headers)
+    finally:
+        m.router_app = original
+    assert r.status_code == 200
+
+    if not stream:
+        body = r.json()
+        assert body["output"][0]["content"][0]["text"] == content and body["usage"]["input_tokens"] == 5
+        return
+
+    frames = [_parse_frame((chunk + "\n\n").encode()) for chunk in r.text.strip().split("\n\n")]
+    assert [e for e, _ in frames] == [
+        "response.created", "response.output_item.added", "response.content_part.added",
+        "response.output_text.delta", "response.output_text.done", "response.output_item.done", "response.completed",
+    ]
+    assert [d["sequence_number"] for _, d in frames] == list(range(7))
+    events = dict(frames)
+    assert events["response.output_text.delta"]["delta"] == content
+    assert events["response.output_text.done"]["text"] == content
+    assert events["response.output_item.done"]["item"]["content"][0]["text"] == content
+    assert events["response.completed"]["response"]["output"][0]["content"][0]["text"] == content
@@ -0,0 +1,159 @@
+"""
+Test rolling spend windows in the Cost Guard.
+
+Verifies:
+- Spend is tracked per window, globally and per API key.
+- The previous window decays out of the sliding estimate.
+- Exhausted windows make the router degrade to local models.
+- Redis writes from async callers run off the event loop, with socket timeouts.
+- SLA cloud fallbacks are skipped when cloud is unavailable, and billed when they run.
+"""
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from graph.cost_guard import SpendTracker, arecord_spend, spend_exhausted
+
+T0 = 1_700_000_000 - (1_700_000_000 % 86400)  # Start of a UTC day
+
+
+class TestSpendTracker:
+    def test_record_is_global_and_per_key(self):
+        tracker = SpendTracker(backend="memory")
+        tracker.record(0.30, "key-a", now=T0)
+        tracker.record(0.20, "key-b", now=T0)
+
+        assert tracker.spent("global", "day", now=T0) == 0.50
+        assert tracker.spent("key:key-a", "hour", now=T0) == 0.30
+        assert tracker.spent("key:key-b", "minute", now=T0) == 0.20
+
+    def test_previous_window_decays(self):
+        tracker = SpendTracker(backend="memory")
+        tracker.record(1.0, now=T0 + 30)  # Minute 0
+
+        # Halfway through minute 1, half of minute 0 still counts
+        assert abs(tracker.spent("global", "minute", now=T0 + 90) - 0.5) < 1e-9
+        # Two minutes later it has rolled out completely
+        assert tracker.spent("global", "minute", now=T0 + 150) == 0.0
+        # The hour window still holds it
+        assert tracker.spent("global", "hour", now=T0 + 150) == 1.0
+
+    def test_exhausted_windows(self):
+        tracker = SpendTracker(backend="memory")
+        limits = {"global": {"day": 5.0}, "key": {"hour": 1.0}}
+        tracker.record(1.5, "key-a")
+
+        assert tracker.exhausted("key-a", limits) == ["key:hour"]
+        assert tracker.exhausted("key-b", limits) == []
+
+        tracker.record(4.0, "key-b")
+        assert tracker.exhausted("key-b", limits) == ["global:day", "key:hour"]
+
+    def test_unlimited_by_default(self, monkeypatch):
+        for var in ("SPEND_LIMIT_MINUTE_USD", "SPEND_LIMIT_HOUR_USD", "SPEND_LIMIT_DAY_USD", "DAILY_BUDGET_USD"):
+            monkeypatch.delenv(var, raising=False)
+        assert spend_exhausted("key-a") == []
+
+
+class TestAsyncRecording:
+    @pytest.mark.asyncio
+    async def test_redis_writes_run_off_the_event_loop(self):
+        tracker = SpendTracker(backend="memory")
+        tracker._redis = object()  # Pretend Redis is configured
+        threads = []
+        tracker.record = lambda cost, key=None: threads.append(threading.get_ident())
+
+        with patch("graph.cost_guard._tracker", tracker):
+            await arecord_spend(0.5, "key-a")
+            await arecord_spend(0.0, "key-a")  # Free (local) requests skip the hop entirely
+        assert len(threads) == 1 and threads[0] != threading.get_ident()
+
+    def test_redis_client_has_timeouts(self, monkeypatch):
+        redis = pytest.importorskip("redis")
+        seen = {}
+
+        class FakeRedis:
+            def ping(self):
+                return True
+
+        def from_url(url, **kwargs):
+            seen.update(kwargs)
+            return FakeRedis()
+
+        monkeypatch.setattr(redis.Redis, "from_url", staticmethod(from_url))
+        SpendTracker(backend="redis", redis_url="redis://example:6379/0")
+        assert seen["socket_timeout"] > 0 and seen["socket_connect_timeout"] > 0
+
+
+class TestRouterDegradation:
+    def test_exhausted_budget_routes_local(self, monkeypatch):
+        from graph import router
+
+        monkeypatch.setenv("SPEND_LIMIT_KEY_HOUR_USD", "1.0")
+        tracker = SpendTracker(backend="memory")
+        tracker.record(2.0, "key-a")
+
+        state = {
+            "messages": [{"role": "user", "content": "Design a distributed system architecture for payments"}],
+            "api_key_id": "key-a",
+        }
+        with patch("graph.cost_guard._tracker", tracker), \
+             patch.object(router, "_is_cloud_available", return_value=True), \
+             patch.object(router, "is_cloud_enabled", return_value=True), \
+             patch.object(router, "classify_prompt_with_llm", side_effect=lambda msgs, meta: meta):
+            result = router._node_classify(state)
+            assert result["cloud_available"] is False
+            assert result["spend_limited"] == ["key:hour"]
+
+            routed = router._node_route({**state, **result})
+            assert router.REG.get(routed["model_id"], {}).get("provider") != "openai"
+
+    @pytest.mark.asyncio
+    async def test_sla_fallback_respects_cloud_availability(self, monkeypatch):
+        from langchain_core.runnables import RunnableLambda
+
+        from graph import router
+
+        async def failing(x):
+            raise RuntimeError("local model down")
+
+        async def cloud(x):
+            return "cloud answer"
+
+        calls = []
+        monkeypatch.setattr(router, "_fallback_enabled", lambda: True)
+        monkeypatch.setattr(router, "_get_chain", lambda m: calls.append(m) or RunnableLambda(cloud))
+
+        # Spend exhausted (cloud_available=False): no cloud fallback
+        with pytest.raises(RuntimeError):
+            await router._sla_wrap(RunnableLambda(failing), False).ainvoke({"messages": [], "model_id": "local-code"})
+        assert calls == []
+
+        x = {"messages": [], "model_id": "local-code"}
+        assert await router._sla_wrap(RunnableLambda(failing), True).ainvoke(x) == "cloud answer"
+        assert x["fallback_model"] == calls[0]
+
+    @pytest.mark.asyncio
+    async def test_fallback_spend_is_recorded(self, monkeypatch):
+        from graph import router
+
+        class FallbackRunnable:
+            async def ainvoke(self, x):
+                x["fallback_model"] = "gpt-5.2-codex-high"
+                return "def f(): pass"
+
+        monkeypatch.setattr(router, "_sla_wrap", lambda runnable, cloud_available=True: FallbackRunnable())
+        monkeypatch.setattr(router, "record_event", lambda event: None)
+        tracker = SpendTracker(backend="memory")
+        state = {
+            "messages": [{"role": "user", "content": "Write a Python function"}],
+            "model_id": "local-code",
+            "cloud_available": True,
+            "api_key_id": "key-a",
+            "routing_meta": {"task": "code_gen", "complexity": "medium", "confidence": 0.9},
+        }
+        with patch("graph.cost_guard._tracker", tracker):
+            result = await router._node_invoke(state)
+        assert result["usage"]["resolved_model_id"] == "gpt-5.2-codex-high"
+        assert tracker.spent("key:key-a", "hour") > 0
@@ -0,0 +1,131 @@
+"""
+Test tokenizer-backed token counting.
+
+Verifies:
+- Model names map to the right tokenizer family.
+- The len/4 estimator is used when no tokenizer can be loaded.
+- Per-message counts are memoized across turns of the same history.
+- Loading a tokenizer does not block other threads (they estimate meanwhile).
+- tiktoken is only used with TIKTOKEN_CACHE_DIR set; preload() loads families up front.
+"""
+import threading
+
+from services.token_counter import (
+    TOKENS_PER_MESSAGE,
+    TOKENS_PER_REPLY,
+    TokenCounter,
+    estimate_tokens,
+    family_for_model,
+)
+
+
+def _word_counter():
+    """Counter with a fake encoder (1 token per word) for every family."""
+    counter = TokenCounter(backend="auto")
+    calls = []
+
+    def encoder(text):
+        calls.append(text)
+        return len(text.split())
+
+    counter._load = lambda family: encoder
+    return counter, calls
+
+
+class TestFamilies:
+    def test_model_families(self):
+        assert family_for_model("gpt-4o-mini") == "o200k_base"
+        assert family_for_model("gpt-5.1-codex") == "o200k_base"
+        assert family_for_model("o3-mini") == "o200k_base"
+        assert family_for_model("gpt-4-turbo") == "cl100k_base"
+        assert family_for_model("hermes3:8b") == "llama3"
+        assert family_for_model("llama3.1:8b-instruct-q5_K_M") == "llama3"
+        assert family_for_model("deepseek-coder-v2:16b") == "deepseek"
+
+
+class TestCounting:
+    def test_estimate_backend(self):
+        counter = TokenCounter(backend="estimate")
+        assert counter.count_text("x" * 10, "gpt-4o") == estimate_tokens("x" * 10) == 3
+        msgs = [{"role": "user", "content": "x" * 8}]
+        assert counter.count_messages(msgs, "gpt-4o") == 2 + TOKENS_PER_MESSAGE + TOKENS_PER_REPLY
+
+    def test_unavailable_tokenizer_falls_back_and_is_not_retried(self):
+        counter = TokenCounter(backend="auto")
+        loads = []
+        counter._load = lambda family: loads.append(family)  # returns None
+        assert counter.count_text("abcdefgh", "gpt-4o") == 2
+        assert counter.count_text("abcdefgh", "gpt-4o") == 2
+        assert loads == ["o200k_base"]
+
+    def test_slow_load_does_not_block_other_threads(self):
+        counter = TokenCounter(backend="auto")
+        started, release = threading.Event(), threading.Event()
+
+        def slow_load(family):
+            started.set()
+            release.wait(5)
+            return lambda text: 1
+
+        counter._load = slow_load
+        loader = threading.Thread(target=counter.count_text, args=("abcdefgh", "gpt-4o"))
+        loader.start()
+        assert started.wait(5)
+        # Another thread counts with the estimator while the encoder is loading
+        assert counter.count_text("abcdefgh", "gpt-4o") == 2
+        release.set()
+        loader.join(5)
+        assert counter.count_text("abcdefgh", "gpt-4o") == 1
+
+    def test_tokenizer_counts_messages(self):
+        counter, _ = _word_counter()
+        msgs = [
+            {"role": "system", "content": "be brief"},
+            {"role": "user", "content": "what is a monad"},
+        ]
+        assert counter.count_messages(msgs, "gpt-4o") == 2 + 4 + 2 * TOKENS_PER_MESSAGE + TOKENS_PER_REPLY
+
+    def test_history_is_memoized(self):
+        counter, calls = _word_counter()
+        history = [{"role": "user", "content": f"turn {i} " * 50} for i in range(20)]
+
+        counter.count_messages(history, "gpt-4o")
+        assert len(calls) == 20
+
+        history.append({"role": "user", "content": "one more"})
+        counter.count_messages(history, "gpt-4o")
+        assert len(calls) == 21  # Only the new message is tokenized
+        assert counter.hits == 20
+
+    def test_cache_is_per_family_and_bounded(self):
+        counter, calls = _word_counter()
+        counter.cache_size = 2
+        counter.count_text("a b", "gpt-4o")
+        counter.count_text("a b", "gpt-4-turbo")
+        assert len(calls) == 2  # Different families tokenize separately
+
+        counter.count_text("c d", "gpt-4o")
+        assert len(counter._cache) == 2
+
+    def test_tiktoken_needs_a_cache_dir(self, monkeypatch):
+        import sys
+        import types
+
+        fetched = []
+
+        def get_encoding(name):
+            fetched.append(name)
+            return types.SimpleNamespace(encode=lambda text, disallowed_special=(): text.split())
+
+        monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=get_encoding))
+
+        monkeypatch.delenv("TIKTOKEN_CACHE_DIR", raising=False)
+        counter = TokenCounter(backend="auto", tokenizer_dir=None)
+        assert counter.count_text("a b c d e f g h", "gpt-4o") == estimate_tokens("a b c d e f g h")
+        assert fetched == []  # No download on the request path
+
+        monkeypatch.setenv("TIKTOKEN_CACHE_DIR", "/tmp/tiktoken-cache")
+        counter = TokenCounter(backend="auto", tokenizer_dir=None)
+        assert counter.preload(["gpt-4o", "gpt-4o-mini", "hermes3:8b"]) == {"llama3": True, "o200k_base": True}
+        assert sorted(fetched) == ["cl100k_base", "o200k_base"]
+        assert counter.count_text("a b c", "gpt-4o") == 3
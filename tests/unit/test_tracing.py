@@ -0,0 +1,80 @@
+"""
+Test per-stage tracing and Server-Timing headers.
+
+Verifies:
+- span() is a shared no-op outside a trace.
+- Graph node / queue / provider stages are recorded and summed in Server-Timing.
+- The file exporter writes OTLP/JSON documents.
+- HTTP responses carry a Server-Timing header.
+"""
+import json
+import time
+
+from services import tracing
+
+
+class TestTracing:
+    def test_span_is_noop_without_trace(self):
+        assert tracing.current_trace() is None
+        assert tracing.span("classify") is tracing.NOOP_SPAN
+        # Recording outside a trace is silently ignored
+        tracing.record_span("provider", 0.0, 1.0)
+
+    def test_node_spans_and_server_timing(self):
+        from graph import router
+
+        trace = tracing.start_trace("test")
+        try:
+            router._traced("classify", router._node_classify)({"messages": [{"role": "user", "content": "hi"}]})
+            t0 = time.perf_counter()
+            tracing.record_span("provider", t0, t0 + 0.010, model="local-chat")
+            tracing.record_span("provider", t0, t0 + 0.005, model="local-code")
+        finally:
+            tracing.finish_trace(trace)
+
+        names = [s.name for s in trace.spans]
+        assert names == ["classify", "provider", "provider"]
+        header = trace.server_timing()
+        assert header.startswith("classify;dur=")
+        assert "provider;dur=15.0" in header
+        assert "total;dur=" in header
+        assert tracing.current_trace() is None
+
+    def test_nested_spans_have_parent(self):
+        trace = tracing.start_trace("nested")
+        try:
+            with tracing.span("invoke") as outer:
+                with tracing.span("judge") as inner:
+                    pass
+        finally:
+            tracing.finish_trace(trace)
+
+        assert inner.parent_id == outer.span_id
+        assert outer.parent_id == trace.root_id
+
+    def test_traceparent_is_continued(self):
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+        trace = tracing.start_trace("child", f"00-{trace_id}-00f067aa0ba902b7-01")
+        tracing.finish_trace(trace)
+
+        otlp = trace.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert otlp["traceId"] == trace_id
+        assert otlp["parentSpanId"] == "00f067aa0ba902b7"
+
+    def test_file_exporter_writes_otlp(self, tmp_path):
+        exporter = tracing.FileExporter(str(tmp_path / "traces.jsonl"))
+        trace = tracing.Trace("POST /route")
+        with tracing.Span(trace, "route", trace.root_id, {"model": "local-code"}):
+            pass
+        exporter.export(trace)
+
+        doc = json.loads((tmp_path / "traces.jsonl").read_text().splitlines()[0])
+        spans = doc["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert [s["name"] for s in spans] == ["POST /route", "route"]
+        assert spans[1]["attributes"] == [{"key": "model", "value": {"stringValue": "local-code"}}]
+
+    def test_server_timing_header_on_response(self, client, auth_headers):
+        response = client.post("/debug/router_decision", json={"prompt": "hello there"}, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert "total;dur=" in response.headers.get("Server-Timing", "")
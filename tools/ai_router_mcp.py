@@ -1,74 +1,276 @@
 #!/usr/bin/env python3
+"""
+MCP server (JSON lines over stdio) exposing the AI Router as the `ai_router.route` tool.
+
+Requests are handled concurrently: every tools/call runs in its own task, so a
+slow generation never blocks other calls. `notifications/cancelled` cancels the
+matching call (no response is sent for it, as MCP specifies).
+
+Backends:
+  http (default)  POST /route over one pooled keep-alive httpx client
+  inprocess       runs the compiled graph in this process, no HTTP hop
+                  (--in-process or AI_ROUTER_MCP_MODE=inprocess)
+
+When a call carries params._meta.progressToken, partial content is sent as
+notifications/progress (message = new text). In-process this is the model's
+token stream; over HTTP /route answers in one piece, so progress is a periodic
+heartbeat until the reply arrives.
+
+The legacy `tool/list` / `tool/call` methods keep their old result shapes.
+"""
+import argparse
+import asyncio
 import json
+import logging
+import os
 import sys
-import urllib.request
-
-
-def call_route(messages, budget="balanced", prefer_code=None):
-    body = {"messages": messages, "budget": budget}
-    if prefer_code is not None:
-        body["prefer_code"] = bool(prefer_code)
-    req = urllib.request.Request(
-        "http://localhost:8082/route",
-        data=json.dumps(body).encode("utf-8"),
-        headers={"Content-Type": "application/json"},
-        method="POST",
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger("ai-router.mcp")
+
+# Config from Env
+ROUTER_URL = os.getenv("AI_ROUTER_URL", "http://localhost:8082")
+API_KEY = os.getenv("AI_ROUTER_API_KEY", "")
+MODE = os.getenv("AI_ROUTER_MCP_MODE", "http")
+TIMEOUT_SEC = float(os.getenv("AI_ROUTER_MCP_TIMEOUT_SEC", "120"))
+MAX_CONNECTIONS = int(os.getenv("AI_ROUTER_MCP_MAX_CONNECTIONS", "16"))
+HEARTBEAT_SEC = float(os.getenv("AI_ROUTER_MCP_HEARTBEAT_SEC", "5"))
+
+PROTOCOL_VERSION = "2024-11-05"
+TOOL = {
+    "name": "ai_router.route",
+    "description": "Call /route on local AI Router",
+    "inputSchema": {
+        "type": "object",
+        "properties": {
+            "messages": {"type": "array", "items": {"type": "object"}},
+            "budget": {"type": "string", "enum": ["low", "balanced", "high"]},
+            "prefer_code": {"type": "boolean"},
+        },
+        "required": ["messages"],
+    },
+}
+
+OnPartial = Callable[[str], Awaitable[None]]
+
+
+def _route_body(args: Dict[str, Any]) -> Dict[str, Any]:
+    body = {"messages": args.get("messages", []), "budget": args.get("budget", "balanced")}
+    if args.get("prefer_code") is not None:
+        body["prefer_code"] = bool(args["prefer_code"])
+    return body
+
+
+def _content(out: Dict[str, Any]) -> str:
+    return (
+        out.get("content")
+        or out.get("text")
+        or (out.get("message") or {}).get("content")
+        or out.get("output")
+        or ""
     )
-    with urllib.request.urlopen(req, timeout=120) as resp:
-        return json.loads(resp.read().decode("utf-8"))
 
-# Protocolo MCP mínimo via stdio (schema simplificado)
-def main():
-    for line in sys.stdin:
-        msg = json.loads(line)
-        if msg.get("method") == "tool/list":
-            response = {
-                "id": msg.get("id"),
-                "result": [{
-                    "name": "ai_router.route",
-                    "description": "Call /route on local AI Router"
-                }]
-            }
-            print(json.dumps(response))
-            sys.stdout.flush()
-
-        elif msg.get("method") == "tool/call":
-            params = msg["params"]
-            name = params["name"]
-
-            if name != "ai_router.route":
-                print(json.dumps({
-                    "id": msg.get("id"),
-                    "error": {"message": "unknown tool"}
-                }))
-                sys.stdout.flush()
-                continue
-            
-            args = params.get("arguments") or {}
-            out = call_route(
-                args.get("messages", []),
-                args.get("budget", "balanced"),
-                args.get("prefer_code")
-            )
-
-            content = (
-                out.get("content") or 
-                out.get("text") or 
-                (out.get("message") or {}).get("content") or 
-                out.get("output")
-            )
-            result = {"content": content, "usage": out.get("usage")}
-            
-            print(json.dumps({"id": msg.get("id"), "result": result}))
-            sys.stdout.flush()
 
+class HttpBackend:
+    """POST /route through a shared keep-alive connection pool."""
+
+    def __init__(self, base_url: str = ROUTER_URL, api_key: str = API_KEY, client=None):
+        import httpx
+
+        headers = {"X-API-Key": api_key} if api_key else {}
+        self.client = client or httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(TIMEOUT_SEC, connect=5.0),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+
+    async def route(self, args: Dict[str, Any], on_partial: Optional[OnPartial] = None) -> Dict[str, Any]:
+        request = asyncio.ensure_future(self.client.post("/route", json=_route_body(args)))
+        try:
+            t0 = time.perf_counter()
+            while on_partial and HEARTBEAT_SEC > 0:
+                done, _ = await asyncio.wait({request}, timeout=HEARTBEAT_SEC)
+                if done:
+                    break
+                await on_partial("")  # Heartbeat: still waiting, no new text
+                logger.debug(f"/route still running after {time.perf_counter() - t0:.0f}s")
+            resp = await request
+        finally:
+            request.cancel()  # Client cancelled the call: drop the HTTP request too
+        resp.raise_for_status()
+        return resp.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class InProcessBackend:
+    """Runs the compiled LangGraph router directly (same state as POST /route)."""
+
+    def __init__(self, graph=None):
+        if graph is None:
+            from graph.router import build_compiled_router
+            graph = build_compiled_router()
+        self.graph = graph
+
+    async def route(self, args: Dict[str, Any], on_partial: Optional[OnPartial] = None) -> Dict[str, Any]:
+        body = _route_body(args)
+        state = {
+            "messages": body["messages"],
+            "budget": body["budget"],
+            "prefer_code": body.get("prefer_code", False),
+            "critical": False,
+            "api_key_id": "mcp",
+            "_latency_start": time.perf_counter(),
+        }
+        if not on_partial:
+            return await self.graph.ainvoke(state)
+
+        out = None
+        async for event in self.graph.astream_events(state, version="v2"):
+            if event["event"] == "on_chat_model_stream":
+                text = getattr(event["data"].get("chunk"), "content", "")
+                if text:
+                    await on_partial(text)
+            elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                out = event["data"].get("output")
+        return out or {}
+
+    async def aclose(self):
+        pass
+
+
+class McpServer:
+    def __init__(self, backend, write: Callable[[Dict[str, Any]], None]):
+        self.backend = backend
+        self.write = write
+        self.tasks: Dict[Any, asyncio.Task] = {}
+
+    def dispatch(self, msg: Dict[str, Any]):
+        """Handle one incoming message; tool calls run as tasks, everything else inline."""
+        method = msg.get("method")
+        if method in ("tools/call", "tool/call"):
+            task = asyncio.ensure_future(self._call(msg))
+            self.tasks[msg.get("id")] = task
+            task.add_done_callback(lambda _: self.tasks.pop(msg.get("id"), None))
+            return task
+        if method == "notifications/cancelled":
+            task = self.tasks.get((msg.get("params") or {}).get("requestId"))
+            if task:
+                task.cancel()
+            return None
+        if method and method.startswith("notifications/"):
+            return None
+        self._reply(msg, *self._simple(method))
+        return None
+
+    def _simple(self, method: str):
+        if method == "initialize":
+            return {
+                "protocolVersion": PROTOCOL_VERSION,
+                "capabilities": {"tools": {}},
+                "serverInfo": {"name": "ai_router_mcp", "version": "2.0"},
+            }, None
+        if method == "ping":
+            return {}, None
+        if method == "tools/list":
+            return {"tools": [TOOL]}, None
+        if method == "tool/list":
+            return [{"name": TOOL["name"], "description": TOOL["description"]}], None
+        return None, {"code": -32601, "message": "unknown method"}
+
+    def _reply(self, msg: Dict[str, Any], result: Any = None, error: Optional[Dict[str, Any]] = None):
+        out = {"jsonrpc": "2.0", "id": msg.get("id")}
+        if error:
+            out["error"] = error
+        else:
+            out["result"] = result
+        self.write(out)
+
+    async def _call(self, msg: Dict[str, Any]):
+        params = msg.get("params") or {}
+        legacy = msg.get("method") == "tool/call"
+        if params.get("name") != TOOL["name"]:
+            self._reply(msg, error={"code": -32602, "message": "unknown tool"})
+            return
+
+        token = (params.get("_meta") or {}).get("progressToken")
+        progress = 0
+
+        async def on_partial(text: str):
+            nonlocal progress
+            progress += 1
+            self.write({"jsonrpc": "2.0", "method": "notifications/progress",
+                        "params": {"progressToken": token, "progress": progress, "message": text}})
+
+        try:
+            out = await self.backend.route(params.get("arguments") or {}, on_partial if token is not None else None)
+        except asyncio.CancelledError:
+            logger.info(f"MCP call {msg.get('id')} cancelled")
+            raise
+        except Exception as e:
+            logger.warning(f"MCP call {msg.get('id')} failed: {type(e).__name__}: {e}")
+            if legacy:
+                self._reply(msg, error={"message": str(e)})
+            else:
+                self._reply(msg, {"content": [{"type": "text", "text": f"AI Router error: {e}"}], "isError": True})
+            return
+
+        if legacy:
+            self._reply(msg, {"content": _content(out), "usage": out.get("usage")})
         else:
-            print(json.dumps({
-                "id": msg.get("id"),
-                "error": {"message": "unknown method"}
-            }))
-            sys.stdout.flush()
+            self._reply(msg, {
+                "content": [{"type": "text", "text": _content(out)}],
+                "isError": out.get("type") == "upstream_error",
+                "_meta": {"usage": out.get("usage")},
+            })
+
+    async def serve(self, reader: asyncio.StreamReader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                self.write({"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "parse error"}})
+                continue
+            self.dispatch(msg)
+        # stdin closed: let in-flight calls finish before exiting
+        if self.tasks:
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+
+def _write_stdout(msg: Dict[str, Any]):
+    # One write per message so concurrent replies never interleave
+    sys.stdout.write(json.dumps(msg) + "\n")
+    sys.stdout.flush()
+
+
+async def _main(mode: str):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2 ** 24)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    backend = InProcessBackend() if mode == "inprocess" else HttpBackend()
+    try:
+        await McpServer(backend, _write_stdout).serve(reader)
+    finally:
+        await backend.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Router MCP server (stdio)")
+    parser.add_argument("--in-process", action="store_true", help="Run the router graph in-process instead of calling /route")
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stderr, level=os.getenv("LOG_LEVEL", "WARNING"))
+    asyncio.run(_main("inprocess" if args.in_process else MODE))
+
 
 if __name__ == "__main__":
     main()
-
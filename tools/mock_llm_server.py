@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for Ollama and the OpenAI API, for offline load tests.
+
+One process serves both protocols:
+  Ollama:  POST /api/chat (NDJSON stream or single JSON), GET /api/tags,
+           GET /api/ps, POST /api/generate (load / unload only)
+  OpenAI:  POST /v1/chat/completions (SSE stream or single JSON), GET /v1/models
+
+Replies are derived from a hash of (model, messages), so the same request always
+gets the same text and token count. Replies contain a fenced code block, a list
+and "issue"/"fix" words, so they pass the router's cascade quality gate.
+
+Served models default to the provider names in the router registry
+(config/router_config.yaml, or $ROUTER_CONFIG), so every model the router can
+pick is found.
+
+Knobs (flags or MOCK_LLM_* env vars):
+  --models           comma-separated model names (default: the router registry)
+  --ttft-ms          time to first token (prompt processing)
+  --tokens-per-sec   generation speed after the first token
+  --reply-tokens     tokens per reply (capped by num_predict / max_tokens)
+  --load-ms          cold load paid by the first request to a model (Ollama load_duration)
+  --error-rate       fraction of requests answered with --error-status (seeded, reproducible)
+  --max-concurrency  requests generating at once (like OLLAMA_NUM_PARALLEL)
+  --max-queue        requests waiting beyond that; more are rejected
+                     (Ollama: 503 "server busy", OpenAI: 429 rate limit)
+
+Examples:
+  python tools/mock_llm_server.py --port 11434 --ttft-ms 300 --tokens-per-sec 40 --max-concurrency 1
+  OLLAMA_BASE_URL=http://localhost:11434 OPENAI_BASE_URL=http://localhost:11434/v1 OPENAI_API_KEY=mock \\
+      uvicorn app.main:app --port 8082
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ROOT = Path(__file__).resolve().parents[1]
+CONFIG_PATH = os.getenv("ROUTER_CONFIG", str(ROOT / "config" / "router_config.yaml"))
+
+WORDS = (
+    "the router checks each request and picks a model that fits the task budget and context window "
+    "so latency stays low while quality holds under load with retries queues and fallbacks"
+).split()
+
+
+def registry_models(path: str = CONFIG_PATH) -> List[str]:
+    """Provider model names (`name`) of the router registry, i.e. what the router sends upstream."""
+    with open(path, encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    names = []
+    for entry in cfg.get("models", []):
+        name = entry.get("name") or entry.get("id")
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+@dataclass
+class MockSettings:
+    models: List[str] = field(default_factory=registry_models)
+    ttft_ms: float = 200.0
+    tokens_per_sec: float = 50.0
+    reply_tokens: int = 64
+    load_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    max_concurrency: int = 4
+    max_queue: int = 64
+    seed: int = 42
+
+    @classmethod
+    def from_env(cls) -> "MockSettings":
+        s = cls()
+        if os.getenv("MOCK_LLM_MODELS"):
+            s.models = [m.strip() for m in os.getenv("MOCK_LLM_MODELS").split(",") if m.strip()]
+        s.ttft_ms = float(os.getenv("MOCK_LLM_TTFT_MS", s.ttft_ms))
+        s.tokens_per_sec = float(os.getenv("MOCK_LLM_TOKENS_PER_SEC", s.tokens_per_sec))
+        s.reply_tokens = int(os.getenv("MOCK_LLM_REPLY_TOKENS", s.reply_tokens))
+        s.load_ms = float(os.getenv("MOCK_LLM_LOAD_MS", s.load_ms))
+        s.error_rate = float(os.getenv("MOCK_LLM_ERROR_RATE", s.error_rate))
+        s.error_status = int(os.getenv("MOCK_LLM_ERROR_STATUS", s.error_status))
+        s.max_concurrency = int(os.getenv("MOCK_LLM_MAX_CONCURRENCY", s.max_concurrency))
+        s.max_queue = int(os.getenv("MOCK_LLM_MAX_QUEUE", s.max_queue))
+        s.seed = int(os.getenv("MOCK_LLM_SEED", s.seed))
+        return s
+
+
+def reply_tokens(model: str, messages: List[Dict[str, Any]], n: int) -> List[str]:
+    """Deterministic reply for (model, messages), split into `n` streamable tokens."""
+    digest = hashlib.sha256(json.dumps([model, messages], sort_keys=True, default=str).encode()).digest()
+    rng = random.Random(digest)
+    head = ["```python\n", "def ", "answer", "():\n", "    return ", "True\n", "```\n", "- issue", ": none", ", fix", ":"]
+    tokens = head[:n]
+    while len(tokens) < n:
+        tokens.append(" " + rng.choice(WORDS))
+    return tokens
+
+
+def prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Rough prompt size (~4 chars per token), enough for usage fields."""
+    return max(1, sum(len(str(m.get("content") or "")) for m in messages) // 4)
+
+
+class MockLLM:
+    """Shared state: admission (concurrency + queue), error injection, resident models, counters."""
+
+    def __init__(self, settings: MockSettings):
+        self.s = settings
+        self.rng = random.Random(settings.seed)
+        self.resident: Dict[str, float] = {}  # model -> last used
+        self.active = 0
+        self.waiting = 0
+        self.stats = {"requests": 0, "rejected": 0, "errors": 0, "completed": 0}
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    @property
+    def sem(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the serving event loop
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(max(1, self.s.max_concurrency))
+        return self._sem
+
+    def admit(self) -> Optional[str]:
+        """Reason to refuse this request ('busy' or 'error'), else None."""
+        self.stats["requests"] += 1
+        if self.active >= self.s.max_concurrency and self.waiting >= self.s.max_queue:
+            self.stats["rejected"] += 1
+            return "busy"
+        if self.s.error_rate and self.rng.random() < self.s.error_rate:
+            self.stats["errors"] += 1
+            return "error"
+        return None
+
+    async def acquire(self):
+        """Wait for a generation slot (counted in `waiting` meanwhile)."""
+        self.waiting += 1
+        try:
+            await self.sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self.sem.release()
+
+    async def load(self, model: str) -> float:
+        """Seconds spent loading `model` (0 when already resident)."""
+        cold = model not in self.resident
+        self.resident[model] = time.time()
+        if cold and self.s.load_ms:
+            await asyncio.sleep(self.s.load_ms / 1000)
+            return self.s.load_ms / 1000
+        return 0.0
+
+    async def generate(self, model: str, messages: List[Dict[str, Any]], limit: Optional[int]):
+        """Yield (token, load seconds) once a slot is free; pacing follows ttft and tokens/sec."""
+        await self.acquire()
+        try:
+            load_s = await self.load(model)
+            n = self.s.reply_tokens if not limit or limit < 0 else min(limit, self.s.reply_tokens)
+            tokens = reply_tokens(model, messages, n)
+            await asyncio.sleep(self.s.ttft_ms / 1000)
+            gap = 1 / self.s.tokens_per_sec if self.s.tokens_per_sec > 0 else 0
+            for i, tok in enumerate(tokens):
+                if i and gap:
+                    await asyncio.sleep(gap)
+                yield tok, load_s
+            self.stats["completed"] += 1
+        finally:
+            self.release()
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def create_app(settings: MockSettings = None) -> FastAPI:
+    settings = settings or MockSettings.from_env()
+    mock = MockLLM(settings)
+    app = FastAPI(title="Mock LLM (Ollama + OpenAI)")
+    app.state.mock = mock
+
+    # ---------- Ollama ----------
+    def _ollama_refusal(reason: str) -> JSONResponse:
+        if reason == "busy":
+            return JSONResponse({"error": "server busy, please try again.  maximum pending requests exceeded"}, status_code=503)
+        return JSONResponse({"error": "mock: injected failure"}, status_code=settings.error_status)
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [
+            {
+                "name": m, "model": m, "modified_at": "2024-01-01T00:00:00Z", "size": 4_000_000_000,
+                "digest": hashlib.sha256(m.encode()).hexdigest(),
+                "details": {"format": "gguf", "family": m.split(":")[0], "parameter_size": "7B", "quantization_level": "Q4_K_M"},
+            }
+            for m in settings.models
+        ]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": m, "model": m, "size_vram": 4_000_000_000} for m in mock.resident]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model")
+        if model not in settings.models:
+            return JSONResponse({"error": f"model '{model}' not found"}, status_code=404)
+        if body.get("keep_alive") in (0, "0", "0s"):
+            mock.resident.pop(model, None)
+            return {"model": model, "created_at": _now_iso(), "response": "", "done": True, "done_reason": "unload"}
+        if body.get("prompt"):
+            return JSONResponse({"error": "mock: /api/generate only supports load/unload"}, status_code=400)
+        load_s = await mock.load(model)
+        return {"model": model, "created_at": _now_iso(), "response": "", "done": True, "done_reason": "load",
+                "load_duration": int(load_s * 1e9)}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model, messages = body.get("model"), body.get("messages") or []
+        if model not in settings.models:
+            return JSONResponse({"error": f"model '{model}' not found, try pulling it first"}, status_code=404)
+        refusal = mock.admit()
+        if refusal:
+            return _ollama_refusal(refusal)
+        limit = (body.get("options") or {}).get("num_predict")
+        t0 = time.perf_counter()
+
+        def _final(count: int, load_s: float, first_at: float) -> Dict[str, Any]:
+            total = time.perf_counter() - t0
+            return {
+                "model": model, "created_at": _now_iso(), "message": {"role": "assistant", "content": ""},
+                "done": True, "done_reason": "stop",
+                "total_duration": int(total * 1e9), "load_duration": int(load_s * 1e9),
+                "prompt_eval_count": prompt_tokens(messages), "prompt_eval_duration": int(max(0.0, first_at - t0 - load_s) * 1e9),
+                "eval_count": count, "eval_duration": int(max(0.0, time.perf_counter() - first_at) * 1e9),
+            }
+
+        if body.get("stream", True):
+            async def _ndjson():
+                count, load_s, first_at = 0, 0.0, t0
+                async for tok, load_s in mock.generate(model, messages, limit):
+                    if not count:
+                        first_at = time.perf_counter()
+                    count += 1
+                    yield json.dumps({"model": model, "created_at": _now_iso(),
+                                      "message": {"role": "assistant", "content": tok}, "done": False}) + "\n"
+                yield json.dumps(_final(count, load_s, first_at)) + "\n"
+            return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+        parts, load_s, first_at = [], 0.0, t0
+        async for tok, load_s in mock.generate(model, messages, limit):
+            if not parts:
+                first_at = time.perf_counter()
+            parts.append(tok)
+        out = _final(len(parts), load_s, first_at)
+        out["message"]["content"] = "".join(parts)
+        return out
+
+    # ---------- OpenAI ----------
+    def _openai_refusal(reason: str) -> JSONResponse:
+        if reason == "busy":
+            return JSONResponse({"error": {"message": "Rate limit reached (mock concurrency limit)", "type": "requests",
+                                           "code": "rate_limit_exceeded"}}, status_code=429, headers={"retry-after": "1"})
+        return JSONResponse({"error": {"message": "mock: injected failure", "type": "server_error", "code": None}},
+                            status_code=settings.error_status)
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": m, "object": "model", "created": 1700000000, "owned_by": "mock"}
+                                           for m in settings.models]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model, messages = body.get("model"), body.get("messages") or []
+        if model not in settings.models:
+            return JSONResponse({"error": {"message": f"The model `{model}` does not exist", "type": "invalid_request_error",
+                                           "code": "model_not_found"}}, status_code=404)
+        refusal = mock.admit()
+        if refusal:
+            return _openai_refusal(refusal)
+        limit = body.get("max_completion_tokens") or body.get("max_tokens")
+        cid = "chatcmpl-mock-" + hashlib.sha256(json.dumps([model, messages], default=str).encode()).hexdigest()[:16]
+        created = int(time.time())
+        p_tokens = prompt_tokens(messages)
+
+        def _usage(count: int) -> Dict[str, int]:
+            return {"prompt_tokens": p_tokens, "completion_tokens": count, "total_tokens": p_tokens + count}
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+            def _chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+                data = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                return f"data: {json.dumps(data)}\n\n"
+
+            async def _sse():
+                count = 0
+                async for tok, _ in mock.generate(model, messages, limit):
+                    yield _chunk({"role": "assistant", "content": tok} if not count else {"content": tok})
+                    count += 1
+                yield _chunk({}, "stop")
+                if include_usage:
+                    data = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                            "choices": [], "usage": _usage(count)}
+                    yield f"data: {json.dumps(data)}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(_sse(), media_type="text/event-stream")
+
+        parts = [tok async for tok, _ in mock.generate(model, messages, limit)]
+        return {
+            "id": cid, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)}, "finish_reason": "stop"}],
+            "usage": _usage(len(parts)),
+        }
+
+    @app.get("/mock/stats")
+    async def stats():
+        return {**mock.stats, "active": mock.active, "waiting": mock.waiting, "resident": list(mock.resident)}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic mock Ollama + OpenAI server")
+    defaults = MockSettings.from_env()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--models", help="Comma-separated model names served by both protocols")
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms)
+    parser.add_argument("--tokens-per-sec", type=float, default=defaults.tokens_per_sec)
+    parser.add_argument("--reply-tokens", type=int, default=defaults.reply_tokens)
+    parser.add_argument("--load-ms", type=float, default=defaults.load_ms)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-status", type=int, default=defaults.error_status)
+    parser.add_argument("--max-concurrency", type=int, default=defaults.max_concurrency)
+    parser.add_argument("--max-queue", type=int, default=defaults.max_queue)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        models=[m.strip() for m in args.models.split(",")] if args.models else defaults.models,
+        ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec, reply_tokens=args.reply_tokens,
+        load_ms=args.load_ms, error_rate=args.error_rate, error_status=args.error_status,
+        max_concurrency=args.max_concurrency, max_queue=args.max_queue, seed=args.seed,
+    )
+    import uvicorn
+    print(f"Mock LLM on http://{args.host}:{args.port} (Ollama) and http://{args.host}:{args.port}/v1 (OpenAI): "
+          f"{', '.join(settings.models)}", file=sys.stderr)
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()